@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Assets - loading shaders, meshes and textures in the background.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import sys
+import time
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+import meshio
+import shaderutil
+from OpenGL.GL import *
+
+PENDING = "pending"   # Waiting for a worker or being read and decoded.
+DECODED = "decoded"   # Decoded, waiting for its upload on the main thread.
+READY = "ready"
+FAILED = "failed"
+
+class Asset(object):
+    '''
+    A shader, mesh, texture or anything else requested from an AssetManager.
+    decode() runs on a worker thread and must not touch GL, upload() gets the
+    decoded data on the thread of the GL context and returns the value of the
+    asset. nbytes is the size of the decoded data for the upload budget.
+    '''
+    def __init__(self, name, decode, upload=None):
+        self.name = name
+        self.decode = decode
+        self.upload = upload
+        self.state = PENDING
+        self.data = None
+        self.value = None
+        self.error = None
+        self.nbytes = 0
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def __repr__(self):
+        return "<Asset %s %s>" % (self.name, self.state)
+
+def _nbytes(data):
+    '''Size of decoded data, numpy arrays (also inside tuples, lists and Meshes) and strings.'''
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, (tuple, list)):
+        return sum(_nbytes(d) for d in data)
+    if isinstance(data, meshio.Mesh):
+        return data.vertices.nbytes + data.indices.nbytes
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    return 0
+
+def readImage(filename):
+    '''
+    Reads an image into a (height, width, channels) uint8 array, with the
+    first row at the bottom like GL expects it. Binary PPM/PGM files are
+    read directly, everything else needs PIL.
+    '''
+    with open(filename, "rb") as f:
+        magic = f.read(2)
+        if magic in (b"P5", b"P6"):
+            # Header: magic, width, height and maxval, separated by whitespace, comments start with #.
+            fields = []
+            while len(fields) < 3:
+                line = f.readline()
+                fields += line.split(b"#")[0].split()
+            width, height, maxval = [int(v) for v in fields]
+            if maxval > 255:
+                raise ValueError("16 bit images are not supported: %s" % filename)
+            channels = 3 if magic == b"P6" else 1
+            pixels = np.fromfile(f, np.uint8, width * height * channels)
+            return pixels.reshape(height, width, channels)[::-1].copy()
+    from PIL import Image
+    image = np.asarray(Image.open(filename))
+    if image.ndim == 2:
+        image = image[..., None]
+    return image[::-1].copy()
+
+_formats = {1 : (GL_R8, GL_RED), 2 : (GL_RG8, GL_RG), 3 : (GL_RGB8, GL_RGB), 4 : (GL_RGBA8, GL_RGBA)}
+
+def uploadTexture(image):
+    '''Creates a mipmapped 2D texture from a (height, width, channels) uint8 array.'''
+    internalformat, format = _formats[image.shape[2]]
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, 0, internalformat, image.shape[1], image.shape[0], 0,
+                 format, GL_UNSIGNED_BYTE, image)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+    glGenerateMipmap(GL_TEXTURE_2D)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return texture
+
+class MeshBuffers(object):
+    '''The vertex and index buffers of an uploaded Mesh.'''
+    def __init__(self, mesh):
+        self.vbo, self.ibo = glGenBuffers(2)
+        self.nvertices = len(mesh.vertices)
+        self.count = len(mesh.indices)
+        self.indextype = {1 : GL_UNSIGNED_BYTE, 2 : GL_UNSIGNED_SHORT, 4 : GL_UNSIGNED_INT}[mesh.indices.itemsize]
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, mesh.vertices.nbytes, mesh.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        # Without a VAO bound, the index buffer binding would stick to whatever VAO is bound now.
+        glBindBuffer(GL_COPY_WRITE_BUFFER, self.ibo)
+        glBufferData(GL_COPY_WRITE_BUFFER, mesh.indices.nbytes, mesh.indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_COPY_WRITE_BUFFER, 0)
+
+    def delete(self):
+        glDeleteBuffers(2, [self.vbo, self.ibo])
+
+class AssetManager(object):
+    '''
+    Loads assets in the background: files are read and decoded by a pool of
+    worker threads, and the GL uploads are queued for update(), which is called
+    once per frame on the thread of the GL context. An update uploads assets
+    until budget bytes or timebudget seconds are used up, but always at least
+    one, so large assets still make progress. Nothing in update() waits for
+    the workers or the disk.
+
+    The load functions return an Asset right away, its state tells when the
+    value can be used.
+    '''
+    def __init__(self, workers=2, budget=4 << 20, timebudget=0.002, clock=time.time):
+        self.budget = budget
+        self.timebudget = timebudget
+        self.clock = clock
+        self.requests = queue.Queue()
+        self.decoded = queue.Queue()
+        self.assets = {}
+        self.pending = 0
+        # Stats of the last update and of the whole run.
+        self.lastbytes = 0
+        self.lasttime = 0.0
+        self.uploads = 0
+        self.uploaded = 0
+        self.threads = [threading.Thread(target=self._work, name="assets-%d" % i) for i in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        while True:
+            asset = self.requests.get()
+            if asset is None:
+                return
+            try:
+                asset.data = asset.decode()
+                asset.nbytes = _nbytes(asset.data)
+                asset.state = DECODED
+            except Exception as e:
+                asset.error = e
+            self.decoded.put(asset)
+
+    def load(self, name, decode, upload=None):
+        '''
+        Requests an asset, with the decode and upload functions of Asset.
+        Assets are identified by name, requesting one again returns the first.
+        '''
+        asset = self.assets.get(name)
+        if asset is None:
+            asset = self.assets[name] = Asset(name, decode, upload)
+            self.pending += 1
+            self.requests.put(asset)
+        return asset
+
+    def shader(self, fnvert, fnfrag, defines=None, cache=None):
+        '''A shaderutil.Program from two shader files, see shaderutil.createProgram.'''
+        name = ("shader", fnvert, fnfrag, tuple(sorted(defines.items())) if defines else None)
+        return self.load(name, lambda: (shaderutil.readSource(fnvert, defines), shaderutil.readSource(fnfrag, defines)),
+                         lambda sources: shaderutil.linkProgram(sources[0], sources[1], cache))
+
+    def mesh(self, filename, cachedir=None, upload=MeshBuffers):
+        '''
+        MeshBuffers of an OBJ/PLY mesh (see meshio.loadMesh), or whatever
+        upload makes of the Mesh. The cached container is only memory mapped,
+        so the worker reads it into memory, rather than the upload.
+        '''
+        return self.load(("mesh", filename, upload), lambda: meshio.loadMesh(filename, cachedir).resident(), upload)
+
+    def texture(self, filename):
+        '''A mipmapped 2D texture, see readImage.'''
+        return self.load(("texture", filename), lambda: readImage(filename), uploadTexture)
+
+    def update(self):
+        '''Uploads decoded assets within the budget. Returns the assets which became ready (or failed).'''
+        start = self.clock()
+        nbytes = 0
+        done = []
+        while nbytes < self.budget and (not done or self.clock() - start < self.timebudget):
+            try:
+                asset = self.decoded.get_nowait()
+            except queue.Empty:
+                break
+            if asset.error is None:
+                try:
+                    asset.value = asset.upload(asset.data) if asset.upload else asset.data
+                    asset.state = READY
+                except Exception as e:
+                    asset.error = e
+            if asset.error is not None:
+                asset.state = FAILED
+                sys.stderr.write("Unable to load %s: %s\n" % (asset.name, asset.error))
+            asset.data = None
+            nbytes += asset.nbytes
+            self.pending -= 1
+            done.append(asset)
+        self.lastbytes = nbytes
+        self.lasttime = self.clock() - start
+        self.uploads += len(done)
+        self.uploaded += nbytes
+        return done
+
+    def stats(self):
+        return {"pending" : self.pending, "uploads" : self.uploads, "uploaded" : self.uploaded,
+                "lastbytes" : self.lastbytes, "lasttime" : self.lasttime}
+
+    def shutdown(self):
+        '''Stops the workers once the requests queued so far are decoded.'''
+        for thread in self.threads:
+            self.requests.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#  OpenGL 3.2 Core Profile Example - benchmarks of the GL helpers
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import sys
+import ctypes
+import argparse
+import timeit
+import functools
+import subprocess
+import multiprocessing
+import numpy as np
+import headless
+
+# Every benchmark runs on a headless context (see headless.py), so OpenGL and
+# the modules using it are only imported once the backend was selected.
+
+def stream(args):
+    '''Streams particles (position and color) through a StreamBuffer in every mode, and draws them as points.'''
+    import render
+    import shaderutil
+    import streambuffer
+    import uniformblock
+    from OpenGL.GL import (glViewport, glUseProgram, glGenVertexArrays, glBindVertexArray, glEnableVertexAttribArray,
+                           glVertexAttribPointer, glClear, glDrawArrays, glFinish, glBufferStorage,
+                           GL_FLOAT, GL_FALSE, GL_COLOR_BUFFER_BIT, GL_POINTS)
+    framebuffer = headless.Framebuffer(400, 300)
+    glViewport(0, 0, 400, 300)
+    prog = shaderutil.createProgram("./shader.vs", "./shader.fs")
+    glUseProgram(prog)
+    prog.bindBlock("Object", render.OBJECT_BINDING)
+    block = uniformblock.UniformBuffer([("mvp", "mat4")])
+    block.data["mvp"][0] = np.identity(4)
+    block.upload()
+    block.bind(render.OBJECT_BINDING)
+    positionloc, colorloc = prog.attribute("vs_position"), prog.attribute("vs_color")
+    vao = glGenVertexArrays(1)
+    glBindVertexArray(vao)
+    glEnableVertexAttribArray(positionloc)
+    glEnableVertexAttribArray(colorloc)
+    # A few different particle sets, so every frame uploads fresh data.
+    particles = np.random.uniform(-1, 1, (4, args.count, 8)).astype(np.float32)
+    particles[..., 3] = 1
+    modes = [streambuffer.PERSISTENT, streambuffer.MAP, streambuffer.ORPHAN]
+    if not bool(glBufferStorage):
+        modes.remove(streambuffer.PERSISTENT)
+    print "%-11s %12s %10s %10s %8s" % ("mode", "MB/frame", "MB/s", "ms/frame", "waits")
+    for mode in modes:
+        buf = streambuffer.StreamBuffer(particles[0].nbytes * 3, frames=3, mode=mode)
+        t = timeit.default_timer()
+        for frame in range(args.frames):
+            buf.beginFrame()
+            offset = buf.write(particles[frame % len(particles)])
+            glVertexAttribPointer(positionloc, 4, GL_FLOAT, GL_FALSE, 8 * 4, ctypes.c_void_p(offset))
+            glVertexAttribPointer(colorloc, 4, GL_FLOAT, GL_FALSE, 8 * 4, ctypes.c_void_p(offset + 16))
+            glClear(GL_COLOR_BUFFER_BIT)
+            glDrawArrays(GL_POINTS, 0, args.count)
+            buf.endFrame()
+        glFinish()
+        elapsed = timeit.default_timer() - t
+        print "%-11s %12.2f %10.1f %10.3f %8d" % (mode, buf.lastframe / 1e6, buf.total / 1e6 / elapsed,
+                                                  elapsed / args.frames * 1000, buf.waits)
+        buf.delete()
+
+def uniforms(args):
+    '''Per object matrices: glUniformMatrix4fv per object against one uniform buffer and glBindBufferRange.'''
+    import hommat as hm
+    import render
+    import shaderutil
+    import uniformblock
+    from OpenGL.GL import (glViewport, glUseProgram, glGenVertexArrays, glBindVertexArray, glDrawArrays, glFinish,
+                           glUniformMatrix4fv, glBindBufferRange, GL_POINTS, GL_TRUE, GL_UNIFORM_BUFFER)
+    framebuffer = headless.Framebuffer(400, 300)
+    glViewport(0, 0, 400, 300)
+    glBindVertexArray(glGenVertexArrays(1))
+    # The old uniform and the block in shader.vs, without any vertex data (every object is one point at the origin).
+    uniformvs = "#version 150\nuniform mat4 mvp;\nout vec4 fs_color;\n" \
+                "void main() { fs_color = vec4(1); gl_Position = mvp * vec4(0, 0, 0, 1); }\n"
+    fragsrc = shaderutil.readSource("./shader.fs")
+    uniformprog = shaderutil.linkProgram(uniformvs, fragsrc)
+    blockprog = shaderutil.linkProgram(shaderutil.readSource("./shader.vs"), fragsrc)
+    blockprog.bindBlock("Object", render.OBJECT_BINDING)
+    base = hm.translations(hm.identity(), np.random.uniform(-1, 1, (args.count, 3)))
+    angles = np.linspace(0, 360, args.count)
+    models = np.empty((args.count, 4, 4), dtype=np.float32)
+    block = uniformblock.UniformBuffer([("mvp", "mat4")], args.count)
+    loc = uniformprog.uniform("mvp")
+
+    def old(frame):
+        # What main.py did per object: a nested list, transposed by GL.
+        glUseProgram(uniformprog)
+        hm.rotations(base, angles + frame, render.yaxis, out=models)
+        for i in range(args.count):
+            glUniformMatrix4fv(loc, 1, GL_TRUE, models[i].tolist())
+            glDrawArrays(GL_POINTS, 0, 1)
+
+    def program(frame):
+        glUseProgram(uniformprog)
+        hm.rotations(base, angles + frame, render.yaxis, out=models)
+        for i in range(args.count):
+            uniformprog.set("mvp", models[i])
+            glDrawArrays(GL_POINTS, 0, 1)
+
+    def ubo(frame):
+        glUseProgram(blockprog)
+        hm.rotations(base, angles + frame, render.yaxis, out=block.data["mvp"])
+        block.upload()
+        buffer, stride, size = block.buffer, block.stride, block.size
+        for i in range(args.count):
+            glBindBufferRange(GL_UNIFORM_BUFFER, render.OBJECT_BINDING, buffer, i * stride, size)
+            glDrawArrays(GL_POINTS, 0, 1)
+
+    print "%-22s %10s %12s" % ("objects: %d" % args.count, "ms/frame", "us/object")
+    for name, frame in [("uniform, tolist", old), ("uniform, Program.set", program), ("uniform buffer", ubo)]:
+        t = timeit.default_timer()
+        for i in range(args.frames):
+            frame(i)
+        glFinish()
+        elapsed = (timeit.default_timer() - t) / args.frames
+        print "%-22s %10.3f %12.2f" % (name, elapsed * 1000, elapsed / args.count * 1e6)
+    block.delete()
+
+def dispatch(args):
+    '''Calls per second of the hot GL entry points in each gldispatch mode.'''
+    import gldispatch
+    import render
+    import shaderutil
+    import uniformblock
+    from OpenGL.GL import glGenVertexArrays, GL_COLOR_BUFFER_BIT, GL_POINTS, GL_UNIFORM_BUFFER, GL_TRUE
+    framebuffer = headless.Framebuffer(1, 1) # Keeps glClear cheap.
+    prog = shaderutil.createProgram("./shader.vs", "./shader.fs")
+    block = uniformblock.UniformBuffer([("mvp", "mat4")])
+    vao = int(glGenVertexArrays(1))
+    matrix = np.identity(4, dtype=np.float32)
+    calls = [("glClear", (GL_COLOR_BUFFER_BIT,)),
+             ("glUseProgram", (prog,)),
+             ("glBindVertexArray", (vao,)),
+             ("glBindBufferRange", (GL_UNIFORM_BUFFER, render.OBJECT_BINDING) + block.range()),
+             ("glUniformMatrix4fv", (-1, 1, GL_TRUE, matrix)),
+             ("glDrawArrays", (GL_POINTS, 0, 0))]
+    print "%-20s" % "calls/s" + "".join("%12s" % mode for mode in gldispatch.MODES)
+    dispatches = [gldispatch.Dispatch(mode, log=lambda message: None) for mode in gldispatch.MODES]
+    for name, arguments in calls:
+        line = "%-20s" % name
+        for gl in dispatches:
+            function, a = getattr(gl, name), arguments
+            if gl.mode == gldispatch.RELEASE:
+                # Release mode takes C arguments, the matrix as an address.
+                a = tuple(v.ctypes.data if isinstance(v, np.ndarray) else v for v in arguments)
+            elapsed = min(timeit.repeat(lambda: function(*a), number=args.calls, repeat=3))
+            line += "%12.0f" % (args.calls / elapsed)
+        print line
+    for gl in dispatches:
+        gl.delete()
+    block.delete()
+
+def imports(args):
+    '''Cold start: imports modules in fresh interpreters and reports the median import time.'''
+    # Python 2 has no -X importtime, so the child times the import itself.
+    child = "import timeit\nt = timeit.default_timer()\n%s\nprint timeit.default_timer() - t"
+    cases = [("glfw", "import glfw"),
+             ("glfw + first call", "import glfw\ntry: glfw.glfwGetTime()\nexcept RuntimeError: pass"),
+             ("OpenGL.GL", "import OpenGL.GL"),
+             ("glfw + OpenGL.GL", "import glfw\nimport OpenGL.GL"),
+             ("render", "import render")]
+    print "%-20s %10s %10s" % ("import", "median ms", "min ms")
+    for name, statement in cases:
+        times = []
+        for run in range(args.runs):
+            out = subprocess.check_output([sys.executable, "-c", child % statement])
+            times.append(float(out.split()[-1]) * 1000)
+        print "%-20s %10.2f %10.2f" % (name, np.median(times), min(times))
+
+def glfwcalls(args):
+    '''Per-call overhead of the GLFW binding, untyped ctypes calls against the typed prototypes and wrappers.'''
+    import glfw
+    # Taken before glfwInit, like a "from glfw import *" at the top of a script.
+    proxies = glfw.glfwGetTime, glfw.glfwGetWindowParam, glfw.glfwSwapInterval
+    if not glfw.glfwInit():
+        print >> sys.stderr, "Unable to initialize GLFW."
+        sys.exit(-1)
+    # A second handle to the library has its own, untyped function objects, like the binding used to.
+    untyped = ctypes.CDLL(glfw._dll()._name)
+    typed, = glfw.resolve("glfwGetTime")
+    def getmousepos():
+        x, y = ctypes.c_int(0), ctypes.c_int(0)
+        untyped.glfwGetMousePos(ctypes.byref(x), ctypes.byref(y))
+        return x.value, y.value
+    cases = [("glfwGetTime untyped", untyped.glfwGetTime),
+             ("glfwGetTime typed", typed),
+             ("glfwGetTime proxy", proxies[0]),
+             ("glfwGetWindowParam untyped", functools.partial(untyped.glfwGetWindowParam, glfw.GLFW_OPENED)),
+             ("glfwGetWindowParam typed", functools.partial(glfw.glfwGetWindowParam, glfw.GLFW_OPENED)),
+             ("glfwGetWindowParam proxy", functools.partial(proxies[1], glfw.GLFW_OPENED)),
+             ("glfwSwapInterval typed", functools.partial(glfw.glfwSwapInterval, 0)),
+             ("glfwSwapInterval proxy", functools.partial(proxies[2], 0)),
+             ("glfwGetMousePos allocating", getmousepos),
+             ("glfwGetMousePos binding", glfw.glfwGetMousePos),
+             ("glfwGetWindowSize binding", glfw.glfwGetWindowSize)]
+    print "%-28s %10s" % ("call", "ns/call")
+    for name, function in cases:
+        elapsed = min(timeit.repeat(function, number=args.calls, repeat=5))
+        print "%-28s %10.0f" % (name, elapsed / args.calls * 1e9)
+    # The untyped glfwGetTime returns the low bits of the double as an int.
+    print "glfwGetTime: untyped %r, typed %r" % (untyped.glfwGetTime(), glfw.glfwGetTime())
+    glfw.glfwTerminate()
+
+def farm(args):
+    '''Views per second of a renderfarm.RenderFarm with 1 up to --workers processes.'''
+    import renderfarm
+    views = renderfarm.orbit(args.views)
+    print "%-8s %10s %10s %8s" % ("workers", "views/s", "speedup", "busy")
+    base = None
+    for workers in range(1, (args.workers or multiprocessing.cpu_count()) + 1):
+        pool = renderfarm.RenderFarm(args.width, args.height, workers, args.backend, cache="")
+        for index, pixels in pool.render(views):
+            pass
+        pool.close()
+        stats = pool.stats()
+        base = base or stats["rate"]
+        print "%-8d %10.1f %10.2f %7.0f%%" % (workers, stats["rate"], stats["rate"] / base, stats["busy"] * 100)
+
+def scene(args):
+    '''Time of a SceneGraph.update() after changing a few nodes of a large graph, against a full update.'''
+    import scenegraph
+    import quat
+    # A tree with 8 children per node, the leaves make up most of it.
+    graph = scenegraph.SceneGraph(args.nodes)
+    nodes = np.arange(args.nodes)
+    graph.addMany((nodes - 1) // 8, np.random.uniform(-1, 1, (args.nodes, 3)))
+    graph.update()
+    print "%d nodes in %d levels" % (graph.count, graph.level.max() + 1)
+    print "%-24s %10s %10s" % ("changed", "updated", "ms")
+    spin = quat.fromaxisangle(1, (0, 1, 0))
+    cases = [("%d leaves" % args.changed, np.random.choice(nodes[nodes * 8 + 1 >= args.nodes], args.changed, replace=False)),
+             ("%d inner nodes" % args.changed, np.random.choice(nodes[nodes * 8 + 1 < args.nodes], args.changed, replace=False)),
+             ("the root", np.array([0]))]
+    for name, changed in cases:
+        def step():
+            graph.setRotation(changed, spin)
+            graph.update()
+        elapsed = min(timeit.repeat(step, number=10, repeat=5)) / 10
+        print "%-24s %10d %10.3f" % (name, graph.updated, elapsed * 1000)
+
+def picks(args):
+    '''Picking on a sphere of --triangles triangles: building the BVH, casting rays from the pixels and refitting.'''
+    import picking
+    import hommat as hm
+    # A latitude/longitude grid with two triangles per cell.
+    rows = int(np.sqrt(args.triangles / 4.0))
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, rows + 1), np.linspace(0, 2 * np.pi, 2 * rows + 1), indexing="ij")
+    positions = np.stack([np.sin(theta) * np.cos(phi), np.cos(theta), np.sin(theta) * np.sin(phi)], axis=-1).reshape(-1, 3)
+    grid = np.arange(len(positions)).reshape(rows + 1, 2 * rows + 1)
+    a, b, c, d = grid[:-1, :-1].ravel(), grid[:-1, 1:].ravel(), grid[1:, :-1].ravel(), grid[1:, 1:].ravel()
+    indices = np.concatenate([np.stack([a, c, b], axis=1), np.stack([b, c, d], axis=1)]).ravel()
+    t = timeit.default_timer()
+    bvh = picking.BVH(positions, indices)
+    print "%d triangles, BVH built in %.0f ms" % (bvh.count, (timeit.default_timer() - t) * 1000)
+    mvp = np.dot(hm.perspective(hm.identity(), 70, 4.0 / 3, 0.1, 10.0), hm.lookat(hm.identity(), (2.5, 1.5, 2.5), (0, 0, 0)))
+    times, hits = [], 0
+    for y in range(0, 300, 15):
+        for x in range(0, 400, 15):
+            t = timeit.default_timer()
+            hits += picking.pick(bvh, x, y, 400, 300, mvp) is not None
+            times.append(timeit.default_timer() - t)
+    times = np.array(times) * 1000
+    print "%d picks, %d hits: mean %.3f ms, p99 %.3f ms" % (len(times), hits, times.mean(), np.percentile(times, 99))
+    t = timeit.default_timer()
+    bvh.refit(positions * 1.01)
+    print "full refit %.1f ms" % ((timeit.default_timer() - t) * 1000)
+    # Moves the corners of the first 100 triangles, in the BVH's copy of the positions.
+    bvh.positions[indices[:300]] *= 1.02
+    t = timeit.default_timer()
+    nodes = bvh.refit(triangles=np.arange(100))
+    print "refit of 100 triangles: %d nodes in %.3f ms" % (nodes, (timeit.default_timer() - t) * 1000)
+
+def loading(args):
+    '''The longest frame while loading textures and meshes, synchronously and with an AssetManager.'''
+    import shutil
+    import tempfile
+    import time
+    import assets
+    import meshio
+    from OpenGL.GL import glFinish
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i in range(args.count):
+            filename = "%s/texture%d.ppm" % (directory, i)
+            headless.writePPM(filename, np.random.randint(0, 256, (1024, 1024, 3)).astype(np.uint8))
+            filenames.append(("texture", filename))
+            # 256k vertices in the binary mesh format.
+            filename = "%s/mesh%d.glfwmesh" % (directory, i)
+            vertices = np.random.uniform(-1, 1, (512 * 512, 8)).astype(np.float32)
+            meshio.save(filename, meshio.Mesh(vertices, np.arange(len(vertices), dtype=np.uint32)))
+            filenames.append(("mesh", filename))
+        t = time.time()
+        for kind, filename in filenames:
+            if kind == "texture":
+                assets.uploadTexture(assets.readImage(filename))
+            else:
+                assets.MeshBuffers(meshio.load(filename))
+        glFinish()
+        print "synchronous: one frame of %.1f ms" % ((time.time() - t) * 1000)
+        manager = assets.AssetManager(budget=args.budget << 20)
+        t = time.time()
+        for kind, filename in filenames:
+            if kind == "texture":
+                manager.texture(filename)
+            else:
+                manager.load(filename, lambda filename=filename: meshio.load(filename), assets.MeshBuffers)
+        frames, longest = 0, 0.0
+        while manager.pending:
+            frame = time.time()
+            manager.update()
+            glFinish()
+            longest = max(longest, time.time() - frame)
+            frames += 1
+            time.sleep(0.005) # The rest of the frame.
+        print "manager: %d frames, longest %.1f ms, all ready after %.1f ms" % (frames, longest * 1000,
+                                                                              (time.time() - t) * 1000)
+        manager.shutdown()
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the GL helpers on a headless context.")
+    parser.add_argument("--backend", choices=headless.BACKENDS, default="egl")
+    parser.add_argument("--frames", type=int, default=500)
+    subparsers = parser.add_subparsers()
+    p = subparsers.add_parser("stream", help=stream.__doc__)
+    p.add_argument("--count", type=int, default=20000, help="particles per frame")
+    p.set_defaults(run=stream, context=True)
+    p = subparsers.add_parser("dispatch", help=dispatch.__doc__)
+    p.add_argument("--calls", type=int, default=20000, help="calls per measurement")
+    p.set_defaults(run=dispatch, context=True)
+    p = subparsers.add_parser("imports", help=imports.__doc__)
+    p.add_argument("--runs", type=int, default=20, help="fresh interpreters per import")
+    p.set_defaults(run=imports, context=False)
+    p = subparsers.add_parser("uniforms", help=uniforms.__doc__)
+    p.add_argument("--count", type=int, default=2000, help="objects per frame")
+    p.set_defaults(run=uniforms, context=True)
+    p = subparsers.add_parser("assets", help=loading.__doc__)
+    p.add_argument("--count", type=int, default=8, help="textures and meshes each")
+    p.add_argument("--budget", type=int, default=4, help="upload budget per frame in MB")
+    p.set_defaults(run=loading, context=True)
+    p = subparsers.add_parser("glfw", help=glfwcalls.__doc__)
+    p.add_argument("--calls", type=int, default=100000, help="calls per measurement")
+    p.set_defaults(run=glfwcalls, context=False)
+    p = subparsers.add_parser("scene", help=scene.__doc__)
+    p.add_argument("--nodes", type=int, default=100000)
+    p.add_argument("--changed", type=int, default=10, help="nodes changed per update")
+    p.set_defaults(run=scene, context=False)
+    p = subparsers.add_parser("pick", help=picks.__doc__)
+    p.add_argument("--triangles", type=int, default=1000000)
+    p.set_defaults(run=picks, context=False)
+    p = subparsers.add_parser("farm", help=farm.__doc__)
+    p.add_argument("--views", type=int, default=500, help="views per measurement")
+    p.add_argument("--workers", type=int, default=0, help="most worker processes, 0 for one per CPU core")
+    p.add_argument("--width", type=int, default=400)
+    p.add_argument("--height", type=int, default=300)
+    # The workers need to be forked before this process has a context.
+    p.set_defaults(run=farm, context=False)
+    args = parser.parse_args()
+    if args.context:
+        context = headless.createContext(args.backend)
+        args.run(args)
+        context.destroy()
+    else:
+        args.run(args)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Capture - asynchronous readback of rendered frames to disk.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import os
+import sys
+import zlib
+import time
+import struct
+import ctypes
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+from OpenGL.GL import *
+
+RAW = "raw"
+PPM = "ppm"
+PNG = "png"
+
+def _rows(pixels):
+    '''The rows of a frame read with glReadPixels from top to bottom, as views.'''
+    return pixels[::-1]
+
+def writeRaw(f, pixels):
+    for row in _rows(pixels):
+        f.write(row.data)
+
+def writePPM(filename, pixels):
+    with open(filename, "wb") as f:
+        f.write(("P6 %d %d 255\n" % (pixels.shape[1], pixels.shape[0])).encode("ascii"))
+        writeRaw(f, pixels)
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+def writePNG(filename, pixels, level=1):
+    '''An RGB PNG, with only the zlib module. Every row gets filter type 0 (none).'''
+    height, width = pixels.shape[:2]
+    scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = _rows(pixels).reshape(height, -1)
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), level)))
+        f.write(_chunk(b"IEND", b""))
+
+class Capture(object):
+    '''
+    Captures the rendered frames to disk, without stalling the pipeline.
+    capture() issues a glReadPixels of the current read framebuffer into
+    the next pixel buffer object of a ring, and sets a fence behind it.
+    poll() (also called by capture()) maps the buffers whose fence has
+    signaled, usually one or two frames later, and hands them as numpy views
+    of the mapped memory to a writer thread, which writes them without
+    copying. When the writer is done, the buffer is unmapped in the next
+    poll() and can be used again. If no buffer is free, because the writer
+    can't keep up, capture() waits for the oldest one by default, so every
+    frame gets written (for offline rendering). With block=False, for
+    interactive use, the frame is dropped and counted instead.
+
+    The format follows the filename: "frames/%05d.ppm" or ".png" write one
+    file per frame (numbered by the capture() calls), anything else (like
+    "video.rgb") one raw stream of RGB frames, which ffmpeg reads with
+    -f rawvideo -pix_fmt rgb24 -s WIDTHxHEIGHT. Since frames may be missing
+    from it with block=False, every frame of the raw stream is then preceded
+    by its number as a little endian uint32.
+    '''
+    def __init__(self, filename, width, height, buffers=3, block=True, clock=time.time):
+        extension = os.path.splitext(filename)[1].lower()
+        self.format = {".ppm" : PPM, ".png" : PNG}.get(extension, RAW)
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.size = width * height * 3
+        self.block = block
+        self.clock = clock
+        self.buffers = [int(b) for b in np.atleast_1d(glGenBuffers(buffers))]
+        for buffer in self.buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.size, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free = list(range(buffers))
+        self.reading = [] # (buffer index, frame, fence, capture time), oldest first.
+        self.released = queue.Queue()
+        self.frames = queue.Queue()
+        self.frame = 0
+        # Stats
+        self.captured = 0
+        self.mapped = 0
+        self.dropped = 0
+        self.stalls = 0      # Captures that had to wait for a free buffer.
+        self.written = 0
+        self.bytes = 0
+        self.latency = 0     # Sum of the frames between readback and map.
+        self.latencytime = 0.0
+        self.cost = 0.0      # Time spent in capture() and poll() on the GL thread.
+        self.writetime = 0.0 # Time the writer spent writing.
+        self.error = None
+        if self.format != RAW:
+            directory = os.path.dirname(filename % 0)
+        else:
+            directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.stream = open(filename, "wb") if self.format == RAW else None
+        self.writer = threading.Thread(target=self._write, name="capture")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def capture(self):
+        '''Reads back the current frame. Call after drawing, before swapping. Returns False if it was dropped.'''
+        start = self.clock()
+        self.poll()
+        frame = self.frame
+        self.frame += 1
+        if not self.free and self.block:
+            self.stalls += 1
+            while not self.free:
+                self.poll(wait=True)
+                if not self.free:
+                    # Everything is with the writer, wait for it to finish one.
+                    self._unmap(self.released.get())
+        if not self.free:
+            self.dropped += 1
+            self.cost += self.clock() - start
+            return False
+        i = self.free.pop(0)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.buffers[i])
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.reading.append((i, frame, glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0), start))
+        self.captured += 1
+        self.cost += self.clock() - start
+        return True
+
+    def poll(self, wait=False):
+        '''Unmaps the buffers the writer is done with and hands over the finished readbacks, in order.'''
+        start = self.clock()
+        while True:
+            try:
+                i = self.released.get_nowait()
+            except queue.Empty:
+                break
+            self._unmap(i)
+        while self.reading:
+            i, frame, fence, captured = self.reading[0]
+            timeout = 1000000 if wait else 0
+            result = glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, timeout)
+            if result == GL_TIMEOUT_EXPIRED:
+                if wait:
+                    continue
+                break
+            glDeleteSync(fence)
+            self.reading.pop(0)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, self.buffers[i])
+            address = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.size, GL_MAP_READ_BIT)
+            pixels = np.frombuffer((ctypes.c_ubyte * self.size).from_address(address), dtype=np.uint8)
+            # The frame count was already advanced past the captured frame, so this is 1 for the next frame.
+            self.latency += self.frame - frame
+            self.latencytime += start - captured
+            self.mapped += 1
+            self.frames.put((i, frame, pixels.reshape(self.height, self.width, 3)))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.cost += self.clock() - start
+
+    def _unmap(self, i):
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.buffers[i])
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free.append(i)
+
+    def _write(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            i, frame, pixels = item
+            start = time.time()
+            try:
+                if self.format == PPM:
+                    writePPM(self.filename % frame, pixels)
+                elif self.format == PNG:
+                    writePNG(self.filename % frame, pixels)
+                else:
+                    if not self.block:
+                        self.stream.write(struct.pack("<I", frame))
+                    writeRaw(self.stream, pixels)
+                self.written += 1
+                self.bytes += pixels.nbytes
+            except (IOError, OSError) as e:
+                if self.error is None:
+                    self.error = e
+                    sys.stderr.write("Unable to write captured frames: %s\n" % e)
+            self.writetime += time.time() - start
+            # The view must not be used after this, the buffer gets unmapped.
+            del pixels, item
+            self.released.put(i)
+
+    def finish(self):
+        '''Waits until every captured frame is written, and frees the buffers.'''
+        while self.reading:
+            self.poll(wait=True)
+        self.frames.put(None)
+        self.writer.join()
+        self.poll()
+        if self.stream is not None:
+            self.stream.close()
+        glDeleteBuffers(len(self.buffers), self.buffers)
+
+    def stats(self):
+        '''Counts, the mean readback latency in frames and ms, the GL thread cost per frame and the writer throughput.'''
+        mapped = max(self.mapped, 1)
+        return {"captured" : self.captured, "dropped" : self.dropped, "stalls" : self.stalls, "written" : self.written,
+                "latency" : float(self.latency) / mapped, "latencyms" : self.latencytime / mapped * 1000,
+                "cost" : self.cost / max(self.frame, 1) * 1000,
+                "throughput" : self.bytes / max(self.writetime, 1e-9) / 1e6}
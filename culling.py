@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Culling - vectorized view frustum culling.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import numpy as np
+
+def frustumplanes(m):
+    '''
+    Extracts the six frustum planes (left, right, bottom, top, near, far) from a
+    projection (or projection * modelview) matrix as built by hommat. Returns a
+    (6,4) array of normalized planes (nx, ny, nz, d), pointing inwards.
+    '''
+    m = np.asarray(m, dtype=np.float64)
+    planes = np.empty((6, 4), dtype=np.float64)
+    planes[0] = m[3] + m[0]
+    planes[1] = m[3] - m[0]
+    planes[2] = m[3] + m[1]
+    planes[3] = m[3] - m[1]
+    planes[4] = m[3] + m[2]
+    planes[5] = m[3] - m[2]
+    planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+    return planes.astype(np.float32)
+
+def _visible(dist, slack):
+    '''Indices of the rows of dist (N,6) that are on the inside of all planes.'''
+    dist += slack
+    return np.flatnonzero(dist.min(axis=1) >= 0)
+
+def spheres(planes, centers, radii):
+    '''
+    Tests bounding spheres with centers (N,3+) and radii (N,) (or a single
+    radius) against the planes. Returns the indices of the visible ones.
+    '''
+    centers = np.asarray(centers, dtype=np.float32)[:, :3]
+    dist = np.dot(centers, planes[:, :3].T)
+    dist += planes[:, 3]
+    return _visible(dist, np.asarray(radii, dtype=np.float32).reshape(-1, 1))
+
+def boxes(planes, mins, maxs):
+    '''
+    Tests axis aligned bounding boxes given by their corners mins/maxs (N,3+)
+    against the planes. Returns the indices of the visible ones. Like all
+    plane tests, boxes near frustum corners may be reported visible.
+    '''
+    mins = np.asarray(mins, dtype=np.float32)[:, :3]
+    maxs = np.asarray(maxs, dtype=np.float32)[:, :3]
+    centers = (mins + maxs) * 0.5
+    extents = maxs - centers
+    dist = np.dot(centers, planes[:, :3].T)
+    dist += planes[:, 3]
+    # Projected half size of each box onto each plane normal.
+    return _visible(dist, np.dot(extents, np.abs(planes[:, :3]).T))
+
+if __name__ == "__main__":
+    # Benchmark the culling throughput for a growing number of objects.
+    import time
+    import hommat as hm
+    mvp = np.dot(hm.perspective(hm.identity(), 70, 4.0 / 3, 0.1, 100.0),
+                 hm.lookat(hm.identity(), (0, 0, 0), (0, 0, -1)))
+    planes = frustumplanes(mvp)
+    rng = np.random.RandomState(0)
+    print "%10s %14s %14s %10s" % ("objects", "spheres [M/s]", "boxes [M/s]", "visible")
+    for n in (10 ** 4, 10 ** 5, 10 ** 6):
+        centers = rng.uniform(-100, 100, (n, 3)).astype(np.float32)
+        radii = rng.uniform(0.1, 2, n).astype(np.float32)
+        rates = []
+        for test, args in ((spheres, (centers, radii)), (boxes, (centers - radii[:, None], centers + radii[:, None]))):
+            best = float("inf")
+            for i in range(5):
+                t = time.time()
+                visible = test(planes, *args)
+                best = min(best, time.time() - t)
+            rates.append(n / best / 1e6)
+        print "%10d %14.1f %14.1f %10d" % (n, rates[0], rates[1], len(visible))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Drawqueue - state sorted draw submission.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import ctypes
+import numpy as np
+import gldispatch
+from OpenGL.GL import *
+
+class GLState(object):
+    '''
+    A shadow copy of the GL binding state, so redundant binds can be skipped.
+    Counts the binds issued and skipped. Call invalidate() after anything
+    else changed the bindings behind its back. The binds go through the
+    gldispatch.Dispatch gl (the default one if not given).
+    '''
+    def __init__(self, gl=None):
+        self.gl = gl or gldispatch.default()
+        self.issued = 0
+        self.skipped = 0
+        self.invalidate()
+
+    def invalidate(self):
+        self.program = None
+        self.vao = None
+        self.unit = None
+        self.textures = {}
+        self.ranges = {}
+
+    def useProgram(self, prog):
+        if prog == self.program:
+            self.skipped += 1
+            return
+        self.gl.glUseProgram(prog)
+        self.program = prog
+        self.issued += 1
+
+    def bindVertexArray(self, vao):
+        if vao == self.vao:
+            self.skipped += 1
+            return
+        self.gl.glBindVertexArray(vao)
+        self.vao = vao
+        self.issued += 1
+
+    def bindTexture(self, unit, target, texture):
+        if self.textures.get(unit) == (target, texture):
+            self.skipped += 1
+            return
+        if unit != self.unit:
+            self.gl.glActiveTexture(GL_TEXTURE0 + unit)
+            self.unit = unit
+        self.gl.glBindTexture(target, texture)
+        self.textures[unit] = (target, texture)
+        self.issued += 1
+
+    def bindBufferRange(self, binding, buffer, offset, size):
+        '''Binds a range of a uniform buffer to a binding point.'''
+        if self.ranges.get(binding) == (buffer, offset, size):
+            self.skipped += 1
+            return
+        self.gl.glBindBufferRange(GL_UNIFORM_BUFFER, binding, buffer, offset, size)
+        self.ranges[binding] = (buffer, offset, size)
+        self.issued += 1
+
+class DrawItem(object):
+    '''
+    Everything needed for one draw call. textures is a sequence of (unit,
+    target, texture) and uniforms a dict of name -> value, set through the
+    shaderutil.Program (which skips unchanged values). blocks is a sequence
+    of (binding, buffer, offset, size) uniform buffer ranges, e.g. binding
+    and UniformBuffer.range(). Without an indextype
+    the item is drawn with glDrawArrays, else first is a byte offset into the
+    index buffer. With instances > 0 it is drawn instanced. Items
+    can be kept and submitted again every frame, with updated uniforms.
+    '''
+    def __init__(self, program, vao, mode, count, first=0, indextype=None, textures=(), uniforms=None,
+                 instances=0, depth=0, blocks=()):
+        self.program = program
+        self.vao = vao
+        self.mode = mode
+        self.count = count
+        self.first = first
+        self.indextype = indextype
+        self.textures = tuple(textures)
+        self.uniforms = uniforms or {}
+        self.instances = instances
+        self.depth = depth
+        self.blocks = tuple(blocks)
+
+class DrawQueue(object):
+    '''
+    Collects DrawItems and issues them sorted by a packed 64 bit key of
+    program (16 bit), VAO (16 bit), textures (16 bit) and depth (16 bit), so
+    items sharing state are drawn back to back, and redundant binds are
+    dropped through the GLState shadow. The draw calls use its Dispatch.
+    '''
+    def __init__(self, state=None):
+        self.state = state or GLState()
+        self.items = []
+        self._ids = {}
+        self.drawcalls = 0
+
+    def _id(self, kind, name):
+        '''A small, stable number for a GL object (or tuple of them), for packing it into a key.'''
+        key = (kind, name)
+        i = self._ids.get(key)
+        if i is None:
+            i = self._ids[key] = len(self._ids) & 0xffff
+        return i
+
+    def key(self, item):
+        depth = min(max(int(item.depth), 0), 0xffff)
+        return ((self._id(0, int(item.program)) << 48) | (self._id(1, int(item.vao)) << 32) |
+                (self._id(2, item.textures) << 16) | depth)
+
+    def submit(self, item):
+        self.items.append(item)
+
+    def flush(self):
+        '''Sorts and draws all submitted items, and empties the queue.'''
+        items = self.items
+        if len(items) > 1:
+            keys = np.fromiter((self.key(item) for item in items), dtype=np.uint64, count=len(items))
+            items = [items[i] for i in np.argsort(keys, kind="mergesort")]
+        state = self.state
+        gl = state.gl
+        for item in items:
+            state.useProgram(item.program)
+            state.bindVertexArray(item.vao)
+            for unit, target, texture in item.textures:
+                state.bindTexture(unit, target, texture)
+            for binding, buffer, offset, size in item.blocks:
+                state.bindBufferRange(binding, buffer, offset, size)
+            for name, value in item.uniforms.items():
+                item.program.set(name, value)
+            if item.indextype is None:
+                if item.instances:
+                    gl.glDrawArraysInstanced(item.mode, item.first, item.count, item.instances)
+                else:
+                    gl.glDrawArrays(item.mode, item.first, item.count)
+            elif item.instances:
+                gl.glDrawElementsInstanced(item.mode, item.count, item.indextype,
+                                           ctypes.c_void_p(item.first), item.instances)
+            else:
+                gl.glDrawElements(item.mode, item.count, item.indextype, ctypes.c_void_p(item.first))
+            self.drawcalls += 1
+        self.items = []
+
+    def stats(self):
+        return {"drawcalls" : self.drawcalls, "binds" : self.state.issued, "skipped" : self.state.skipped}
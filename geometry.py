@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Geometry - vertex welding and vertex cache optimization.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+from collections import deque
+import numpy as np
+
+def stripTriangles(count, first=0):
+    '''Triangle list indices for a triangle strip of count vertices, keeping the winding.'''
+    i = np.arange(count - 2)
+    triangles = np.stack([i, i + 1, i + 2], axis=1) + first
+    # Every other triangle of a strip is wound the other way around.
+    triangles[1::2, :2] = triangles[1::2, 1::-1]
+    return triangles.ravel()
+
+def indexType(nvertices):
+    '''The smallest index type (uint16 where possible) for nvertices.'''
+    return np.uint16 if nvertices <= 65536 else np.uint32
+
+def weld(vertices, indices=None, tolerance=0):
+    '''
+    Merges duplicate vertices (rows of vertices that are equal, or within
+    tolerance) and rewrites indices (by default every vertex in order) to
+    the merged ones. Degenerate triangles are removed. Returns the vertices
+    and the triangle indices.
+    '''
+    vertices = np.ascontiguousarray(vertices)
+    if indices is None:
+        indices = np.arange(len(vertices))
+    keys = vertices if not tolerance else np.round(vertices / tolerance)
+    # Viewing every row as one opaque item makes unique() hash/sort whole vertices at once.
+    rows = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    triangles = inverse.ravel()[np.asarray(indices)].reshape(-1, 3)
+    valid = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+             (triangles[:, 0] != triangles[:, 2]))
+    triangles = triangles[valid]
+    return vertices[first], triangles.ravel().astype(indexType(len(first)))
+
+def acmr(indices, cachesize=16):
+    '''The average cache miss ratio (misses per triangle) of a FIFO post-transform cache.'''
+    cache = deque()
+    cached = set()
+    misses = 0
+    for v in np.asarray(indices).tolist():
+        if v not in cached:
+            misses += 1
+            cache.append(v)
+            cached.add(v)
+            if len(cache) > cachesize:
+                cached.discard(cache.popleft())
+    return misses / max(len(indices) / 3.0, 1.0)
+
+def tipsify(indices, nvertices, cachesize=16):
+    '''
+    Reorders triangles for the post-transform vertex cache, using Tipsify
+    (Sander, Nehab and Barczak: Fast Triangle Reordering for Vertex Locality
+    and Reduced Overdraw, 2007). Returns the reordered indices.
+    '''
+    indices = np.asarray(indices)
+    triangles = indices.reshape(-1, 3).tolist()
+    # Vertex -> triangle adjacency, as offsets into a list of triangles.
+    flat = indices.ravel()
+    order = np.argsort(flat, kind="mergesort") // 3
+    offsets = np.zeros(nvertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(flat, minlength=nvertices), out=offsets[1:])
+    adjacency = order.tolist()
+    offsets = offsets.tolist()
+    live = np.diff(offsets).tolist()
+    stamps = [0] * nvertices
+    emitted = [False] * len(triangles)
+    deadend = []
+    output = []
+    time = cachesize + 1
+    cursor = 0
+    fan = 0
+    while fan >= 0:
+        candidates = []
+        for t in adjacency[offsets[fan]:offsets[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            for v in triangles[t]:
+                output.append(v)
+                deadend.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - stamps[v] > cachesize:
+                    stamps[v] = time
+                    time += 1
+        # The candidate that will still be in the cache after its fan, and is oldest, is next.
+        fan = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time - stamps[v] + 2 * live[v] <= cachesize:
+                    priority = time - stamps[v]
+                if priority > best:
+                    best = priority
+                    fan = v
+        if fan < 0:
+            # Dead end: go back to recently used vertices, else on through the input.
+            while deadend:
+                v = deadend.pop()
+                if live[v] > 0:
+                    fan = v
+                    break
+            while fan < 0 and cursor < nvertices:
+                if live[cursor] > 0:
+                    fan = cursor
+                cursor += 1
+    return np.array(output, dtype=indices.dtype)
+
+def reorderVertices(vertices, indices):
+    '''Sorts the vertices by their first use in indices (for vertex fetch locality), dropping unused ones.'''
+    indices = np.asarray(indices)
+    used, first = np.unique(indices, return_index=True)
+    order = used[np.argsort(first)]
+    remap = np.zeros(len(vertices), dtype=indices.dtype)
+    remap[order] = np.arange(len(order))
+    return vertices[order], remap[indices]
+
+def optimize(vertices, indices=None, cachesize=16, tolerance=0):
+    '''Welds, reorders triangles for the vertex cache and vertices for fetching. Returns vertices, indices.'''
+    vertices, indices = weld(vertices, indices, tolerance)
+    indices = tipsify(indices, len(vertices), cachesize)
+    return reorderVertices(vertices, indices)
+
+if __name__ == "__main__":
+    # Report the ACMR of a shuffled grid mesh before and after the optimization.
+    import sys
+    import timeit
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    u, v = np.meshgrid(np.arange(n + 1), np.arange(n + 1))
+    positions = np.stack([u.ravel(), v.ravel(), np.zeros(u.size), np.ones(u.size)], axis=1).astype(np.float32)
+    quads = (np.arange(n)[None, :] + np.arange(n)[:, None] * (n + 1)).ravel()
+    triangles = np.concatenate([np.stack([quads, quads + 1, quads + n + 2], axis=1),
+                                np.stack([quads, quads + n + 2, quads + n + 1], axis=1)])
+    np.random.shuffle(triangles)
+    # Unindexed, like a triangle soup straight from a file.
+    soup = positions[triangles.ravel()]
+    t = timeit.default_timer()
+    vertices, indices = optimize(soup)
+    elapsed = timeit.default_timer() - t
+    print "%d triangles, %d -> %d vertices, %s indices, %.0f ms" % (len(triangles), len(soup), len(vertices),
+                                                                   indices.dtype, elapsed * 1000)
+    print "ACMR before: %.3f, after: %.3f" % (acmr(triangles.ravel()), acmr(indices))
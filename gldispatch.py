@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  GLdispatch - release and debug dispatch of the GL calls in the hot loop.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import sys
+import ctypes
+
+DEFAULT = "default" # PyOpenGL as it is: wrappers, glGetError after every call.
+RELEASE = "release" # Raw function pointers for the hot entry points, no error checks.
+DEBUG = "debug"     # The checked wrappers, and GL_KHR_debug messages through a callback.
+MODES = (DEFAULT, RELEASE, DEBUG)
+
+_GLenum = _GLbitfield = _GLuint = ctypes.c_uint
+_GLint = _GLsizei = ctypes.c_int
+_GLboolean = ctypes.c_ubyte
+_GLintptr = _GLsizeiptr = ctypes.c_ssize_t
+
+# The entry points called per frame or per draw, with their C prototypes.
+# Pointer arguments are plain addresses (or ctypes pointers) in release mode.
+_hot = {
+    "glClear"                 : (None, [_GLbitfield]),
+    "glUseProgram"            : (None, [_GLuint]),
+    "glBindVertexArray"       : (None, [_GLuint]),
+    "glActiveTexture"         : (None, [_GLenum]),
+    "glBindTexture"           : (None, [_GLenum, _GLuint]),
+    "glBindBufferRange"       : (None, [_GLenum, _GLuint, _GLuint, _GLintptr, _GLsizeiptr]),
+    "glUniformMatrix4fv"      : (None, [_GLint, _GLsizei, _GLboolean, ctypes.c_void_p]),
+    "glDrawArrays"            : (None, [_GLenum, _GLint, _GLsizei]),
+    "glDrawElements"          : (None, [_GLenum, _GLsizei, _GLenum, ctypes.c_void_p]),
+    "glDrawArraysInstanced"   : (None, [_GLenum, _GLint, _GLsizei, _GLsizei]),
+    "glDrawElementsInstanced" : (None, [_GLenum, _GLsizei, _GLenum, ctypes.c_void_p, _GLsizei]),
+}
+
+def configure(mode):
+    '''
+    Sets PyOpenGL's global error checking for a mode, so it also applies to
+    the calls not in the dispatch table. PyOpenGL reads it when OpenGL.GL is
+    imported, so call it before that (or it has to be the setting already in
+    effect). A headless context has to be created first though, PyOpenGL's
+    EGL bindings fail to import without checking.
+    '''
+    if mode not in MODES:
+        raise ValueError("Unknown GL dispatch mode %r" % (mode,))
+    import OpenGL
+    checking = mode != RELEASE
+    if "OpenGL.GL" in sys.modules:
+        if bool(OpenGL.ERROR_CHECKING) == checking:
+            return
+        raise RuntimeError("OpenGL.GL was already imported, configure the dispatch mode before")
+    OpenGL.ERROR_CHECKING = checking
+
+def _address(name):
+    from OpenGL import platform
+    address = platform.PLATFORM.getExtensionProcedure(name.encode("ascii"))
+    if not address:
+        # Some platforms only hand out extensions, the core functions are exported by the library.
+        address = ctypes.cast(getattr(platform.PLATFORM.GL, name), ctypes.c_void_p).value
+    return address
+
+class Dispatch(object):
+    '''
+    The hot GL entry points for a mode, as attributes named like the GL
+    functions (dispatch.glDrawElements(...)). Needs a current context.
+
+    In release mode they are ctypes functions built from the resolved
+    addresses, so a call is a single ctypes call, without PyOpenGL's argument
+    conversion and glGetError. The arguments have to be of the C types then:
+    ints, and addresses or ctypes pointers for pointers.
+
+    In debug mode they are PyOpenGL's checked wrappers, and GL_KHR_debug
+    reports every message of the driver through log (by default to stderr),
+    counting them by severity in messages.
+    '''
+    def __init__(self, mode=DEFAULT, log=None):
+        import OpenGL.GL as GL
+        from OpenGL import platform
+        self.mode = mode
+        self.messages = {}
+        self._callback = None
+        functiontype = platform.PLATFORM.functionTypeFor(platform.PLATFORM.GL)
+        for name, (restype, argtypes) in _hot.items():
+            if mode == RELEASE:
+                function = functiontype(restype, *argtypes)(_address(name))
+            else:
+                function = getattr(GL, name)
+            setattr(self, name, function)
+        if mode == DEBUG:
+            self.log = log or self._stderr
+            if bool(GL.glDebugMessageCallback):
+                self._callback = GL.GLDEBUGPROC(self._message)
+                GL.glDebugMessageCallback(self._callback, None)
+                GL.glEnable(GL.GL_DEBUG_OUTPUT)
+                # Report in the call that caused the message, so the stack trace is useful.
+                GL.glEnable(GL.GL_DEBUG_OUTPUT_SYNCHRONOUS)
+            else:
+                self.log("GL_KHR_debug is not supported, only glGetError checks")
+
+    def _message(self, source, type, id, severity, length, message, userparam):
+        self.messages[severity] = self.messages.get(severity, 0) + 1
+        if not isinstance(message, (str, bytes)):
+            message = ctypes.string_at(message, length)
+        if isinstance(message, bytes) and not isinstance(message, str):
+            message = message.decode("utf-8", "replace")
+        self.log("GL debug (source 0x%x, type 0x%x, id %d, severity 0x%x): %s" %
+                 (source, type, id, severity, message))
+
+    def _stderr(self, message):
+        sys.stderr.write(message + "\n")
+
+    def delete(self):
+        '''Removes the debug callback.'''
+        if self._callback is not None:
+            import OpenGL.GL as GL
+            GL.glDebugMessageCallback(GL.GLDEBUGPROC(), None)
+            self._callback = None
+
+_default = None
+
+def default():
+    '''The shared DEFAULT Dispatch, for code which wasn't given one.'''
+    global _default
+    if _default is None:
+        _default = Dispatch()
+    return _default
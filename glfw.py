@@ -36,24 +36,72 @@
 #    adds a familiar C-ish feeling to GL programming in python.
 #  - Posibility to provide the a specific dynamic library of GLFW via
 #    the Environment Variable GLFW_LIBRARY.
+#
+#  Later changes:
+#
+#  - The library is only loaded, and its functions are only looked up,
+#    when the first GLFW function is called. glfwInit resolves all of
+#    them, so a "from glfw import *" after it gets the plain ctypes
+#    functions. OpenGL isn't imported here anymore, import OpenGL.GL yourself.
+#  - An optional event queue (glfwEnableEventQueue), which collects the
+#    input events in a NumPy array to be handled once per frame.
 #  
 ##############################################################################
 import os
 import ctypes
 import ctypes.util
-from OpenGL.GL import *
 
-glfwlibraryfile = None
-if 'GLFW_LIBRARY' in os.environ:
-    if os.path.exists(os.environ['GLFW_LIBRARY']):
-        glfwlibraryfile = os.path.realpath(os.environ['GLFW_LIBRARY'])
-if glfwlibraryfile == None:
-    glfwlibraryfile = ctypes.util.find_library('glfw')
-if glfwlibraryfile == None:
-    raise RuntimeError, 'GLFW library not found'
-__glfwdll__ = ctypes.CDLL(glfwlibraryfile)
-
-del glfwlibraryfile
+__glfwdll__ = None
+
+def _dll():
+    '''Returns the GLFW library, loading it on the first call.'''
+    global __glfwdll__
+    if __glfwdll__ is None:
+        # find_library runs ldconfig or the compiler, so this is the expensive part of the binding.
+        glfwlibraryfile = None
+        if 'GLFW_LIBRARY' in os.environ:
+            if os.path.exists(os.environ['GLFW_LIBRARY']):
+                glfwlibraryfile = os.path.realpath(os.environ['GLFW_LIBRARY'])
+        if glfwlibraryfile == None:
+            glfwlibraryfile = ctypes.util.find_library('glfw')
+        if glfwlibraryfile == None:
+            raise RuntimeError, 'GLFW library not found'
+        __glfwdll__ = ctypes.CDLL(glfwlibraryfile)
+    return __glfwdll__
+
+class _Function(object):
+    '''A GLFW function, which is looked up in the library when it's first called.'''
+    __slots__ = ('name', 'restype', 'argtypes', 'function')
+
+    def __init__(self, name, restype=ctypes.c_int, argtypes=None):
+        self.name = name
+        self.restype = restype
+        self.argtypes = argtypes
+        self.function = None
+
+    def resolve(self):
+        if self.function is None:
+            function = getattr(_dll(), self.name)
+            function.restype = self.restype
+            if self.argtypes is not None:
+                function.argtypes = self.argtypes
+            self.function = function
+            # The module (and the wrappers below) call the ctypes function directly from now on,
+            # only names taken with "from glfw import *" before keep going through this proxy
+            # (glfwInit resolves everything, so import again after it).
+            for attribute in (self.name, '_' + self.name):
+                if globals().get(attribute) is self:
+                    globals()[attribute] = function
+        return self.function
+
+    def __call__(self, *args):
+        function = self.function
+        if function is None:
+            function = self.resolve()
+        return function(*args)
+
+    def __repr__(self):
+        return '<GLFW function %s%s>' % (self.name, '' if self.function is None else ' (resolved)')
 
 #glfwlibraryfile = ctypes.util.find_library('c')
 #libc    = ctypes.CDLL(glfwlibraryfile)
@@ -256,6 +304,14 @@ GLFW_BUTTONS              = 0x00050003
 # Time spans longer than this (seconds) are considered to be infinity
 GLFW_INFINITY = 100000.0
 
+# Event types of the event queue (not part of GLFW, see glfwEnableEventQueue)
+GLFW_EVENT_KEY            = 1
+GLFW_EVENT_CHAR           = 2
+GLFW_EVENT_MOUSE_BUTTON   = 3
+GLFW_EVENT_MOUSE_POS      = 4
+GLFW_EVENT_MOUSE_WHEEL    = 5
+GLFW_EVENT_WINDOW_SIZE    = 6
+
 
 ##########################################################################
 # Typedefs
@@ -283,78 +339,130 @@ GLFWcharfun          = ctypes.CFUNCTYPE(None, ctypes.c_int, ctypes.c_int)
 ###############################################################################
 # Prototypes
 ###############################################################################
+# Every function gets its full prototype, so ctypes converts the arguments
+# directly instead of guessing their types on each call (and doesn't
+# truncate the doubles of the time functions).
+c_int, c_double, c_char_p, c_void_p = ctypes.c_int, ctypes.c_double, ctypes.c_char_p, ctypes.c_void_p
+c_int_p = ctypes.POINTER(ctypes.c_int)
+
 # GLFW initialization, termination and version querying
-glfwInit                     = __glfwdll__.glfwInit
-glfwTerminate                = __glfwdll__.glfwTerminate
-# glfwGetVersion               = __glfwdll__.glfwGetVersion
+_glfwInit                    = _Function('glfwInit', c_int, [])
+glfwTerminate                = _Function('glfwTerminate', None, [])
+_glfwGetVersion              = _Function('glfwGetVersion', None, [c_int_p, c_int_p, c_int_p])
 
 # Window handling
-glfwOpenWindow               = __glfwdll__.glfwOpenWindow
-glfwOpenWindowHint           = __glfwdll__.glfwOpenWindowHint
-glfwCloseWindow              = __glfwdll__.glfwCloseWindow
-glfwSetWindowTitle           = __glfwdll__.glfwSetWindowTitle
-#glfwGetWindowSize            = __glfwdll__.glfwGetWindowSize
-glfwSetWindowSize            = __glfwdll__.glfwSetWindowSize
-glfwSetWindowPos             = __glfwdll__.glfwSetWindowPos
-glfwIconifyWindow            = __glfwdll__.glfwIconifyWindow
-glfwRestoreWindow            = __glfwdll__.glfwRestoreWindow
-glfwSwapBuffers              = __glfwdll__.glfwSwapBuffers
-glfwSwapInterval             = __glfwdll__.glfwSwapInterval
-glfwGetWindowParam           = __glfwdll__.glfwGetWindowParam
-#glfwSetWindowSizeCallback    = __glfwdll__.glfwSetWindowSizeCallback
-
-
-#glfwSetWindowCloseCallback   = __glfwdll__.glfwSetWindowCloseCallback
-#glfwSetWindowRefreshCallback = __glfwdll__.glfwSetWindowRefreshCallback
-
-# Video mode functions 
-# glfwGetVideoModes            = __glfwdll__.glfwGetVideoModes
-# glfwGetDesktopMode           = __glfwdll__.glfwGetDesktopMode
+glfwOpenWindow               = _Function('glfwOpenWindow', c_int, [c_int] * 9)
+glfwOpenWindowHint           = _Function('glfwOpenWindowHint', None, [c_int, c_int])
+glfwCloseWindow              = _Function('glfwCloseWindow', None, [])
+glfwSetWindowTitle           = _Function('glfwSetWindowTitle', None, [c_char_p])
+_glfwGetWindowSize           = _Function('glfwGetWindowSize', None, [c_void_p, c_void_p])
+glfwSetWindowSize            = _Function('glfwSetWindowSize', None, [c_int, c_int])
+glfwSetWindowPos             = _Function('glfwSetWindowPos', None, [c_int, c_int])
+glfwIconifyWindow            = _Function('glfwIconifyWindow', None, [])
+glfwRestoreWindow            = _Function('glfwRestoreWindow', None, [])
+glfwSwapBuffers              = _Function('glfwSwapBuffers', None, [])
+glfwSwapInterval             = _Function('glfwSwapInterval', None, [c_int])
+glfwGetWindowParam           = _Function('glfwGetWindowParam', c_int, [c_int])
+_glfwSetWindowSizeCallback   = _Function('glfwSetWindowSizeCallback', None, [GLFWwindowsizefun])
+_glfwSetWindowCloseCallback  = _Function('glfwSetWindowCloseCallback', None, [GLFWwindowclosefun])
+_glfwSetWindowRefreshCallback = _Function('glfwSetWindowRefreshCallback', None, [GLFWwindowrefreshfun])
+
+# Video mode functions
+_glfwGetVideoModes           = _Function('glfwGetVideoModes', c_int, [ctypes.POINTER(GLFWvidmode), c_int])
+_glfwGetDesktopMode          = _Function('glfwGetDesktopMode', None, [ctypes.POINTER(GLFWvidmode)])
 
 # Input handling
-glfwPollEvents               = __glfwdll__.glfwPollEvents
-glfwWaitEvents               = __glfwdll__.glfwWaitEvents
-glfwGetKey                   = __glfwdll__.glfwGetKey
-glfwGetMouseButton           = __glfwdll__.glfwGetMouseButton
-glfwGetMousePos              = __glfwdll__.glfwGetMousePos
-glfwSetMousePos              = __glfwdll__.glfwSetMousePos
-glfwGetMouseWheel            = __glfwdll__.glfwGetMouseWheel
-glfwSetMouseWheel            = __glfwdll__.glfwSetMouseWheel
-#glfwSetKeyCallback           = __glfwdll__.glfwSetKeyCallback
-#glfwSetCharCallback          = __glfwdll__.glfwSetCharCallback
-#glfwSetMouseButtonCallback   = __glfwdll__.glfwSetMouseButtonCallback
-#glfwSetMousePosCallback      = __glfwdll__.glfwSetMousePosCallback
-#glfwSetMouseWheelCallback    = __glfwdll__.glfwSetMouseWheelCallback
-
+glfwPollEvents               = _Function('glfwPollEvents', None, [])
+glfwWaitEvents               = _Function('glfwWaitEvents', None, [])
+glfwGetKey                   = _Function('glfwGetKey', c_int, [c_int])
+glfwGetMouseButton           = _Function('glfwGetMouseButton', c_int, [c_int])
+_glfwGetMousePos             = _Function('glfwGetMousePos', None, [c_void_p, c_void_p])
+glfwSetMousePos              = _Function('glfwSetMousePos', None, [c_int, c_int])
+glfwGetMouseWheel            = _Function('glfwGetMouseWheel', c_int, [])
+glfwSetMouseWheel            = _Function('glfwSetMouseWheel', None, [c_int])
+_glfwSetKeyCallback          = _Function('glfwSetKeyCallback', None, [GLFWkeyfun])
+_glfwSetCharCallback         = _Function('glfwSetCharCallback', None, [GLFWcharfun])
+_glfwSetMouseButtonCallback  = _Function('glfwSetMouseButtonCallback', None, [GLFWmousebuttonfun])
+_glfwSetMousePosCallback     = _Function('glfwSetMousePosCallback', None, [GLFWmouseposfun])
+_glfwSetMouseWheelCallback   = _Function('glfwSetMouseWheelCallback', None, [GLFWmousewheelfun])
 
 # Joystick input
-# glfwGetJoystickParam( int joy, int param );
-# glfwGetJoystickPos( int joy, float *pos, int numaxes );
-# glfwGetJoystickButtons( int joy, unsigned char *buttons, int numbuttons );
+glfwGetJoystickParam         = _Function('glfwGetJoystickParam', c_int, [c_int, c_int])
+_glfwGetJoystickPos          = _Function('glfwGetJoystickPos', c_int, [c_int, ctypes.POINTER(ctypes.c_float), c_int])
+_glfwGetJoystickButtons      = _Function('glfwGetJoystickButtons', c_int, [c_int, ctypes.POINTER(ctypes.c_ubyte), c_int])
 
 # Time
-glfwGetTime                  = __glfwdll__.glfwGetTime
-glfwSetTime                  = __glfwdll__.glfwSetTime
-glfwSleep                    = __glfwdll__.glfwSleep
+glfwGetTime                  = _Function('glfwGetTime', c_double, [])
+glfwSetTime                  = _Function('glfwSetTime', None, [c_double])
+glfwSleep                    = _Function('glfwSleep', None, [c_double])
 
 # Extension support
-# glfwExtensionSupported( const char *extension );
-# glfwGetProcAddress( const char *procname );
-# glfwGetGLVersion( int *major, int *minor, int *rev );
+glfwExtensionSupported       = _Function('glfwExtensionSupported', c_int, [c_char_p])
+glfwGetProcAddress           = _Function('glfwGetProcAddress', ctypes.c_void_p, [c_char_p])
+_glfwGetGLVersion            = _Function('glfwGetGLVersion', None, [c_int_p, c_int_p, c_int_p])
 
 # Enable/disable functions
-glfwEnable                  = __glfwdll__.glfwEnable;
-glfwDisable                 = __glfwdll__.glfwDisable;
-
+glfwEnable                   = _Function('glfwEnable', None, [c_int])
+glfwDisable                  = _Function('glfwDisable', None, [c_int])
+
+del c_int, c_double, c_char_p, c_void_p, c_int_p
+
+
+# The window size and mouse position getters are called every frame, so they
+# reuse their output integers instead of allocating new ones per call (GLFW 2
+# may only be used from one thread anyway). They take plain addresses, since
+# converting a byref() for a POINTER(c_int) argument costs more than the call.
+_windowsize = (ctypes.c_int(0), ctypes.c_int(0))
+_windowsizerefs = (ctypes.addressof(_windowsize[0]), ctypes.addressof(_windowsize[1]))
+_mousepos = (ctypes.c_int(0), ctypes.c_int(0))
+_mouseposrefs = (ctypes.addressof(_mousepos[0]), ctypes.addressof(_mousepos[1]))
+
+def resolve(*names):
+    '''
+    Resolves the named GLFW functions (all of them the library has by
+    default) and returns them, as the ctypes functions without the proxy in
+    between.
+    '''
+    everything = not names
+    if everything:
+        names = [name for name, value in globals().items() if isinstance(value, _Function)]
+    functions = []
+    for name in names:
+        value = globals()[name]
+        if isinstance(value, _Function):
+            try:
+                value = value.resolve()
+            except AttributeError:
+                # Missing from this build of the library, it raises when it's called then.
+                if not everything:
+                    raise
+        functions.append(value)
+    return functions
+
+def glfwInit():
+    '''
+    Initializes GLFW, and resolves all functions on success. Names taken with
+    "from glfw import *" before are still the proxies, import them again
+    after this call to call the functions directly.
+    '''
+    result = _glfwInit()
+    if result:
+        resolve()
+    return result
 
 def glfwGetVersion():
     major, minor, rev = ctypes.c_int(0), ctypes.c_int(0), ctypes.c_int(0)
-    __glfwdll__.glfwGetVersion( ctypes.byref(major), ctypes.byref(minor), ctypes.byref(rev) )
+    _glfwGetVersion( ctypes.byref(major), ctypes.byref(minor), ctypes.byref(rev) )
+    return major.value, minor.value, rev.value
+
+def glfwGetGLVersion():
+    major, minor, rev = ctypes.c_int(0), ctypes.c_int(0), ctypes.c_int(0)
+    _glfwGetGLVersion( ctypes.byref(major), ctypes.byref(minor), ctypes.byref(rev) )
     return major.value, minor.value, rev.value
 
 def glfwGetVideoModes( maxcount=16 ):
     c_modes = (GLFWvidmode*maxcount)()
-    n = __glfwdll__.glfwGetVideoModes( c_modes, maxcount )
+    n = _glfwGetVideoModes( c_modes, maxcount )
     modes = []
     for i in range(n):
         modes.append( (c_modes[i].Width, c_modes[i].Height,
@@ -363,51 +471,160 @@ def glfwGetVideoModes( maxcount=16 ):
 
 def glfwGetDesktopMode():
     mode = GLFWvidmode()
-    __glfwdll__.glfwGetDesktopMode( ctypes.byref(mode) )
+    _glfwGetDesktopMode( ctypes.byref(mode) )
     return mode.Width, mode.Height, mode.RedBits, mode.BlueBits, mode.GreenBits
 
 def glfwGetWindowSize():
-    width, height = ctypes.c_int(0), ctypes.c_int(0)
-    __glfwdll__.glfwGetWindowSize( ctypes.byref(width), ctypes.byref(height) )
-    return width.value, height.value
+    _glfwGetWindowSize( *_windowsizerefs )
+    return _windowsize[0].value, _windowsize[1].value
+
+def glfwGetMousePos():
+    _glfwGetMousePos( *_mouseposrefs )
+    return _mousepos[0].value, _mousepos[1].value
+
+def glfwGetJoystickPos( joy, numaxes=2 ):
+    pos = (ctypes.c_float*numaxes)()
+    n = _glfwGetJoystickPos( joy, pos, numaxes )
+    return pos[:n]
+
+def glfwGetJoystickButtons( joy, numbuttons=8 ):
+    buttons = (ctypes.c_ubyte*numbuttons)()
+    n = _glfwGetJoystickButtons( joy, buttons, numbuttons )
+    return buttons[:n]
 
 def glfwSetWindowSizeCallback( callback ):
     callback = GLFWwindowsizefun( callback ) 
     __callbacks__['window_size'] = callback 
-    __glfwdll__.glfwSetWindowSizeCallback( callback )
+    _glfwSetWindowSizeCallback( callback )
 
 def glfwSetWindowCloseCallback( callback ):
     callback = GLFWwindowclosefun( callback )
     __callbacks__['window_close'] = callback 
-    __glfwdll__.glfwSetWindowCloseCallback( callback )
+    _glfwSetWindowCloseCallback( callback )
 
 def glfwSetWindowRefreshCallback( callback ):
     callback = GLFWwindowrefreshfun( callback )
     __callbacks__['window_refresh'] = callback 
-    __glfwdll__.glfwSetWindowRefreshCallback( callback )
+    _glfwSetWindowRefreshCallback( callback )
 
 def glfwSetKeyCallback( callback ):
     callback = GLFWkeyfun( callback )
     __callbacks__['key'] = callback 
-    __glfwdll__.glfwSetKeyCallback( callback )
+    _glfwSetKeyCallback( callback )
 
 def glfwSetCharCallback( callback ):
     callback = GLFWcharfun( callback )
     __callbacks__['char'] = callback 
-    __glfwdll__.glfwSetCharCallback( callback )
+    _glfwSetCharCallback( callback )
 
 def glfwSetMouseButtonCallback( callback ):
     callback = GLFWmousebuttonfun( callback )
     __callbacks__['mouse_button'] = callback 
-    __glfwdll__.glfwSetMouseButtonCallback( callback )
+    _glfwSetMouseButtonCallback( callback )
 
 def glfwSetMousePosCallback( callback ):
     callback = GLFWmouseposfun( callback )
     __callbacks__['mouse_pos'] = callback 
-    __glfwdll__.glfwSetMousePosCallback( callback )
+    _glfwSetMousePosCallback( callback )
 
 def glfwSetMouseWheelCallback( callback ):
     callback = GLFWmousewheelfun( callback )
     __callbacks__['mouse_wheel'] = callback 
-    __glfwdll__.glfwSetMouseWheelCallback( callback )
+    _glfwSetMouseWheelCallback( callback )
+
 
+##########################################################################
+# Event queue
+##########################################################################
+class GLFWeventqueue(object):
+    '''A ring buffer of input events, filled by the GLFW callbacks and drained once per frame.
+
+    The events are records of (type, key, action, x, y, time), with the
+    GLFW_EVENT_* types. Keys, characters and mouse buttons use key and action,
+    the mouse position, the wheel and the window size use x (and y). A mouse
+    position, wheel or window size event directly following one of the same
+    type replaces it, so only the latest value of a burst is queued.
+
+    When more than capacity events arrive between two drains, the oldest ones
+    are overwritten and counted in overflowed. The key states can be read
+    with glfwGetKey after an overflow.'''
+    _coalesced = (GLFW_EVENT_MOUSE_POS, GLFW_EVENT_MOUSE_WHEEL, GLFW_EVENT_WINDOW_SIZE)
+
+    def __init__(self, capacity=1024):
+        # NumPy is only needed, and imported, when the queue is used.
+        import numpy as np
+        self.dtype = np.dtype([('type', np.uint8), ('key', np.int32), ('action', np.int32),
+                               ('x', np.int32), ('y', np.int32), ('time', np.float64)])
+        self.events = np.zeros(capacity, self.dtype)
+        self.capacity = capacity
+        self.start = 0
+        self.count = 0
+        self.last = 0 # The type of the newest queued event.
+        self.received = 0
+        self.coalesced = 0
+        self.overflowed = 0
+        # Writing single values into the field views is a lot cheaper than assigning records.
+        self._type, self._key, self._action = self.events['type'], self.events['key'], self.events['action']
+        self._x, self._y, self._time = self.events['x'], self.events['y'], self.events['time']
+        self._arange = np.arange(capacity)
+
+    def push(self, type, key, action, x, y):
+        '''Queues an event, called by the callbacks.'''
+        self.received += 1
+        if self.count and type == self.last and type in self._coalesced:
+            self.coalesced += 1
+            i = (self.start + self.count - 1) % self.capacity
+        else:
+            if self.count == self.capacity:
+                self.overflowed += 1
+                self.start = (self.start + 1) % self.capacity
+            else:
+                self.count += 1
+            i = (self.start + self.count - 1) % self.capacity
+            self._type[i] = type
+            self._key[i] = key
+            self._action[i] = action
+            self.last = type
+        self._x[i] = x
+        self._y[i] = y
+        self._time[i] = glfwGetTime()
+
+    def key(self, key, action):
+        self.push(GLFW_EVENT_KEY, key, action, 0, 0)
+
+    def char(self, character, action):
+        self.push(GLFW_EVENT_CHAR, character, action, 0, 0)
+
+    def mousebutton(self, button, action):
+        self.push(GLFW_EVENT_MOUSE_BUTTON, button, action, 0, 0)
+
+    def mousepos(self, x, y):
+        self.push(GLFW_EVENT_MOUSE_POS, 0, 0, x, y)
+
+    def mousewheel(self, position):
+        self.push(GLFW_EVENT_MOUSE_WHEEL, 0, 0, position, 0)
+
+    def windowsize(self, width, height):
+        self.push(GLFW_EVENT_WINDOW_SIZE, 0, 0, width, height)
+
+    def drain(self):
+        '''Returns the queued events in order, as a new record array, and empties the queue.'''
+        events = self.events.take(self._arange[:self.count] + self.start, mode='wrap')
+        self.start = (self.start + self.count) % self.capacity
+        self.count = 0
+        self.last = 0
+        return events
+
+    def stats(self):
+        return {'received' : self.received, 'coalesced' : self.coalesced, 'overflowed' : self.overflowed}
+
+def glfwEnableEventQueue( capacity=1024 ):
+    '''Replaces the input and window size callbacks with a GLFWeventqueue, which is returned.'''
+    queue = GLFWeventqueue(capacity)
+    glfwSetKeyCallback( queue.key )
+    glfwSetCharCallback( queue.char )
+    glfwSetMouseButtonCallback( queue.mousebutton )
+    glfwSetMousePosCallback( queue.mousepos )
+    glfwSetMouseWheelCallback( queue.mousewheel )
+    glfwSetWindowSizeCallback( queue.windowsize )
+    return queue
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#  OpenGL 3.2 Core Profile Example - headless offscreen rendering
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import os
+import sys
+import argparse
+import ctypes
+import timeit
+import numpy as np
+
+# PyOpenGL picks its platform on the first import, so nothing in here may
+# import OpenGL (or render/shaderutil) before useBackend() was called.
+BACKENDS = ["egl", "osmesa"]
+
+def useBackend(backend):
+    '''Selects the PyOpenGL platform for a headless backend. Call before importing OpenGL.'''
+    if backend not in BACKENDS:
+        raise ValueError("Unknown headless backend %r" % (backend,))
+    if "OpenGL" in sys.modules and os.environ.get("PYOPENGL_PLATFORM") != backend:
+        raise RuntimeError("OpenGL was already imported with another platform")
+    os.environ["PYOPENGL_PLATFORM"] = backend
+    if backend == "egl":
+        # Mesa's surfaceless platform needs neither X11 nor a GPU (llvmpipe).
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+class EGLContext(object):
+    '''An OpenGL 3.2 core context without any surface, using EGL.'''
+    def __init__(self):
+        from OpenGL import EGL
+        self.EGL = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("Unable to initialize EGL.")
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        attribs = (EGL.EGLint * 5)(EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                   EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_NONE)
+        if not EGL.eglChooseConfig(self.display, attribs, ctypes.pointer(config), 1, ctypes.pointer(count)) or count.value < 1:
+            raise RuntimeError("No EGL config for desktop OpenGL.")
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        attribs = (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+                                   EGL.EGL_CONTEXT_MINOR_VERSION, 2,
+                                   EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                                   EGL.EGL_NONE)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, attribs)
+        if not self.context:
+            raise RuntimeError("Unable to create an EGL context.")
+        # Rendering goes to a framebuffer object, so no surface is needed.
+        if not EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context):
+            raise RuntimeError("Unable to make the EGL context current.")
+
+    def destroy(self):
+        EGL = self.EGL
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglTerminate(self.display)
+
+class OSMesaContext(object):
+    '''An OpenGL 3.2 core context of Mesa's software renderer, using OSMesa.'''
+    def __init__(self):
+        from OpenGL import osmesa, arrays
+        # Not imported from OpenGL.GL, which has to wait for gldispatch.configure().
+        GL_UNSIGNED_BYTE = 0x1401
+        self.osmesa = osmesa
+        attribs = arrays.GLintArray.asArray([osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+                                             osmesa.OSMESA_DEPTH_BITS, 24,
+                                             osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+                                             osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+                                             osmesa.OSMESA_CONTEXT_MINOR_VERSION, 2,
+                                             0])
+        self.context = osmesa.OSMesaCreateContextAttribs(attribs, None)
+        if not self.context:
+            raise RuntimeError("Unable to create an OSMesa context.")
+        # OSMesa insists on a buffer of its own, the rendering goes to a framebuffer object though.
+        self.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError("Unable to make the OSMesa context current.")
+
+    def destroy(self):
+        self.osmesa.OSMesaDestroyContext(self.context)
+
+def createContext(backend):
+    '''Selects the backend and creates a current headless context for it.'''
+    useBackend(backend)
+    if backend == "egl":
+        return EGLContext()
+    return OSMesaContext()
+
+class Framebuffer(object):
+    '''A framebuffer object with a color and a depth renderbuffer to render into.'''
+    def __init__(self, width, height):
+        from OpenGL.GL import (glGenFramebuffers, glBindFramebuffer, glGenRenderbuffers, glBindRenderbuffer,
+                               glRenderbufferStorage, glFramebufferRenderbuffer, glCheckFramebufferStatus,
+                               GL_FRAMEBUFFER, GL_RENDERBUFFER, GL_RGBA8, GL_DEPTH_COMPONENT24,
+                               GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_FRAMEBUFFER_COMPLETE)
+        self.width = width
+        self.height = height
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.color, self.depth = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Framebuffer is incomplete.")
+
+    def read(self, out=None):
+        '''
+        Reads the color buffer back into a (height,width,3) uint8 array, top
+        row first. If given, the pixels are read into out (contiguous, with
+        the bottom row first like glReadPixels writes it) instead.
+        '''
+        from OpenGL.GL import glReadPixels, glPixelStorei, GL_PACK_ALIGNMENT, GL_RGB, GL_UNSIGNED_BYTE
+        pixels = np.empty((self.height, self.width, 3), dtype=np.uint8) if out is None else out
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, pixels)
+        return pixels[::-1]
+
+def writePPM(filename, pixels):
+    '''Writes a (height,width,3) uint8 array as binary PPM.'''
+    with open(filename, "wb") as f:
+        f.write(("P6 %d %d 255\n" % (pixels.shape[1], pixels.shape[0])).encode("ascii"))
+        f.write(np.ascontiguousarray(pixels).tobytes())
+
+def benchmark(renderer, frames, warmup=10, speed=360.0 / 5 / 60, profile=None, capture=None):
+    '''
+    Renders warmup + frames frames, rotating by speed degrees per frame, and
+    returns the times of the measured frames in seconds. Every frame ends in
+    a glFinish, so the times include the (software) rasterization. The
+    measured frames are recorded in profile, and captured by capture (a
+    capture.Capture), if given.
+    '''
+    from OpenGL.GL import glFinish
+    import profiler
+    profile = profile or profiler.Profiler(enabled=False)
+    times = np.empty(frames)
+    timer = timeit.default_timer
+    for i in range(warmup):
+        renderer.draw(i * speed)
+    glFinish()
+    for i in range(frames):
+        t = timer()
+        with profile.frame():
+            renderer.draw((warmup + i) * speed)
+            if capture is not None:
+                with profile.span("capture"):
+                    capture.capture()
+            with profile.span("finish"):
+                glFinish()
+        times[i] = timer() - t
+    return times
+
+def summary(times):
+    '''Mean, p50 and p99 frame time (in ms) and throughput (frames per second).'''
+    return {"mean" : times.mean() * 1000,
+            "p50"  : np.percentile(times, 50) * 1000,
+            "p99"  : np.percentile(times, 99) * 1000,
+            "fps"  : len(times) / times.sum()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the example offscreen and benchmarks the frame time.")
+    parser.add_argument("--backend", choices=BACKENDS, default="egl")
+    parser.add_argument("--size", default="400x300", help="framebuffer size, WIDTHxHEIGHT")
+    parser.add_argument("--frames", type=int, default=500, help="number of measured frames")
+    parser.add_argument("--warmup", type=int, default=10, help="number of frames rendered before measuring")
+    parser.add_argument("--instances", type=int, default=0,
+                        help="draw a grid of this many cubes with instanced rendering")
+    parser.add_argument("--mesh", metavar="FILE", help="draw this OBJ/PLY mesh instead of the cube")
+    parser.add_argument("--shader-cache", default=".shadercache", metavar="DIR",
+                        help="directory for cached program binaries, empty to disable")
+    parser.add_argument("--output", metavar="PPM", help="write the last frame to this file")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the frames and write a JSON summary (or a Chrome trace for *.trace.json)")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="capture the measured frames, e.g. frames/%%05d.png, frames/%%05d.ppm or video.rgb")
+    parser.add_argument("--gl", choices=["default", "release", "debug"], default="default",
+                        help="dispatch of the GL calls, see gldispatch.py")
+    args = parser.parse_args()
+    width, height = [int(v) for v in args.size.split("x")]
+
+    import gldispatch
+    context = createContext(args.backend)
+    gldispatch.configure(args.gl)
+    import shaderutil
+    import render
+    import meshio
+    import profiler
+    from OpenGL.GL import glGetString, GL_RENDERER, GL_VERSION
+    print "%s on %s" % (glGetString(GL_VERSION), glGetString(GL_RENDERER))
+    framebuffer = Framebuffer(width, height)
+    cache = shaderutil.ProgramCache(args.shader_cache) if args.shader_cache else None
+    profile = profiler.Profiler(enabled=bool(args.profile))
+    mesh = meshio.loadMesh(args.mesh) if args.mesh else None
+    gl = gldispatch.Dispatch(args.gl)
+    renderer = render.Renderer(args.instances, cache, profile=profile, mesh=mesh, gl=gl)
+    renderer.resize(width, height)
+    frames = None
+    if args.capture:
+        import capture
+        frames = capture.Capture(args.capture, width, height)
+    stats = summary(benchmark(renderer, args.frames, args.warmup, profile=profile, capture=frames))
+    print "%d frames at %dx%d: mean %.3f ms, p50 %.3f ms, p99 %.3f ms, %.1f frames/s" % (
+        args.frames, width, height, stats["mean"], stats["p50"], stats["p99"], stats["fps"])
+    print "%(drawcalls)d draw calls, %(binds)d binds issued, %(skipped)d skipped" % renderer.queue.stats()
+    if frames is not None:
+        frames.finish()
+        print ("captured %(captured)d, waited for a buffer %(stalls)d times, latency %(latency).1f frames (%(latencyms).2f ms), "
+               "%(cost).3f ms/frame on the GL thread, writer %(throughput).1f MB/s") % frames.stats()
+    if args.output:
+        writePPM(args.output, framebuffer.read())
+    if args.profile:
+        profile.dump(args.profile)
+    renderer.delete()
+    gl.delete()
+    context.destroy()
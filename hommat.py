@@ -32,69 +32,242 @@
 #
 ##############################################################################
 import numpy as np
-from math import pi, cos, sin, tan
+from math import pi, cos, sin, tan, sqrt
 
-def identity():
+class Workspace(object):
+    '''
+    Preallocated scratch matrices used by the out= forms of the transforms.
+    The module keeps a default workspace, give each thread its own if the
+    out= forms are used concurrently.
+    '''
+    def __init__(self):
+        self.scratch = np.identity(4, dtype=np.float32)
+        self.product = np.identity(4, dtype=np.float32)
+
+_IDENTITY = np.identity(4, dtype=np.float32)
+_workspace = Workspace()
+
+def _matrix(out, ws):
+    '''Returns an identity matrix to build a transform in. Fresh unless out is given.'''
+    if out is None:
+        return np.identity(4, dtype=np.float32)
+    M = (ws or _workspace).scratch
+    np.copyto(M, _IDENTITY)
+    return M
+
+def _apply(old, M, out, ws):
+    '''
+    Multiplies old with M, into out if given (which may alias old). Like the
+    allocating form, out= takes any 4x4 array-like as old (np.dot into the
+    float32 product needs float32 operands).
+    '''
+    if out is None:
+        return np.dot(old, M)
+    P = (ws or _workspace).product
+    np.dot(np.asarray(old, dtype=np.float32), M, out=P)
+    np.copyto(out, P)
+    return out
+
+def identity(out=None):
     '''Create the identity matrix.'''
-    return np.identity(4, dtype=np.float32)
+    if out is None:
+        return np.identity(4, dtype=np.float32)
+    np.copyto(out, _IDENTITY)
+    return out
     
-def translation(old, dir):
+def translation(old, dir, out=None, ws=None):
     '''Multiplies the old matrix with a translation in dir.'''
-    M = np.identity(4, dtype=np.float32)
-    M[:3, 3] = dir[:3]
-    return np.dot(old, M)
+    M = _matrix(out, ws)
+    M[0, 3] = dir[0]
+    M[1, 3] = dir[1]
+    M[2, 3] = dir[2]
+    return _apply(old, M, out, ws)
     
-def rotation(old, angle, dir):
+def rotation(old, angle, dir, out=None, ws=None):
     '''Multiplies the old matrix with a rotation around angle.'''
     cosa = cos(angle * pi / 180)
     sina = sin(angle * pi / 180)
     cosa1 = 1 - cosa
-    M = np.array([[dir[0]**2 * cosa1 + cosa             , dir[0] * dir[1] * cosa1 - dir[2]*sina, dir[0] * dir[2] * cosa1 + dir[1]*sina, 0],
-                  [dir[1] * dir[0] * cosa1 + dir[2]*sina, dir[1]**2 * cosa1 + cosa             , dir[1] * dir[2] * cosa1 - dir[0]*sina, 0],
-                  [dir[2] * dir[0] * cosa1 - dir[1]*sina, dir[2] * dir[1] * cosa1 + dir[0]*sina, dir[2]**2 * cosa1 + cosa             , 0],
-                  [0,0,0,1]
-                 ], dtype=np.float32)
-    return np.dot(old, M)
+    x, y, z = float(dir[0]), float(dir[1]), float(dir[2])
+    M = _matrix(out, ws)
+    M[0, 0] = x * x * cosa1 + cosa
+    M[0, 1] = x * y * cosa1 - z * sina
+    M[0, 2] = x * z * cosa1 + y * sina
+    M[1, 0] = y * x * cosa1 + z * sina
+    M[1, 1] = y * y * cosa1 + cosa
+    M[1, 2] = y * z * cosa1 - x * sina
+    M[2, 0] = z * x * cosa1 - y * sina
+    M[2, 1] = z * y * cosa1 + x * sina
+    M[2, 2] = z * z * cosa1 + cosa
+    return _apply(old, M, out, ws)
           
-def scale(old, axes):
+def scale(old, axes, out=None, ws=None):
     '''Multiplies the old matrix with a scaleing matrix.'''
-    M = np.array([[axes[0], 0, 0, 0],
-                  [0, axes[1], 0, 0],
-                  [0, 0, axes[2], 0],
-                  [0, 0, 0, 1]
-                 ], dtype=np.float32)
-    return np.dot(old, M)
-
-def ortho(old, l, r, b, t, n, f):
+    M = _matrix(out, ws)
+    M[0, 0] = axes[0]
+    M[1, 1] = axes[1]
+    M[2, 2] = axes[2]
+    return _apply(old, M, out, ws)
+
+def ortho(old, l, r, b, t, n, f, out=None, ws=None):
     '''Multiplies the old matrix with a orthogonal projection.'''
-    M = np.array([[2.0 / (r - l), 0, 0, -float(r + l) / (r - l)],
-                  [0, 2.0 / (t - b), 0, -float(t + b) / (t - b)],
-                  [0, 0, 2.0 / (f - n), -float(f + n) / (f - n)],
-                  [0,0,0,1]
-                 ], dtype=np.float32)
-    return np.dot(old, M)
+    M = _matrix(out, ws)
+    M[0, 0] = 2.0 / (r - l)
+    M[1, 1] = 2.0 / (t - b)
+    M[2, 2] = 2.0 / (f - n)
+    M[0, 3] = -float(r + l) / (r - l)
+    M[1, 3] = -float(t + b) / (t - b)
+    M[2, 3] = -float(f + n) / (f - n)
+    return _apply(old, M, out, ws)
                     
-def perspective(old, fovy, aspect, near, far):
+def perspective(old, fovy, aspect, near, far, out=None, ws=None):
     '''Multiplies the old matrix with a perspective projection.'''
     f = 1.0 / tan(fovy * pi / 360.0)
-    M = np.array([[f / aspect, 0, 0, 0],
-                  [0, f, 0, 0],
-                  [0, 0, float(far + near) / (near - far), (2.0 * far * near) / (near - far)],
-                  [0, 0, -1, 0]
-                 ], dtype=np.float32)
-    return np.dot(old, M)
+    M = _matrix(out, ws)
+    M[0, 0] = f / aspect
+    M[1, 1] = f
+    M[2, 2] = float(far + near) / (near - far)
+    M[2, 3] = (2.0 * far * near) / (near - far)
+    M[3, 2] = -1
+    M[3, 3] = 0
+    return _apply(old, M, out, ws)
                     
-def lookat(old, eye, at, up = np.array([0,1,0,1])):
+def lookat(old, eye, at, up = (0,1,0,1), out=None, ws=None):
     '''Multiplies the old matrix with a lookat transformation.'''
-    f = at[:3] - eye[:3]
-    f *= 1 / np.linalg.norm(f)
-    up /= np.linalg.norm(up[:3])
-    s = np.cross(f, up[:3])
+    # Done on plain floats, so the out= form does not need any temporaries.
+    fx, fy, fz = float(at[0] - eye[0]), float(at[1] - eye[1]), float(at[2] - eye[2])
+    n = 1 / sqrt(fx * fx + fy * fy + fz * fz)
+    fx, fy, fz = fx * n, fy * n, fz * n
+    ux, uy, uz = float(up[0]), float(up[1]), float(up[2])
+    n = 1 / sqrt(ux * ux + uy * uy + uz * uz)
+    ux, uy, uz = ux * n, uy * n, uz * n
+    # s = f x up, u = s x f
+    sx, sy, sz = fy * uz - fz * uy, fz * ux - fx * uz, fx * uy - fy * ux
+    ux, uy, uz = sy * fz - sz * fy, sz * fx - sx * fz, sx * fy - sy * fx
+    ex, ey, ez = float(eye[0]), float(eye[1]), float(eye[2])
+    M = _matrix(out, ws)
+    M[0, 0], M[0, 1], M[0, 2] = sx, sy, sz
+    M[1, 0], M[1, 1], M[1, 2] = ux, uy, uz
+    M[2, 0], M[2, 1], M[2, 2] = -fx, -fy, -fz
+    M[0, 3] = -(sx * ex + sy * ey + sz * ez)
+    M[1, 3] = -(ux * ex + uy * ey + uz * ez)
+    M[2, 3] = fx * ex + fy * ey + fz * ez
+    return _apply(old, M, out, ws)
+
+##############################################################################
+# Batched variants
+#
+# The functions below mirror the scalar ones above, but take arrays of
+# parameters and build a whole (N,4,4) stack of matrices at once. The old
+# argument may be a single 4x4 matrix or a (N,4,4) stack; it is combined
+# using np.matmul, so the usual broadcasting rules apply. An (N,4,4) out
+# array may be given to receive the result.
+##############################################################################
+
+def _stack(n):
+    '''Creates a contiguous (n,4,4) stack of identity matrices.'''
+    M = np.zeros((n, 4, 4), dtype=np.float32)
+    M[:, 0, 0] = M[:, 1, 1] = M[:, 2, 2] = M[:, 3, 3] = 1
+    return M
+
+def _combine(old, M, out=None):
+    '''Multiplies old with a stack of matrices, keeping the result contiguous.'''
+    if out is not None:
+        return np.matmul(old, M, out=out)
+    return np.ascontiguousarray(np.matmul(old, M), dtype=np.float32)
+
+def identities(n):
+    '''Create a stack of n identity matrices.'''
+    return _stack(n)
+
+def translations(old, dirs, out=None):
+    '''Multiplies the old matrix (or stack) with translations in dirs (N,3+).'''
+    dirs = np.asarray(dirs, dtype=np.float32)
+    M = _stack(len(dirs))
+    M[:, :3, 3] = dirs[:, :3]
+    return _combine(old, M, out)
+
+def rotations(old, angles, dirs, out=None):
+    '''Multiplies the old matrix (or stack) with rotations around dirs (N,3+) by angles (N,).'''
+    angles = np.asarray(angles, dtype=np.float64)
+    dirs = np.asarray(dirs, dtype=np.float64)
+    if dirs.ndim == 1:
+        dirs = np.broadcast_to(dirs, (len(angles), len(dirs)))
+    cosa = np.cos(angles * pi / 180)
+    sina = np.sin(angles * pi / 180)
+    cosa1 = 1 - cosa
+    x, y, z = dirs[:, 0], dirs[:, 1], dirs[:, 2]
+    M = _stack(len(angles))
+    M[:, 0, 0] = x * x * cosa1 + cosa
+    M[:, 0, 1] = x * y * cosa1 - z * sina
+    M[:, 0, 2] = x * z * cosa1 + y * sina
+    M[:, 1, 0] = y * x * cosa1 + z * sina
+    M[:, 1, 1] = y * y * cosa1 + cosa
+    M[:, 1, 2] = y * z * cosa1 - x * sina
+    M[:, 2, 0] = z * x * cosa1 - y * sina
+    M[:, 2, 1] = z * y * cosa1 + x * sina
+    M[:, 2, 2] = z * z * cosa1 + cosa
+    return _combine(old, M, out)
+
+def scales(old, axes, out=None):
+    '''Multiplies the old matrix (or stack) with scaling matrices for axes (N,3+).'''
+    axes = np.asarray(axes, dtype=np.float32)
+    M = _stack(len(axes))
+    M[:, 0, 0] = axes[:, 0]
+    M[:, 1, 1] = axes[:, 1]
+    M[:, 2, 2] = axes[:, 2]
+    return _combine(old, M, out)
+
+def perspectives(old, fovy, aspect, near, far, out=None):
+    '''Multiplies the old matrix (or stack) with perspective projections.
+    All parameters may be scalars or arrays of the same length.'''
+    fovy, aspect, near, far = np.broadcast_arrays(*[np.asarray(a, dtype=np.float64) for a in (fovy, aspect, near, far)])
+    fovy, aspect, near, far = [np.atleast_1d(a) for a in (fovy, aspect, near, far)]
+    f = 1.0 / np.tan(fovy * pi / 360.0)
+    M = np.zeros((len(f), 4, 4), dtype=np.float32)
+    M[:, 0, 0] = f / aspect
+    M[:, 1, 1] = f
+    M[:, 2, 2] = (far + near) / (near - far)
+    M[:, 2, 3] = (2.0 * far * near) / (near - far)
+    M[:, 3, 2] = -1
+    return _combine(old, M, out)
+
+def lookats(old, eyes, ats, ups = (0,1,0,1), out=None):
+    '''Multiplies the old matrix (or stack) with lookat transformations.
+    eyes and ats are (N,3+) arrays, ups may be a single vector or (N,3+).'''
+    eyes = np.asarray(eyes, dtype=np.float32)
+    ats = np.asarray(ats, dtype=np.float32)
+    ups = np.broadcast_to(np.asarray(ups, dtype=np.float32)[..., :3], (len(eyes), 3))
+    f = ats[:, :3] - eyes[:, :3]
+    f /= np.linalg.norm(f, axis=1)[:, None]
+    ups = ups / np.linalg.norm(ups, axis=1)[:, None]
+    s = np.cross(f, ups)
     u = np.cross(s, f)
-    M = np.identity(4, dtype=np.float32)
-    M[0, :3] = s
-    M[1, :3] = u
-    M[2, :3] = -f
-    return np.dot(old, translation(M, -eye))
+    M = _stack(len(eyes))
+    M[:, 0, :3] = s
+    M[:, 1, :3] = u
+    M[:, 2, :3] = -f
+    # Same as translation(M, -eye), but for the whole stack.
+    M[:, :3, 3] = -np.einsum('nij,nj->ni', M[:, :3, :3], eyes[:, :3])
+    return _combine(old, M, out)
 
-    
\ No newline at end of file
+if __name__ == "__main__":
+    # Small benchmark of the per call overhead of the allocating and the
+    # out= forms of the transforms.
+    import timeit
+    old = perspective(identity(), 70, 4.0 / 3, 0.1, 10.0)
+    out = identity()
+    eye = np.array([2.5, 1.5, 2.5, 1], dtype=np.float32)
+    at = np.array([0, 0, 0, 1], dtype=np.float32)
+    axis = (0, 1, 0)
+    n = 20000
+    cases = [("translation", lambda: translation(old, axis), lambda: translation(old, axis, out=out)),
+             ("rotation", lambda: rotation(old, 30.0, axis), lambda: rotation(old, 30.0, axis, out=out)),
+             ("scale", lambda: scale(old, axis), lambda: scale(old, axis, out=out)),
+             ("perspective", lambda: perspective(old, 70, 1.3, 0.1, 10.0), lambda: perspective(old, 70, 1.3, 0.1, 10.0, out=out)),
+             ("lookat", lambda: lookat(old, eye, at), lambda: lookat(old, eye, at, out=out))]
+    print "%-12s %12s %12s" % ("", "alloc [us]", "out= [us]")
+    for name, alloc, inplace in cases:
+        ta = min(timeit.repeat(alloc, number=n, repeat=3)) / n * 1e6
+        ti = min(timeit.repeat(inplace, number=n, repeat=3)) / n * 1e6
+        print "%-12s %12.2f %12.2f" % (name, ta, ti)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Instancing - per instance attributes for instanced drawing
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+
+# Layout of one instance in the buffer: a column major model matrix (as GLSL
+# reads a mat4 attribute column by column) followed by a color.
+instance_dtype = np.dtype([('model', np.float32, (4, 4)), ('color', np.float32, 4)])
+
+def _divisor(location, divisor):
+    '''glVertexAttribDivisor is core in 3.3, 3.2 contexts expose the ARB version.'''
+    if bool(glVertexAttribDivisor):
+        glVertexAttribDivisor(location, divisor)
+    else:
+        from OpenGL.GL.ARB.instanced_arrays import glVertexAttribDivisorARB
+        glVertexAttribDivisorARB(location, divisor)
+
+class InstanceBuffer(object):
+    '''
+    A vertex buffer holding per instance model matrices and colors. It has to
+    be created while the VAO of the mesh is bound, since it sets up the
+    instanced attributes (with a divisor of 1) on it.
+    '''
+    def __init__(self, modelloc, colorloc, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.data = np.zeros(capacity, dtype=instance_dtype)
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferData(GL_ARRAY_BUFFER, self.data.nbytes, None, GL_STREAM_DRAW)
+        stride = instance_dtype.itemsize
+        # A mat4 attribute occupies four consecutive locations, one per column.
+        for column in range(4):
+            glEnableVertexAttribArray(modelloc + column)
+            glVertexAttribPointer(modelloc + column, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(column * 16))
+            _divisor(modelloc + column, 1)
+        glEnableVertexAttribArray(colorloc)
+        glVertexAttribPointer(colorloc, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(instance_dtype.fields['color'][1]))
+        _divisor(colorloc, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def update(self, models, colors=None):
+        '''
+        Uploads a (N,4,4) stack of hommat matrices (and optionally (N,4)
+        colors) in a single call. Colors keep their old value if not given.
+        '''
+        n = len(models)
+        if n > self.capacity:
+            raise ValueError("%d instances exceed the capacity of %d" % (n, self.capacity))
+        data = self.data[:n]
+        # hommat matrices are row major, transposing gives GLSL its columns.
+        data['model'] = np.swapaxes(models, 1, 2)
+        if colors is not None:
+            data['color'] = colors
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.count = n
+
+    def draw(self, mode, first, count):
+        '''Draws count vertices of the bound VAO once for every uploaded instance.'''
+        if self.count:
+            glDrawArraysInstanced(mode, first, count, self.count)
+
+    def drawElements(self, mode, count, type):
+        '''Draws count indices of the bound VAO's index buffer once for every uploaded instance.'''
+        if self.count:
+            glDrawElementsInstanced(mode, count, type, None, self.count)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.buffer])
+        self.buffer = None
@@ -34,54 +34,83 @@
 ##############################################################################
 import os
 import sys
-import numpy as np
+import argparse
 import shaderutil
-import hommat as hm
-import time
+import render
+import assets
+import capture
+import gldispatch
+import shaderreload
+import profiler
+import scheduler
 # A * import gives the code a familiar C-Ish feeling. Since all the functions are prefixed with gl/glfw, it's not too bad.
 from glfw import *
-from OpenGL.arrays.vbo import VBO
-from OpenGL.GL.ARB.vertex_array_object import *
+from OpenGL.GL import *
 
-# A triangle strip for a cube. Layout is 4xPosition, 4xColor
-cubedata = np.array([-1,-1, 1, 1, 0, 0, 0, 0, #1
-                      1,-1, 1, 1, 1, 0, 0, 0, #2
-                      1, 1, 1, 1, 1, 1, 0, 0, #3
-                      1,-1,-1, 1, 1, 0, 1, 0, #4
-                      1, 1,-1, 1, 1, 1, 1, 0, #5
-                     -1, 1,-1, 1, 0, 1, 1, 0, #6
-                      1, 1, 1, 1, 1, 1, 0, 0, #7
-                     -1, 1, 1, 1, 0, 1, 0, 0, #8
-                     -1,-1, 1, 1, 0, 0, 0, 0, #9
-                     -1, 1,-1, 1, 0, 1, 1, 0, #10
-                     -1,-1,-1, 1, 0, 0, 1, 0, #11
-                      1,-1,-1, 1, 1, 0, 1, 0, #12
-                     -1,-1, 1, 1, 0, 0, 0, 0, #13
-                      1,-1, 1, 1, 1, 0, 0, 0, #14
-                    ], dtype = np.float32)
-                    
-campos = np.array([2.5, 1.5, 2.5, 1], dtype = np.float32)
-center = np.array([0.0,0.0,0.0,1.0], dtype = np.float32)
-
-modelview_mat = hm.lookat(hm.identity(), campos, center)
-perspective_mat = None
-mvp = None
+renderer = None
 
 def resizeWindow(width, height):
-    global mvp, modelview_mat, perspective_mat
-    glViewport(0, 0, width, height)
-    perspective_mat = hm.perspective(hm.identity(), 70, float(width) / height, 0.1, 10.0)
-    mvp = np.dot(perspective_mat, modelview_mat)
+    renderer.resize(width, height)
 
 running = True
+rotation = 0.0
+previous_rotation = 0.0
+
+def update(dt):
+    '''Advances the simulation by a fixed timestep.'''
+    global rotation, previous_rotation
+    previous_rotation = rotation
+    # Do the rotation thing...
+    rotation += dt / 5 * 360
 
 # A light example for a key callback.
 def keypress(key, action):
     if key == GLFW_KEY_ESC:
         global running
         running = False
+
+def mousebutton(button, action):
+    if button == GLFW_MOUSE_BUTTON_LEFT and action == GLFW_PRESS:
+        x, y = glfwGetMousePos()
+        hit = renderer.pick(x, y)
+        if hit is not None:
+            print "Picked triangle %d (u %.2f, v %.2f)" % hit[1:]
+
+def handleEvents(events):
+    '''Handles the events of a frame from the event queue, as a batch instead of one callback each.'''
+    keys = events["key"][events["type"] == GLFW_EVENT_KEY]
+    if (keys == GLFW_KEY_ESC).any():
+        keypress(GLFW_KEY_ESC, GLFW_PRESS)
+    buttons = events[events["type"] == GLFW_EVENT_MOUSE_BUTTON]
+    for button, action in zip(buttons["key"], buttons["action"]):
+        mousebutton(button, action)
+    sizes = events[events["type"] == GLFW_EVENT_WINDOW_SIZE]
+    if len(sizes):
+        resizeWindow(int(sizes["x"][-1]), int(sizes["y"][-1]))
     
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenGL 3.2 Core Profile Example")
+    parser.add_argument("--instances", type=int, default=0,
+                        help="draw a grid of this many cubes with instanced rendering")
+    parser.add_argument("--mesh", metavar="FILE", help="draw this OBJ/PLY mesh instead of the cube")
+    parser.add_argument("--shader-cache", default=".shadercache", metavar="DIR",
+                        help="directory for cached program binaries, empty to disable")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the frames and write a JSON summary (or a Chrome trace for *.trace.json)")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="target frame rate, sleeping between the frames (default: as fast as possible or vsync)")
+    parser.add_argument("--no-vsync", action="store_true", help="do not wait for vsync when swapping")
+    parser.add_argument("--upload-budget", type=float, default=4, metavar="MB",
+                        help="bytes of loaded assets uploaded per frame at most")
+    parser.add_argument("--watch-shaders", action="store_true",
+                        help="rebuild the program when its shader files change")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="capture the frames (of the initial window size), e.g. frames/%%05d.png or video.rgb")
+    parser.add_argument("--gl", choices=gldispatch.MODES, default=gldispatch.DEFAULT,
+                        help="dispatch of the GL calls per frame, see gldispatch.py")
+    parser.add_argument("--event-queue", action="store_true",
+                        help="queue the input events and handle them once per frame instead of in callbacks")
+    args = parser.parse_args()
     # Something in glfwInit changes the cwd.
     cwd = os.getcwd()
     # Initialize
@@ -90,6 +119,8 @@ if __name__ == "__main__":
         sys.exit(-1)
     # Restore the old cwd.
     os.chdir(cwd)
+    # glfwInit resolved the functions, take them again so the main loop calls them without the lazy proxies.
+    from glfw import *
     # Set Window hints for OpenGL 3.2 Core profile.
     glfwOpenWindowHint(GLFW_OPENGL_VERSION_MAJOR, 3)
     glfwOpenWindowHint(GLFW_OPENGL_VERSION_MINOR, 2)
@@ -99,56 +130,95 @@ if __name__ == "__main__":
         print >> sys.stderr, "Unable to open Window."
         glfwTerminate()
         sys.exit(-1)
-    glfwSetWindowSizeCallback(resizeWindow)
-    glfwSetKeyCallback(keypress)
-    glfwSetWindowTitle("OpenGL Core Profile Test")
-    glfwEnable(GLFW_AUTO_POLL_EVENTS) # Enables the polling for key/mouse events in the swap buffer function!
-    resizeWindow(400, 300)
     # Print some OpenGL information.
     print "OpenGL Information:"
     for prop in ["GL_VENDOR", "GL_RENDERER", "GL_VERSION", "GL_SHADING_LANGUAGE_VERSION"]:
         print "\t%s = %s" % (prop, glGetString(locals()[prop]))
 
-    # Set up OpenGL Stuff.
-    glEnable(GL_DEPTH_TEST)
-    glEnable(GL_CULL_FACE)
-    glClearColor(1, 1, 1, 0)
-    glPointSize(5)
-    # Set up the shader.
-    prog = shaderutil.createProgram("./shader.vs", "./shader.fs")
-    mvploc = glGetUniformLocation(prog, "mvp")
-    positionloc = glGetAttribLocation(prog, "vs_position")
-    colorloc = glGetAttribLocation(prog, "vs_color")    
-    
-    # Setup VAO
-    vertobj = glGenVertexArrays(1)
-    glBindVertexArray(vertobj)
-    # Setup the VBO (using the fancy VBO Object from pyopengl, doing it "manually" would also be a possibility)
-    vertbuf = VBO(cubedata, GL_STATIC_DRAW)
-    vertbuf.bind()
-    glEnableVertexAttribArray(positionloc)
-    glEnableVertexAttribArray(colorloc)
-    glVertexAttribPointer(positionloc, 4, GL_FLOAT, GL_TRUE, 8 * 4, vertbuf+0) # "+0" since we need to create an offset.
-    glVertexAttribPointer(colorloc, 4, GL_FLOAT, GL_TRUE, 8 * 4, vertbuf+16) # 4 * 4 Bytes per float.
-    vertbuf.unbind() # We can unbind the VBO, since it's linked to the VAO
-    # glBindVertexArray(0)
+    # Set up the shader, VAO and VBO (see render.py).
+    cache = shaderutil.ProgramCache(args.shader_cache) if args.shader_cache else None
+    profile = profiler.Profiler(enabled=bool(args.profile))
+    gl = gldispatch.Dispatch(args.gl)
+    renderer = render.Renderer(args.instances, cache, profile=profile, gl=gl)
+    # A mesh is loaded in the background, the cube is drawn until it's ready.
+    loader = assets.AssetManager(budget=int(args.upload_budget * (1 << 20)))
+    meshrenderer = None
+    if args.mesh:
+        # The upload only creates the buffers, the mesh is read by the worker and the cube's program is reused.
+        meshrenderer = loader.mesh(args.mesh, upload=lambda mesh: render.Renderer(args.instances, cache,
+                                                                                  profile=profile, mesh=mesh, gl=gl,
+                                                                                  prog=renderer.prog))
+    watcher = shaderreload.ShaderWatcher(cache=cache) if args.watch_shaders else None
+    def watchShaders(renderer):
+        return watcher.watch(renderer.shaderfiles[0], renderer.shaderfiles[1], renderer.setProgram, renderer.prog)
+    if watcher is not None:
+        watched = watchShaders(renderer)
+    resizeWindow(400, 300)
+    if args.event_queue:
+        events = glfwEnableEventQueue()
+    else:
+        events = None
+        glfwSetWindowSizeCallback(resizeWindow)
+        glfwSetKeyCallback(keypress)
+        glfwSetMouseButtonCallback(mousebutton)
+    glfwSetWindowTitle("OpenGL Core Profile Test")
+    glfwEnable(GLFW_AUTO_POLL_EVENTS) # Enables the polling for key/mouse events in the swap buffer function!
     
+    # Interactive, so frames the writer can't keep up with are dropped rather than stalling the window.
+    recorder = capture.Capture(args.capture, 400, 300, block=False) if args.capture else None
+
+    def draw(alpha):
+        # Interpolate between the last two simulation steps.
+        renderer.draw(previous_rotation + (rotation - previous_rotation) * alpha)
+        if recorder is not None:
+            with profile.span("capture"):
+                recorder.capture()
+        with profile.span("swap"):
+            glfwSwapBuffers()
+        # glfwPollEvents() # This would poll for key/mouse events manually.
+
+    # Simulation runs at a fixed 60 Hz, independent of the frame rate.
+    # Late and dropped frames are measured against the refresh rate with only vsync (0 if GLFW doesn't know it).
+    frames = scheduler.Scheduler(update, draw, 1.0 / 60, args.fps, not args.no_vsync,
+                                 glfwGetTime, glfwSleep, glfwSwapInterval,
+                                 refresh=glfwGetWindowParam(GLFW_REFRESH_RATE) or 60.0)
     running = True
-    t = time.time()
-    rotation = 0.0
     while running:
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glUseProgram(prog)
-        glUniformMatrix4fv(mvploc, 1, GL_TRUE, hm.rotation(mvp, rotation,[0,1,0]).tolist())
-        # glBindVertexArray(vertobj)
-        glDrawArrays(GL_TRIANGLE_STRIP, 0, 14)
-        glDrawArrays(GL_POINTS, 0, 14)
-        glfwSwapBuffers()
-        # glfwPollEvents() # This would poll for key/mouse events manually.
-        # Do the rotation thing...
-        rotation += (time.time() - t) / 5 * 360
-        t = time.time()
+        with profile.frame():
+            frames.tick()
+            if events is not None:
+                handleEvents(events.drain())
+            with profile.span("assets"):
+                for asset in loader.update():
+                    if asset.ready and asset is meshrenderer:
+                        # The mesh renderer draws with the cube's program (which the shader watcher may have replaced).
+                        renderer.delete(program=False)
+                        asset.value.setProgram(renderer.prog)
+                        renderer = asset.value
+                        renderer.resize(*glfwGetWindowSize())
+                        if watcher is not None:
+                            watcher.unwatch(watched)
+                            watched = watchShaders(renderer)
+            if watcher is not None:
+                with profile.span("shaders"):
+                    watcher.poll()
         # Stop running if window gets closed.
         running = running and glfwGetWindowParam(GLFW_OPENED)
         
+    if frames.period is None:
+        print "Frames: %(frames)d, simulation steps: %(steps)d, skipped steps: %(skipped)d (no pacing, so no late frames)" % frames.stats()
+    else:
+        print "Frames: %(frames)d, simulation steps: %(steps)d, late: %(late)d, dropped: %(dropped)d, skipped steps: %(skipped)d" % frames.stats()
+    if recorder is not None:
+        recorder.finish()
+        print ("Captured: %(captured)d, dropped: %(dropped)d, latency: %(latency).1f frames (%(latencyms).2f ms), "
+               "%(cost).3f ms/frame, writer: %(throughput).1f MB/s") % recorder.stats()
+    if events is not None:
+        print "Events: %(received)d, coalesced: %(coalesced)d, overflowed: %(overflowed)d" % events.stats()
+    print "Draw calls: %(drawcalls)d, binds issued: %(binds)d, skipped: %(skipped)d" % renderer.queue.stats()
+    if args.profile:
+        profile.dump(args.profile)
+    loader.shutdown()
+    renderer.delete()
+    gl.delete()
     glfwTerminate()
\ No newline at end of file
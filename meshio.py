@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Meshio - mesh loading with a memory mapped binary cache.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import os
+import struct
+import hashlib
+import numpy as np
+import geometry
+
+# Vertices use the layout of the example: 4xPosition, 4xColor, all float32.
+# Meshes without colors get white vertices.
+VERTEX_FLOATS = 8
+
+# The binary container: a 48 byte header, the interleaved vertices, then the
+# (triangle list) indices. Everything is little endian. The header keeps the
+# size and modification time of the file the mesh was parsed from.
+MAGIC = b"GLFWMESH"
+VERSION = 3 # Bumped when parsing changes, so older cache entries get parsed again.
+_header = struct.Struct("<8sIIIIQd8x")
+
+class Mesh(object):
+    '''
+    Vertices as a (N,8) float32 array and triangle indices as a (M,) uint16
+    or uint32 array. Both may be memory mapped, and are contiguous, so they
+    can be handed to a VBO (or glBufferData) as they are, without a copy.
+    '''
+    def __init__(self, vertices, indices):
+        self.vertices = vertices
+        self.indices = indices
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def bounds(self):
+        '''The lower and upper corner of the positions, computed on the first call.'''
+        if self._bounds is None:
+            positions = self.vertices[:, :3]
+            self._bounds = positions.min(axis=0), positions.max(axis=0)
+        return self._bounds
+
+    def resident(self):
+        '''The mesh with its arrays read into memory (and its bounds computed), instead of memory mapped.'''
+        mesh = Mesh(np.array(self.vertices), np.array(self.indices))
+        mesh.bounds()
+        return mesh
+
+def _vertices(positions, colors=None):
+    vertices = np.ones((len(positions), VERTEX_FLOATS), dtype=np.float32)
+    vertices[:, :3] = positions[:, :3]
+    if colors is not None:
+        vertices[:, 4:4 + colors.shape[1]] = colors
+    return vertices
+
+def _indices(indices):
+    '''Stores the indices as uint16 where that is enough.'''
+    indices = np.asarray(indices).ravel()
+    if len(indices) and indices.max() < 65536:
+        return indices.astype(np.uint16)
+    return indices.astype(np.uint32)
+
+def _fan(faces):
+    '''Triangulates a list of polygons (or a (F,n) array of same sized ones) as fans.'''
+    if isinstance(faces, np.ndarray):
+        n = faces.shape[1]
+        return np.stack([faces[:, [0, i, i + 1]] for i in range(1, n - 1)], axis=1).reshape(-1, 3)
+    triangles = []
+    for face in faces:
+        for i in range(1, len(face) - 1):
+            triangles.append((face[0], face[i], face[i + 1]))
+    return np.array(triangles, dtype=np.uint32).reshape(-1, 3)
+
+def parseOBJ(filename):
+    '''
+    Parses a Wavefront OBJ file. Only positions (and the common "v x y z r g b"
+    vertex color extension) are used, polygons are triangulated as fans.
+    '''
+    positions = []
+    colors = []
+    faces = []
+    with open(filename) as f:
+        for line in f:
+            if line.startswith("v "):
+                values = line.split()
+                positions.append([float(v) for v in values[1:4]])
+                if len(values) >= 7:
+                    colors.append([float(v) for v in values[4:7]])
+            elif line.startswith("f "):
+                # "f v/vt/vn ...", indices start at 1, negative ones count from the end.
+                face = [int(v.split("/")[0]) for v in line.split()[1:]]
+                faces.append([i - 1 if i > 0 else len(positions) + i for i in face])
+    positions = np.array(positions, dtype=np.float32).reshape(-1, 3)
+    colors = np.array(colors, dtype=np.float32) if len(colors) == len(positions) and colors else None
+    return Mesh(_vertices(positions, colors), _indices(_fan(faces)))
+
+_plytypes = {"char" : "i1", "uchar" : "u1", "short" : "i2", "ushort" : "u2", "int" : "i4", "uint" : "u4",
+             "float" : "f4", "double" : "f8", "int8" : "i1", "uint8" : "u1", "int16" : "i2",
+             "uint16" : "u2", "int32" : "i4", "uint32" : "u4", "float32" : "f4", "float64" : "f8"}
+
+def parsePLY(filename):
+    '''
+    Parses a PLY file (ascii or binary little endian) with x/y/z and optional
+    red/green/blue(/alpha) vertex properties (integer colors are scaled from
+    0-255, float colors are taken as they are) and a face vertex index list.
+    Binary files need all faces to have the same number of vertices.
+    '''
+    with open(filename, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError("%s is no PLY file" % filename)
+        fmt = None
+        elements = []
+        while True:
+            words = f.readline().decode("ascii").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                fmt = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                elements[-1][2].append(words[1:])
+        if fmt not in ("ascii", "binary_little_endian"):
+            raise ValueError("Unsupported PLY format %s" % fmt)
+        data = {}
+        for name, count, props in elements:
+            if fmt == "ascii":
+                lines = [f.readline().split() for i in range(count)]
+                if props[0][0] == "list":
+                    data[name] = [[int(v) for v in l[1:]] for l in lines]
+                else:
+                    data[name] = np.array(lines, dtype=np.float64).reshape(count, len(props))
+            elif props[0][0] == "list":
+                # Peek at the first face for its size, then read them all in one go.
+                counttype, indextype = "<" + _plytypes[props[0][1]], "<" + _plytypes[props[0][2]]
+                start = f.tell()
+                n = int(np.frombuffer(f.read(np.dtype(counttype).itemsize), counttype)[0])
+                f.seek(start)
+                dtype = np.dtype([("n", counttype), ("i", indextype, (n,))])
+                faces = np.frombuffer(f.read(dtype.itemsize * count), dtype)
+                if count and np.any(faces["n"] != n):
+                    raise ValueError("Binary PLY files need faces of the same size")
+                data[name] = faces["i"]
+            else:
+                dtype = np.dtype([(p[1], "<" + _plytypes[p[0]]) for p in props])
+                data[name] = np.frombuffer(f.read(dtype.itemsize * count), dtype)
+        names = dict((name, [p[-1] for p in props]) for name, count, props in elements)
+        types = dict((p[-1], p[0]) for name, count, props in elements if name == "vertex" for p in props)
+    vertex = data["vertex"]
+    def column(prop):
+        if isinstance(vertex, np.ndarray) and vertex.dtype.names:
+            return vertex[prop].astype(np.float32)
+        return vertex[:, names["vertex"].index(prop)].astype(np.float32)
+    positions = np.stack([column(p) for p in ("x", "y", "z")], axis=1)
+    colors = None
+    colornames = [p for p in ("red", "green", "blue", "alpha") if p in names["vertex"]]
+    if len(colornames) >= 3:
+        # Integer colors go from 0 to 255, float ones are already from 0 to 1.
+        colors = np.stack([column(p) / 255.0 if np.dtype(_plytypes[types[p]]).kind in "iu" else column(p)
+                           for p in colornames], axis=1)
+    return Mesh(_vertices(positions, colors), _indices(_fan(data.get("face", []))))
+
+def _stamp(filename):
+    '''Size and modification time of a file, as stored in the container header.'''
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime
+
+def save(filename, mesh, stamp=(0, 0.0)):
+    '''Writes a mesh to the binary container, with the (size, mtime) stamp of its source.'''
+    vertices = np.ascontiguousarray(mesh.vertices, dtype=np.float32)
+    indices = _indices(mesh.indices)
+    # Write to a temporary file first, so a crash never leaves a truncated container.
+    tmp = filename + ".%d.tmp" % os.getpid()
+    with open(tmp, "wb") as f:
+        f.write(_header.pack(MAGIC, VERSION, len(vertices), len(indices), indices.dtype.itemsize,
+                             stamp[0], stamp[1]))
+        f.write(vertices.tobytes())
+        f.write(indices.tobytes())
+    os.rename(tmp, filename)
+
+def load(filename):
+    '''Memory maps a mesh from the binary container, nothing is read up front.'''
+    with open(filename, "rb") as f:
+        magic, version, nvertices, nindices, indexsize, size, mtime = _header.unpack(f.read(_header.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is no mesh container (of version %d)" % (filename, VERSION))
+    vertices = np.memmap(filename, dtype=np.float32, mode="r", offset=_header.size,
+                         shape=(nvertices, VERTEX_FLOATS))
+    indextype = np.uint16 if indexsize == 2 else np.uint32
+    indices = np.memmap(filename, dtype=indextype, mode="r", offset=_header.size + vertices.nbytes,
+                        shape=(nindices,)) if nindices else np.zeros(0, dtype=indextype)
+    return Mesh(vertices, indices)
+
+def _current(cached, stamp):
+    '''Whether the container cached exists and was written from a source with the given stamp.'''
+    try:
+        with open(cached, "rb") as f:
+            header = f.read(_header.size)
+    except IOError:
+        return False
+    if len(header) < _header.size:
+        return False
+    magic, version, nvertices, nindices, indexsize, size, mtime = _header.unpack(header)
+    return magic == MAGIC and version == VERSION and (size, mtime) == stamp
+
+_parsers = {".obj" : parseOBJ, ".ply" : parsePLY}
+
+def loadMesh(filename, cachedir=None, optimize=True):
+    '''
+    Loads an OBJ or PLY mesh. The first load parses the file, welds and
+    reorders it for the vertex cache (see geometry.optimize) and writes the
+    binary container into cachedir (next to the file by default). Later loads
+    memory map the container as long as the file still has the size and
+    modification time stored in it. The container is named after the file
+    and a hash of its absolute path, so files of the same name don't share it.
+    '''
+    ext = os.path.splitext(filename)[1]
+    if ext.lower() == ".mesh":
+        return load(filename)
+    key = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()[:16]
+    cached = os.path.join(cachedir if cachedir is not None else os.path.dirname(filename),
+                          "%s.%s.mesh" % (os.path.basename(filename), key))
+    stamp = _stamp(filename)
+    if _current(cached, stamp):
+        return load(cached)
+    mesh = _parsers[ext.lower()](filename)
+    if optimize and len(mesh.indices):
+        mesh = Mesh(*geometry.optimize(mesh.vertices, mesh.indices))
+    if cachedir is not None and not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    save(cached, mesh, stamp)
+    return load(cached)
+
+if __name__ == "__main__":
+    # Benchmark: parse a generated OBJ and PLY versus mapping the container.
+    import sys
+    import shutil
+    import timeit
+    import tempfile
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    # A n x n grid, 2 * n * n triangles.
+    u, v = np.meshgrid(np.linspace(0, 1, n + 1), np.linspace(0, 1, n + 1))
+    positions = np.stack([u.ravel(), v.ravel(), np.sin(u.ravel() * 6) * 0.1], axis=1)
+    quads = (np.arange(n)[None, :] + np.arange(n)[:, None] * (n + 1)).ravel()
+    triangles = np.concatenate([np.stack([quads, quads + 1, quads + n + 2], axis=1),
+                                np.stack([quads, quads + n + 2, quads + n + 1], axis=1)])
+    directory = tempfile.mkdtemp()
+    try:
+        obj = os.path.join(directory, "grid.obj")
+        with open(obj, "w") as f:
+            f.writelines("v %f %f %f\n" % tuple(p) for p in positions)
+            f.writelines("f %d %d %d\n" % tuple(t + 1) for t in triangles)
+        ply = os.path.join(directory, "gridply.ply")
+        with open(ply, "wb") as f:
+            f.write(("ply\nformat binary_little_endian 1.0\nelement vertex %d\nproperty float x\n"
+                     "property float y\nproperty float z\nelement face %d\nproperty list uchar int vertex_indices\n"
+                     "end_header\n" % (len(positions), len(triangles))).encode("ascii"))
+            f.write(positions.astype("<f4").tobytes())
+            faces = np.zeros(len(triangles), dtype=[("n", "u1"), ("i", "<i4", (3,))])
+            faces["n"] = 3
+            faces["i"] = triangles
+            f.write(faces.tobytes())
+        def touch(mesh):
+            # Memory mapping is lazy, so actually read the data for a fair comparison.
+            return float(mesh.vertices.sum()) + float(mesh.indices.sum())
+        loadMesh(obj)
+        print "%d vertices, %d triangles" % (len(positions), len(triangles))
+        for name, func in [("parse OBJ", lambda: touch(parseOBJ(obj))),
+                           ("parse PLY", lambda: touch(parsePLY(ply))),
+                           ("load container", lambda: touch(loadMesh(obj)))]:
+            print "%-15s %10.2f ms" % (name, min(timeit.repeat(func, number=1, repeat=3)) * 1000)
+    finally:
+        shutil.rmtree(directory)
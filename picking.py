@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Picking - ray casts against meshes through a bounding volume hierarchy.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import numpy as np
+
+def unproject(x, y, width, height, mvp):
+    '''
+    The ray through the window pixel x,y (with the origin at the top left,
+    like glfwGetMousePos) as (origin, direction), in the space mvp maps from:
+    object space for the full model-view-projection, world space for only
+    the view projection. The origin lies on the near plane and
+    origin + direction on the far plane, so the ray parameter t of a hit is
+    comparable across objects with different model matrices.
+    '''
+    nx = 2.0 * (x + 0.5) / width - 1
+    ny = 1 - 2.0 * (y + 0.5) / height
+    inverse = np.linalg.inv(np.asarray(mvp, dtype=np.float64))
+    near = np.dot(inverse, (nx, ny, -1, 1))
+    far = np.dot(inverse, (nx, ny, 1, 1))
+    near = near[:3] / near[3]
+    return near, far[:3] / far[3] - near
+
+def _morton(points):
+    '''30 bit Morton codes of points (N,3), scaled to the bounds of all points.'''
+    lower = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lower, 1e-30)
+    cells = np.clip((points - lower) / extent * 1024, 0, 1023).astype(np.uint32)
+    # Spreads the 10 bits of every coordinate out to every third bit.
+    cells = (cells | (cells << 16)) & 0x030000FF
+    cells = (cells | (cells << 8)) & 0x0300F00F
+    cells = (cells | (cells << 4)) & 0x030C30C3
+    cells = (cells | (cells << 2)) & 0x09249249
+    return (cells[:, 0] << 2) | (cells[:, 1] << 1) | cells[:, 2]
+
+class BVH(object):
+    '''
+    A bounding volume hierarchy over the triangles of a mesh, flattened into
+    arrays. The triangles are sorted along a Morton curve and cut into leaves
+    of leafsize consecutive triangles; the tree above them is complete
+    (padded with empty leaves), stored like a heap: the children of node i
+    are 2i+1 and 2i+2, and every level is one contiguous range. So both the
+    building (a sort and a min/max per level) and the traversal (all nodes
+    of a level at once) are a few NumPy calls per level.
+
+    positions is a (V,3+) array of vertex positions, indices the flat index
+    array of the triangles, like meshio.Mesh has them. Moving vertices need
+    a refit(), a moving object doesn't: cast a ray in its object space.
+    '''
+    def __init__(self, positions, indices, leafsize=4):
+        self.positions = np.array(positions, dtype=np.float32)[:, :3]
+        triangles = np.asarray(indices).reshape(-1, 3)
+        self.count = len(triangles)
+        self.leafsize = leafsize
+        centroids = self.positions[triangles].mean(axis=1)
+        # The original index of each sorted triangle, and the sorted position of each original one.
+        self.order = np.argsort(_morton(centroids), kind="mergesort")
+        self.rank = np.empty_like(self.order)
+        self.rank[self.order] = np.arange(self.count)
+        self.triangles = np.ascontiguousarray(triangles[self.order], dtype=np.int32)
+        leaves = max(1, -(-self.count // leafsize))
+        self.depth = int(np.ceil(np.log2(leaves)))
+        self.leaves = 1 << self.depth
+        self.lower = np.empty((2 * self.leaves - 1, 3), dtype=np.float32)
+        self.upper = np.empty((2 * self.leaves - 1, 3), dtype=np.float32)
+        # Per triangle corner and edges for the intersection, and bounds for the leaves.
+        padded = self.leaves * leafsize
+        self.v0 = np.zeros((self.count, 3), dtype=np.float32)
+        self.e1 = np.zeros((self.count, 3), dtype=np.float32)
+        self.e2 = np.zeros((self.count, 3), dtype=np.float32)
+        self.trilower = np.full((padded, 3), np.inf, dtype=np.float32)
+        self.triupper = np.full((padded, 3), -np.inf, dtype=np.float32)
+        self.refit()
+
+    def _triangles(self, which):
+        '''Updates the corners, edges and bounds of the triangles at the sorted positions which (indices or a slice).'''
+        corners = self.positions[self.triangles[which]]
+        self.v0[which] = corners[:, 0]
+        self.e1[which] = corners[:, 1] - corners[:, 0]
+        self.e2[which] = corners[:, 2] - corners[:, 0]
+        self.trilower[which] = corners.min(axis=1)
+        self.triupper[which] = corners.max(axis=1)
+
+    def refit(self, positions=None, triangles=None):
+        '''
+        Updates the bounds after vertices moved, with the new positions (V,3+)
+        if given (or after writing into self.positions). If the (original)
+        indices of the triangles that moved are given, only their leaves and
+        the nodes above them are updated.
+        Returns the number of nodes updated.
+        '''
+        if positions is not None:
+            self.positions[:] = np.asarray(positions)[:, :3]
+        first = self.leaves - 1
+        size = self.leafsize
+        if triangles is None:
+            self._triangles(slice(0, self.count))
+            self.lower[first:] = self.trilower.reshape(self.leaves, size, 3).min(axis=1)
+            self.upper[first:] = self.triupper.reshape(self.leaves, size, 3).max(axis=1)
+            for level in range(self.depth - 1, -1, -1):
+                start, end = (1 << level) - 1, (2 << level) - 1
+                self.lower[start:end] = np.minimum(self.lower[end::2][:end - start], self.lower[end + 1::2][:end - start])
+                self.upper[start:end] = np.maximum(self.upper[end::2][:end - start], self.upper[end + 1::2][:end - start])
+            return len(self.lower)
+        which = self.rank[np.asarray(triangles)]
+        self._triangles(which)
+        leaves = np.unique(which // size)
+        rows = leaves[:, None] * size + np.arange(size)
+        nodes = leaves + first
+        self.lower[nodes] = self.trilower[rows].min(axis=1)
+        self.upper[nodes] = self.triupper[rows].max(axis=1)
+        updated = len(nodes)
+        while nodes[0] > 0:
+            nodes = np.unique((nodes - 1) // 2)
+            self.lower[nodes] = np.minimum(self.lower[2 * nodes + 1], self.lower[2 * nodes + 2])
+            self.upper[nodes] = np.maximum(self.upper[2 * nodes + 1], self.upper[2 * nodes + 2])
+            updated += len(nodes)
+        return updated
+
+    def intersect(self, origin, direction, tmax=np.inf):
+        '''
+        Casts the ray origin + t * direction, for 0 <= t <= tmax, against
+        the triangles. Returns (t, triangle, u, v) of the closest hit, with
+        the index of the triangle in the mesh and the barycentric
+        coordinates of the hit on it, or None. Both sides of a triangle hit.
+        '''
+        origin = np.asarray(origin, dtype=np.float64)[:3]
+        direction = np.asarray(direction, dtype=np.float64)[:3]
+        # A zero component would make 0 * inf (NaN) in the slab test.
+        safe = np.where(np.abs(direction) < 1e-30, 1e-30, direction)
+        inverse = 1 / safe
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(self.depth + 1):
+            lower, upper = self.lower[nodes], self.upper[nodes]
+            t1 = (lower - origin) * inverse
+            t2 = (upper - origin) * inverse
+            tnear = np.minimum(t1, t2).max(axis=1)
+            tfar = np.maximum(t1, t2).min(axis=1)
+            # The empty padding (lower +inf, upper -inf) would pass the slab test with tnear -inf, tfar +inf.
+            nonempty = lower[:, 0] <= upper[:, 0]
+            nodes = nodes[nonempty & (tnear <= tfar) & (tfar >= 0) & (tnear <= tmax)]
+            if not len(nodes):
+                return None
+            if level < self.depth:
+                nodes = (2 * nodes[:, None] + (1, 2)).ravel()
+        candidates = ((nodes - (self.leaves - 1))[:, None] * self.leafsize + np.arange(self.leafsize)).ravel()
+        candidates = candidates[candidates < self.count]
+        # Möller-Trumbore, for all candidates at once.
+        e1, e2 = self.e1[candidates], self.e2[candidates]
+        p = np.cross(direction, e2)
+        det = np.einsum("ij,ij->i", e1, p)
+        hit = np.abs(det) > 1e-12
+        det = np.where(hit, det, 1)
+        s = origin - self.v0[candidates]
+        u = np.einsum("ij,ij->i", s, p) / det
+        q = np.cross(s, e1)
+        v = np.dot(q, direction) / det
+        t = np.einsum("ij,ij->i", e2, q) / det
+        hit &= (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= tmax)
+        if not hit.any():
+            return None
+        i = np.flatnonzero(hit)[np.argmin(t[hit])]
+        return float(t[i]), int(self.order[candidates[i]]), float(u[i]), float(v[i])
+
+def pick(bvh, x, y, width, height, mvp):
+    '''The closest hit (see BVH.intersect) of the mesh drawn with mvp under the window pixel x,y.'''
+    origin, direction = unproject(x, y, width, height, mvp)
+    return bvh.intersect(origin, direction)
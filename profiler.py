@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Profiler - per frame CPU and GPU timings of named spans.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import json
+import ctypes
+import timeit
+import numpy as np
+from OpenGL.GL import *
+# The wrapped version has no numpy mapping for 64 bit results.
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v as _glGetQueryObjectui64v
+
+class _NullSpan(object):
+    '''What span() returns while profiling is disabled.'''
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+_nullspan = _NullSpan()
+
+class _Span(object):
+    '''A named span, one per name and reused every frame.'''
+    def __init__(self, profiler, column):
+        self.profiler = profiler
+        self.column = column
+
+    def __enter__(self):
+        p = self.profiler
+        if p._queries is not None:
+            glQueryCounter(p._queries[p._set][self.column, 0], GL_TIMESTAMP)
+            p._used[p._set][self.column] = True
+        p.cpu_start[p._row, self.column] = p._timer() - p._epoch
+        return self
+
+    def __exit__(self, *exc):
+        p = self.profiler
+        p.cpu_time[p._row, self.column] = p._timer() - p._epoch - p.cpu_start[p._row, self.column]
+        if p._queries is not None:
+            glQueryCounter(p._queries[p._set][self.column, 1], GL_TIMESTAMP)
+        return False
+
+class Profiler(object):
+    '''
+    Measures named spans of a frame on the CPU and, with GL_TIMESTAMP
+    queries, on the GPU. The last capacity frames are kept in a ring buffer
+    (times in seconds, NaN where a span did not run). The GPU queries are
+    read latency frames later, and only if their results are available, so
+    they never stall; otherwise the GPU times of that frame are dropped.
+
+        with profiler.frame():
+            with profiler.span("draw"):
+                ...
+
+    Each span should run at most once per frame. When disabled, span() and
+    frame() return a shared do-nothing context.
+    '''
+    def __init__(self, enabled=True, capacity=1024, gpu=True, maxspans=16, latency=2):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.maxspans = maxspans
+        self.latency = latency
+        self.names = []
+        self.frames = 0
+        self.dropped = 0
+        self.frame_start = np.full(capacity, np.nan)
+        self.frame_time = np.full(capacity, np.nan)
+        self.cpu_start = np.full((capacity, maxspans), np.nan)
+        self.cpu_time = np.full((capacity, maxspans), np.nan)
+        self.gpu_start = np.full((capacity, maxspans), np.nan)
+        self.gpu_time = np.full((capacity, maxspans), np.nan)
+        self._spans = {}
+        self._gpu = gpu
+        self._queries = None
+        self._timer = timeit.default_timer
+        self._epoch = self._timer()
+        self._gpuepoch = None
+        self._row = 0
+        self._set = 0
+
+    def span(self, name):
+        '''The context to measure the span name with.'''
+        if not self.enabled:
+            return _nullspan
+        s = self._spans.get(name)
+        if s is None:
+            if len(self.names) == self.maxspans:
+                raise ValueError("More than %d spans" % self.maxspans)
+            s = self._spans[name] = _Span(self, len(self.names))
+            self.names.append(name)
+        return s
+
+    def frame(self):
+        '''The context around a whole frame.'''
+        if not self.enabled:
+            return _nullspan
+        return self
+
+    def __enter__(self):
+        self.beginFrame()
+        return self
+
+    def __exit__(self, *exc):
+        self.endFrame()
+        return False
+
+    def beginFrame(self):
+        if not self.enabled:
+            return
+        if self._gpu and self._queries is None:
+            # Created on the first frame, as a context is needed. Timer queries are GL 3.3 or ARB_timer_query.
+            self._gpu = bool(glQueryCounter)
+            if self._gpu:
+                ids = glGenQueries(self.latency * self.maxspans * 2)
+                self._queries = np.asarray(ids, dtype=np.uint32).reshape(self.latency, self.maxspans, 2)
+                self._used = np.zeros((self.latency, self.maxspans), dtype=bool)
+                self._rows = np.full(self.latency, -1)
+                self._result = ctypes.c_uint64(0)
+        self._row = self.frames % self.capacity
+        self.frame_time[self._row] = np.nan
+        self.cpu_start[self._row] = np.nan
+        self.cpu_time[self._row] = np.nan
+        self.gpu_start[self._row] = np.nan
+        self.gpu_time[self._row] = np.nan
+        if self._queries is not None:
+            self._set = self.frames % self.latency
+            self._collect(self._set)
+            self._rows[self._set] = self._row
+        self.frame_start[self._row] = self._timer() - self._epoch
+
+    def endFrame(self):
+        if not self.enabled:
+            return
+        self.frame_time[self._row] = self._timer() - self._epoch - self.frame_start[self._row]
+        self.frames += 1
+
+    def _query(self, query, pname):
+        _glGetQueryObjectui64v(int(query), pname, ctypes.byref(self._result))
+        return self._result.value
+
+    def _collect(self, qset):
+        '''Reads the GPU times of the frame that last used the query set, if they are ready.'''
+        used = np.flatnonzero(self._used[qset])
+        row = self._rows[qset]
+        self._used[qset] = False
+        if row < 0 or not len(used):
+            return
+        queries = self._queries[qset]
+        # Queries complete in order, so the last one tells about all of them.
+        if not self._query(queries[used[-1], 1], GL_QUERY_RESULT_AVAILABLE):
+            self.dropped += 1
+            return
+        for column in used:
+            start = self._query(queries[column, 0], GL_QUERY_RESULT)
+            end = self._query(queries[column, 1], GL_QUERY_RESULT)
+            if self._gpuepoch is None:
+                # Line the GPU clock up with the CPU clock, as good as it gets.
+                self._gpuepoch = start - int((self.cpu_start[row, column]) * 1e9)
+            self.gpu_start[row, column] = (start - self._gpuepoch) * 1e-9
+            self.gpu_time[row, column] = (end - start) * 1e-9
+
+    def _ordered(self):
+        '''Indices of the rows in the ring buffer, oldest first.'''
+        n = min(self.frames, self.capacity)
+        return (np.arange(n) + self.frames - n) % self.capacity
+
+    def summary(self):
+        '''Mean, p50 and p99 (in ms) for the frame and each span, on CPU and GPU.'''
+        rows = self._ordered()
+        def stats(times):
+            times = times[~np.isnan(times)] * 1000
+            if not len(times):
+                return None
+            return {"mean" : float(times.mean()),
+                    "p50"  : float(np.percentile(times, 50)),
+                    "p99"  : float(np.percentile(times, 99))}
+        result = {"frames" : len(rows), "gpu_dropped" : self.dropped,
+                  "frame" : stats(self.frame_time[rows]), "spans" : {}}
+        for column, name in enumerate(self.names):
+            result["spans"][name] = {"cpu" : stats(self.cpu_time[rows, column]),
+                                     "gpu" : stats(self.gpu_time[rows, column])}
+        return result
+
+    def trace(self):
+        '''The recorded frames as events in the Chrome trace format (chrome://tracing).'''
+        events = []
+        def add(name, tid, start, duration):
+            if not np.isnan(start) and not np.isnan(duration):
+                events.append({"name" : name, "ph" : "X", "pid" : 0, "tid" : tid,
+                               "ts" : start * 1e6, "dur" : duration * 1e6})
+        for row in self._ordered():
+            add("frame", "CPU", self.frame_start[row], self.frame_time[row])
+            for column, name in enumerate(self.names):
+                add(name, "CPU", self.cpu_start[row, column], self.cpu_time[row, column])
+                add(name, "GPU", self.gpu_start[row, column], self.gpu_time[row, column])
+        return {"traceEvents" : events, "displayTimeUnit" : "ms"}
+
+    def dump(self, filename):
+        '''Writes the summary as JSON, or the Chrome trace if filename ends in .trace.json.'''
+        data = self.trace() if filename.endswith(".trace.json") else self.summary()
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=1)
+
+    def delete(self):
+        if self._queries is not None:
+            glDeleteQueries(self._queries.size, self._queries.ravel())
+            self._queries = None
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Quat - batched quaternions, a companion to hommat.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import numpy as np
+from math import pi
+
+# Quaternions are stored as (..., 4) arrays in (x, y, z, w) order, so a single
+# quaternion is a (4,) array and N of them are a (N,4) array. All functions
+# work on arbitrary leading dimensions.
+
+def identity(n=None):
+    '''Create the identity quaternion (or n of them).'''
+    q = np.zeros((4,) if n is None else (n, 4), dtype=np.float64)
+    q[..., 3] = 1
+    return q
+
+def fromaxisangle(angles, dirs):
+    '''Creates rotations around dirs by angles (in degrees, like hommat.rotation).'''
+    angles = np.asarray(angles, dtype=np.float64) * (pi / 360.0)
+    dirs = np.asarray(dirs, dtype=np.float64)[..., :3]
+    dirs = dirs / np.linalg.norm(dirs, axis=-1)[..., None]
+    shape = np.broadcast(angles[..., None], dirs).shape
+    q = np.empty(shape[:-1] + (4,), dtype=np.float64)
+    q[..., :3] = dirs * np.sin(angles)[..., None]
+    q[..., 3] = np.cos(angles)
+    return q
+
+def normalize(q):
+    '''Scales the quaternions to unit length.'''
+    q = np.asarray(q, dtype=np.float64)
+    return q / np.linalg.norm(q, axis=-1)[..., None]
+
+def conjugate(q):
+    '''Conjugates the quaternions, which is the inverse for unit quaternions.'''
+    q = np.array(q, dtype=np.float64)
+    q[..., :3] *= -1
+    return q
+
+def multiply(a, b):
+    '''Composes the rotations, so that a * b rotates by b first and then by a.'''
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    ax, ay, az, aw = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    bx, by, bz, bw = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    q = np.empty(np.broadcast(a, b).shape, dtype=np.float64)
+    q[..., 0] = aw * bx + ax * bw + ay * bz - az * by
+    q[..., 1] = aw * by - ax * bz + ay * bw + az * bx
+    q[..., 2] = aw * bz + ax * by - ay * bx + az * bw
+    q[..., 3] = aw * bw - ax * bx - ay * by - az * bz
+    return q
+
+def _shortest(a, b):
+    '''Flips b where needed, so the interpolation takes the shorter arc.'''
+    d = np.sum(a * b, axis=-1)
+    b = np.where((d < 0)[..., None], -b, b)
+    return b, np.abs(d)
+
+def nlerp(a, b, t):
+    '''Normalized linear interpolation between a and b. t broadcasts against a[..., 0].'''
+    a = np.asarray(a, dtype=np.float64)
+    b, d = _shortest(a, np.asarray(b, dtype=np.float64))
+    t = np.asarray(t, dtype=np.float64)[..., None]
+    return normalize(a + t * (b - a))
+
+def slerp(a, b, t):
+    '''Spherical linear interpolation between a and b. t broadcasts against a[..., 0].'''
+    a = np.asarray(a, dtype=np.float64)
+    b, d = _shortest(a, np.asarray(b, dtype=np.float64))
+    t = np.asarray(t, dtype=np.float64)[..., None]
+    theta = np.arccos(np.clip(d, -1.0, 1.0))[..., None]
+    sint = np.sin(theta)
+    # Nearly identical rotations would divide by ~0, nlerp is exact enough there.
+    near = sint < 1e-6
+    sint = np.where(near, 1.0, sint)
+    wa = np.where(near, 1 - t, np.sin((1 - t) * theta) / sint)
+    wb = np.where(near, t, np.sin(t * theta) / sint)
+    return normalize(wa * a + wb * b)
+
+def sample(times, keys, t, interpolate=slerp):
+    '''
+    Samples keyframed rotations at time(s) t. times is a sorted (K,) array and
+    keys is a (K, ..., 4) array, e.g. (K,N,4) for N objects sharing keyframe
+    times. Times outside the keyframes are clamped, a single keyframe is
+    returned for any time.
+    '''
+    times = np.asarray(times, dtype=np.float64)
+    keys = np.asarray(keys, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    if len(times) == 0:
+        raise ValueError("Cannot sample rotations without keyframes.")
+    if len(times) == 1:
+        return np.broadcast_to(keys[0], t.shape + keys.shape[1:]).copy()
+    i = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 2)
+    u = np.clip((t - times[i]) / (times[i + 1] - times[i]), 0.0, 1.0)
+    return interpolate(keys[i], keys[i + 1], u)
+
+def matrices(q, out=None):
+    '''Converts the (unit) quaternions to a (...,4,4) float32 stack of rotation matrices.'''
+    q = np.asarray(q, dtype=np.float64)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    if out is None:
+        out = np.zeros(q.shape[:-1] + (4, 4), dtype=np.float32)
+    else:
+        out[...] = 0
+    out[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    out[..., 0, 1] = 2 * (x * y - z * w)
+    out[..., 0, 2] = 2 * (x * z + y * w)
+    out[..., 1, 0] = 2 * (x * y + z * w)
+    out[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    out[..., 1, 2] = 2 * (y * z - x * w)
+    out[..., 2, 0] = 2 * (x * z - y * w)
+    out[..., 2, 1] = 2 * (y * z + x * w)
+    out[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    out[..., 3, 3] = 1
+    return out
+
+def rotations(old, q, out=None):
+    '''Multiplies the old matrix (or stack) with the rotations of the quaternions, like hommat.rotations.'''
+    return np.matmul(old, matrices(q), out=out)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Render - the cube scene of the example, shared by all the backends
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import numpy as np
+import shaderutil
+import hommat as hm
+import culling
+import drawqueue
+import gldispatch
+import geometry
+import instancing
+import picking
+import profiler
+import uniformblock
+from OpenGL.GL import *
+from OpenGL.arrays.vbo import VBO
+try:
+    from OpenGL.GL.ARB.vertex_array_object import *
+except RuntimeError:
+    # Newer PyOpenGL versions refuse to wrap the VAO functions twice, but
+    # export the core ones with OpenGL.GL already.
+    pass
+
+# A triangle strip for a cube. Layout is 4xPosition, 4xColor
+cubedata = np.array([-1,-1, 1, 1, 0, 0, 0, 0, #1
+                      1,-1, 1, 1, 1, 0, 0, 0, #2
+                      1, 1, 1, 1, 1, 1, 0, 0, #3
+                      1,-1,-1, 1, 1, 0, 1, 0, #4
+                      1, 1,-1, 1, 1, 1, 1, 0, #5
+                     -1, 1,-1, 1, 0, 1, 1, 0, #6
+                      1, 1, 1, 1, 1, 1, 0, 0, #7
+                     -1, 1, 1, 1, 0, 1, 0, 0, #8
+                     -1,-1, 1, 1, 0, 0, 0, 0, #9
+                     -1, 1,-1, 1, 0, 1, 1, 0, #10
+                     -1,-1,-1, 1, 0, 0, 1, 0, #11
+                      1,-1,-1, 1, 1, 0, 1, 0, #12
+                     -1,-1, 1, 1, 0, 0, 0, 0, #13
+                      1,-1, 1, 1, 1, 0, 0, 0, #14
+                    ], dtype = np.float32)
+                    
+# The strip welded into 8 vertices and an indexed triangle list.
+cubevertices, cubeindices = geometry.optimize(cubedata.reshape(-1, 8), geometry.stripTriangles(14))
+                    
+campos = np.array([2.5, 1.5, 2.5, 1], dtype = np.float32)
+center = np.array([0.0,0.0,0.0,1.0], dtype = np.float32)
+yaxis = (0, 1, 0)
+
+# Uniform buffer binding points of the blocks in the shaders.
+FRAME_BINDING = 0  # Frame { mat4 viewprojection; } in shader_instanced.vs
+OBJECT_BINDING = 1 # Object { mat4 mvp; } in shader.vs
+
+def cubeGrid(n):
+    '''
+    Places n small cubes on a grid around the center. Returns their (N,4,4)
+    base transformations, their bounding sphere centers and radius.
+    '''
+    side = int(np.ceil(n ** (1.0 / 3)))
+    spacing = 4.0 / side
+    idx = np.arange(n)
+    centers = np.zeros((n, 3), dtype=np.float32)
+    centers[:, 0] = idx % side
+    centers[:, 1] = (idx // side) % side
+    centers[:, 2] = idx // (side * side)
+    centers = (centers - (side - 1) / 2.0) * spacing
+    size = spacing * 0.3
+    base = hm.scales(hm.translations(hm.identity(), centers), np.full((n, 3), size))
+    return base, centers, size * np.sqrt(3)
+
+class Renderer(object):
+    '''
+    Sets up the GL state, shader, VAO and VBO of the example and draws the
+    rotating cube (or a grid of instanced cubes). Needs a current context.
+    Instead of the cube, a meshio.Mesh may be drawn, scaled to the cube's size.
+    The parts of a frame are measured as spans of the given Profiler, the
+    GL calls per frame go through the given gldispatch.Dispatch. A program
+    linked from the same shader files may be passed as prog, to skip building
+    it again.
+    '''
+    def __init__(self, instances=0, cache=None, campos=campos, profile=None, mesh=None, gl=None, prog=None):
+        self.instances = instances
+        self.gl = gl or gldispatch.default()
+        self.profile = profile or profiler.Profiler(enabled=False)
+        self.fit = hm.identity()
+        if mesh is None:
+            vertices, indices = cubevertices, cubeindices
+        else:
+            vertices, indices = mesh.vertices, mesh.indices
+            # Fit the mesh into the cube from -1 to 1.
+            lower, upper = mesh.bounds()
+            fit = hm.scale(hm.identity(), [2.0 / max(upper - lower)] * 3)
+            self.fit = hm.translation(fit, -(lower + upper) / 2)
+        # The fit goes right before the vertices, so the rotations happen about the center of the fitted mesh.
+        self.modelview_mat = hm.lookat(hm.identity(), campos, center)
+        self.rotated = hm.identity()
+        self.points = mesh is None
+        self.vertices, self.indices = vertices, indices
+        self.bvh = None
+        self.viewport = None
+        self.nvertices = len(vertices)
+        self.count = len(indices)
+        self.indextype = GL_UNSIGNED_SHORT if indices.dtype == np.uint16 else GL_UNSIGNED_INT
+        self.perspective_mat = None
+        self.mvp = None
+        self.frustum = None
+
+        # Set up OpenGL Stuff.
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_CULL_FACE)
+        glClearColor(1, 1, 1, 0)
+        glPointSize(5)
+        # Set up the shader.
+        if instances:
+            self.shaderfiles = ("./shader_instanced.vs", "./shader.fs")
+            self.blockname, self.binding, mvpname = "Frame", FRAME_BINDING, "viewprojection"
+        else:
+            self.shaderfiles = ("./shader.vs", "./shader.fs")
+            self.blockname, self.binding, mvpname = "Object", OBJECT_BINDING, "mvp"
+        if prog is None:
+            prog = shaderutil.createProgram(self.shaderfiles[0], self.shaderfiles[1], cache=cache)
+        self.prog = prog
+        self.prog.bindBlock(self.blockname, self.binding)
+        # The matrix lives in the uniform buffer's numpy record, so it's computed right where it gets uploaded from.
+        self.block = uniformblock.UniformBuffer([(mvpname, "mat4")])
+        self.frame_mvp = self.block.data[mvpname][0]
+        # The program already knows all its locations, no need to ask GL again.
+        positionloc = self.prog.attribute("vs_position")
+        colorloc = self.prog.attribute("vs_color")
+
+        # Setup VAO
+        self.vertobj = int(glGenVertexArrays(1))
+        glBindVertexArray(self.vertobj)
+        # Setup the VBO (using the fancy VBO Object from pyopengl, doing it "manually" would also be a possibility)
+        self.vertbuf = VBO(vertices, GL_STATIC_DRAW)
+        self.vertbuf.bind()
+        glEnableVertexAttribArray(positionloc)
+        glEnableVertexAttribArray(colorloc)
+        glVertexAttribPointer(positionloc, 4, GL_FLOAT, GL_TRUE, 8 * 4, self.vertbuf+0) # "+0" since we need to create an offset.
+        glVertexAttribPointer(colorloc, 4, GL_FLOAT, GL_TRUE, 8 * 4, self.vertbuf+16) # 4 * 4 Bytes per float.
+        self.vertbuf.unbind() # We can unbind the VBO, since it's linked to the VAO
+        # The index buffer binding is part of the VAO state, so this one stays bound.
+        self.indexbuf = VBO(indices, GL_STATIC_DRAW, GL_ELEMENT_ARRAY_BUFFER)
+        self.indexbuf.bind()
+        if instances:
+            # The per instance model matrices and colors go into a second buffer on the same VAO.
+            self.instbuf = instancing.InstanceBuffer(self.prog.attribute("vs_model"),
+                                                     self.prog.attribute("vs_instcolor"),
+                                                     instances)
+            self.instbase, self.instcenters, self.instradius = cubeGrid(instances)
+            self.instphase = np.linspace(0, 360, instances, endpoint=False)
+            self.instcolors = np.random.uniform(0.5, 1, (instances, 4)).astype(np.float32)
+            self.instangles = np.empty(instances)
+            self.instmodels = np.empty((instances, 4, 4), dtype=np.float32)
+            self.instrotated = np.empty((instances, 4, 4), dtype=np.float32) if mesh is not None else None
+        # glBindVertexArray(0)
+
+        # The draw items are built once and submitted every frame, the uniform buffer is updated in place.
+        self.queue = drawqueue.DrawQueue(drawqueue.GLState(self.gl))
+        blocks = [(self.binding,) + self.block.range()]
+        self.items = [drawqueue.DrawItem(self.prog, self.vertobj, GL_TRIANGLES, self.count,
+                                         indextype=self.indextype, blocks=blocks)]
+        if self.points:
+            self.items.append(drawqueue.DrawItem(self.prog, self.vertobj, GL_POINTS, self.nvertices,
+                                                 blocks=blocks))
+
+    def setProgram(self, prog):
+        '''Draws with prog from the next frame on, e.g. a reloaded program with the same attribute locations.'''
+        self.prog = prog
+        prog.bindBlock(self.blockname, self.binding)
+        for item in self.items:
+            item.program = prog
+        self.queue.state.invalidate()
+
+    def lookAt(self, eye, at=center):
+        '''Moves the camera to eye, looking at at. Needs a resize() before, like draw().'''
+        self.modelview_mat = hm.lookat(hm.identity(), eye, at)
+        self.project()
+
+    def delete(self, program=True):
+        '''
+        Frees the buffers, the VAO and the program (unless program is False,
+        when another Renderer took it over). Call before the context goes away.
+        '''
+        self.vertbuf.delete()
+        self.indexbuf.delete()
+        if self.instances:
+            self.instbuf.delete()
+        glDeleteVertexArrays(1, [self.vertobj])
+        self.block.delete()
+        if program:
+            glDeleteProgram(self.prog)
+        self.queue.state.invalidate()
+
+    def resize(self, width, height):
+        glViewport(0, 0, width, height)
+        self.viewport = (width, height)
+        self.perspective_mat = hm.perspective(hm.identity(), 70, float(width) / height, 0.1, 10.0)
+        self.project()
+
+    def project(self):
+        '''Updates the view projection (and the frustum) from the current matrices.'''
+        self.mvp = np.dot(self.perspective_mat, self.modelview_mat)
+        self.frustum = culling.frustumplanes(self.mvp)
+        if self.instances:
+            # The cubes move by themselves, the view projection only changes here.
+            np.copyto(self.frame_mvp, self.mvp)
+            self.block.upload()
+
+    def pick(self, x, y):
+        '''
+        The triangle under the window pixel x,y in the last frame, as
+        (t, triangle, u, v) (see picking.BVH.intersect), or None. The
+        hierarchy is built on the first call. Only for the single object,
+        the instanced cubes aren't pickable.
+        '''
+        if self.instances:
+            return None
+        if self.bvh is None:
+            self.bvh = picking.BVH(self.vertices, self.indices)
+        width, height = self.viewport
+        return picking.pick(self.bvh, x, y, width, height, self.frame_mvp)
+
+    def draw(self, rotation):
+        '''Draws a frame with the cube(s) rotated by rotation degrees.'''
+        p = self.profile
+        with p.span("clear"):
+            self.gl.glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if self.instances:
+            # Animate all cubes in one batched call, and upload only the visible ones.
+            with p.span("animate"):
+                np.add(self.instphase, rotation, out=self.instangles)
+                if self.instrotated is None:
+                    hm.rotations(self.instbase, self.instangles, yaxis, out=self.instmodels)
+                else:
+                    hm.rotations(self.instbase, self.instangles, yaxis, out=self.instrotated)
+                    np.matmul(self.instrotated, self.fit, out=self.instmodels)
+                visible = culling.spheres(self.frustum, self.instcenters, self.instradius)
+            with p.span("upload"):
+                self.instbuf.update(self.instmodels[visible], self.instcolors[visible])
+                self.items[0].instances = self.instbuf.count
+        else:
+            with p.span("upload"):
+                hm.rotation(self.mvp, rotation, yaxis, out=self.rotated)
+                np.dot(self.rotated, self.fit, out=self.frame_mvp)
+                self.block.upload()
+        with p.span("draw"):
+            # Program, VAO and uniform buffer ranges are only bound again when needed.
+            for item in self.items:
+                self.queue.submit(item)
+            self.queue.flush()
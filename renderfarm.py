@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Renderfarm - renders batches of views on a pool of headless processes.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import os
+import sys
+import argparse
+import traceback
+import timeit
+import multiprocessing
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+import headless
+
+# Messages of the workers on the result queue: (kind, worker, index, slot, seconds, generation).
+READY = "ready"
+FRAME = "frame"
+ERROR = "error"
+
+def orbit(n, radius=3.5, height=1.5, turns=1.0):
+    '''
+    n views on a circle of radius around the y axis at height, as an (n,4)
+    array of camera position and rotation (all zero) for RenderFarm.render().
+    '''
+    angles = np.linspace(0, 2 * np.pi * turns, n, endpoint=False)
+    views = np.zeros((n, 4), dtype=np.float32)
+    views[:, 0] = radius * np.cos(angles)
+    views[:, 1] = height
+    views[:, 2] = radius * np.sin(angles)
+    return views
+
+def _work(worker, width, height, options, frames, tasks, results, released, current):
+    '''
+    The loop of a worker process: creates the context, framebuffer and
+    renderer once, then renders every view of the shards it gets from tasks
+    into a free slot of the shared frames, until it gets None. Views of
+    another generation than current (a cancelled render()) are skipped.
+    '''
+    try:
+        context = headless.createContext(options["backend"])
+        import shaderutil
+        import render
+        from OpenGL.GL import glGetString, GL_RENDERER
+        framebuffer = headless.Framebuffer(width, height)
+        cache = shaderutil.ProgramCache(options["cache"]) if options["cache"] else None
+        renderer = render.Renderer(options["instances"], cache, mesh=options["mesh"])
+        renderer.resize(width, height)
+        slots = np.frombuffer(frames, dtype=np.uint8).reshape(-1, height, width, 3)
+        results.put((READY, worker, None, glGetString(GL_RENDERER), None, None))
+        timer = timeit.default_timer
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            generation, start, views = task
+            for i, view in enumerate(views):
+                if generation != current.value:
+                    break
+                # Blocks until the parent is done with one of our slots.
+                slot = released.get()
+                if generation != current.value:
+                    released.put(slot)
+                    break
+                t = timer()
+                renderer.lookAt(view[:3])
+                renderer.draw(view[3])
+                framebuffer.read(out=slots[slot])
+                results.put((FRAME, worker, start + i, slot, timer() - t, generation))
+        renderer.delete()
+        context.destroy()
+    except Exception:
+        results.put((ERROR, worker, None, traceback.format_exc(), None, None))
+
+class RenderFarm(object):
+    '''
+    Renders views of the example scene on a pool of worker processes. Every
+    worker creates its own headless context (see headless.py) with the
+    framebuffer, programs and buffers once, and reuses them for all the views
+    it renders. The views are sharded into chunks of chunksize onto a task
+    queue the workers take from, so a slow worker doesn't hold up the others.
+
+    The frames come back through shared memory: every worker owns slots
+    frames of width*height*3 bytes in one shared array and reads the
+    framebuffer right into a free one. Only the index of the view and of
+    the slot go through the result queue. A slot is free again once the
+    consumer of render() took the next frame, so a worker that's too far
+    ahead waits instead of filling up memory. If the consumer stops early,
+    the views not rendered yet are cancelled, and the frames still on their
+    way are thrown away by the next render() or close().
+
+    The workers are forked in the constructor, so it must be called before
+    a context exists in this process (OpenGL may be imported, with the same
+    backend). mesh is a meshio.Mesh every worker draws instead of the cube.
+    '''
+    def __init__(self, width, height, workers=None, backend="egl", instances=0, mesh=None,
+                 cache=".shadercache", chunksize=16, slots=2):
+        headless.useBackend(backend)
+        self.width = width
+        self.height = height
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.size = width * height * 3
+        # Unsynchronized, every slot has one writer and one reader at a time.
+        self.frames = multiprocessing.RawArray("B", self.size * slots * self.workers)
+        self.slots = np.frombuffer(self.frames, dtype=np.uint8).reshape(-1, height, width, 3)
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.released = [multiprocessing.Queue() for i in range(self.workers)]
+        # The generation of the running render(), the workers skip the views of any other.
+        self.generation = 0
+        self.current = multiprocessing.RawValue("i", 0)
+        options = {"backend" : backend, "instances" : instances, "mesh" : mesh, "cache" : cache}
+        self.processes = []
+        for worker in range(self.workers):
+            for slot in range(worker * slots, (worker + 1) * slots):
+                self.released[worker].put(slot)
+            process = multiprocessing.Process(target=_work, name="renderfarm-%d" % worker,
+                                              args=(worker, width, height, options, self.frames,
+                                                    self.tasks, self.results, self.released[worker],
+                                                    self.current))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+        self.renderers = [self._result(READY)[3] for process in self.processes]
+        # Stats
+        self.rendered = 0
+        self.rendertime = 0.0
+        self.walltime = 0.0
+        self.perworker = [0] * self.workers
+
+    def _result(self, kind):
+        '''
+        The next message from the workers, raises if one of them failed or
+        died. Frames of cancelled generations are thrown away on the way.
+        '''
+        while True:
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [p.name for p in self.processes if not p.is_alive()]
+                if dead:
+                    raise RuntimeError("Render worker %s died." % ", ".join(dead))
+                continue
+            if message[0] == ERROR:
+                raise RuntimeError("Render worker %d failed:\n%s" % (message[1], message[3]))
+            if message[0] == FRAME and message[5] != self.generation:
+                self.released[message[1]].put(message[3])
+                continue
+            if message[0] != kind:
+                raise RuntimeError("Unexpected %s message from render worker %d." % (message[0], message[1]))
+            return message
+
+    def render(self, views):
+        '''
+        Renders views, an (N,3) array of camera positions or (N,4) with the
+        rotation of the scene in degrees as fourth column, and yields
+        (index, pixels) in the order the frames get done. pixels is a
+        (height,width,3) uint8 view of the shared memory, top row first, and
+        only valid until the next frame is taken; copy it to keep it.
+        '''
+        views = np.asarray(views, dtype=np.float32)
+        if views.shape[1] == 3:
+            views = np.column_stack([views, np.zeros(len(views), dtype=np.float32)])
+        t = timeit.default_timer()
+        self.generation += 1
+        self.current.value = self.generation
+        for start in range(0, len(views), self.chunksize):
+            self.tasks.put((self.generation, start, views[start:start + self.chunksize]))
+        done = 0
+        try:
+            while done < len(views):
+                kind, worker, index, slot, seconds, generation = self._result(FRAME)
+                done += 1
+                self.rendered += 1
+                self.rendertime += seconds
+                self.perworker[worker] += 1
+                try:
+                    yield index, self.slots[slot][::-1]
+                finally:
+                    self.released[worker].put(slot)
+        finally:
+            if done < len(views):
+                # Stopped early (or failed), the workers skip what's left.
+                self.current.value = -1
+            self.walltime += timeit.default_timer() - t
+
+    def close(self, timeout=5.0):
+        '''
+        Stops the workers, cancelling any views still queued. Workers that
+        haven't exited after timeout seconds are terminated.
+        '''
+        self.current.value = -1
+        for process in self.processes:
+            self.tasks.put(None)
+        # Frames still on the way have to be taken, to free the slots the workers may wait for.
+        deadline = timeit.default_timer() + timeout
+        while any(p.is_alive() for p in self.processes) and timeit.default_timer() < deadline:
+            try:
+                message = self.results.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if message[0] == FRAME:
+                self.released[message[1]].put(message[3])
+        for process in self.processes:
+            process.join(max(deadline - timeit.default_timer(), 0))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    def stats(self):
+        '''Views rendered, views per second, the mean render time per view in ms and the busy fraction of the workers.'''
+        return {"rendered" : self.rendered,
+                "workers"  : self.workers,
+                "rate"     : self.rendered / self.walltime if self.walltime else 0.0,
+                "mean"     : self.rendertime / self.rendered * 1000 if self.rendered else 0.0,
+                "busy"     : self.rendertime / (self.walltime * self.workers) if self.walltime else 0.0,
+                "perworker": self.perworker}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the example from many camera positions on a pool of processes.")
+    parser.add_argument("--backend", choices=headless.BACKENDS, default="egl")
+    parser.add_argument("--size", default="400x300", help="framebuffer size, WIDTHxHEIGHT")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 for one per CPU core")
+    parser.add_argument("--views", type=int, default=360, help="number of views on an orbit around the scene")
+    parser.add_argument("--cameras", metavar="FILE",
+                        help="render the views in this text file instead, one 'x y z [rotation]' per line")
+    parser.add_argument("--chunk", type=int, default=16, help="views per task of a worker")
+    parser.add_argument("--instances", type=int, default=0,
+                        help="draw a grid of this many cubes with instanced rendering")
+    parser.add_argument("--mesh", metavar="FILE", help="draw this OBJ/PLY mesh instead of the cube")
+    parser.add_argument("--shader-cache", default=".shadercache", metavar="DIR",
+                        help="directory for cached program binaries, empty to disable")
+    parser.add_argument("--output", metavar="FILE", help="write the views, e.g. views/%%05d.png or views/%%05d.ppm")
+    args = parser.parse_args()
+    width, height = [int(v) for v in args.size.split("x")]
+
+    import meshio
+    mesh = meshio.loadMesh(args.mesh) if args.mesh else None
+    views = np.loadtxt(args.cameras, ndmin=2) if args.cameras else orbit(args.views)
+    farm = RenderFarm(width, height, args.workers, args.backend, args.instances, mesh,
+                      args.shader_cache, args.chunk)
+    print "%d workers on %s" % (farm.workers, farm.renderers[0])
+    if args.output:
+        # The worker processes exist by now, so importing OpenGL (by capture) is fine.
+        import capture
+        directory = os.path.dirname(args.output % 0)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        write = capture.writePNG if args.output.lower().endswith(".png") else capture.writePPM
+    for index, pixels in farm.render(views):
+        if args.output:
+            # The capture writers take the rows bottom up, like glReadPixels returns them.
+            write(args.output % index, pixels[::-1])
+    farm.close()
+    stats = farm.stats()
+    print "%d views at %dx%d: %.1f views/s, %.3f ms per view, workers busy %.0f%%" % (
+        stats["rendered"], width, height, stats["rate"], stats["mean"], stats["busy"] * 100)
+    print "views per worker: %s" % " ".join(str(n) for n in stats["perworker"])
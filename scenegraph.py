@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Scenegraph - a node hierarchy in flat arrays with incremental transforms.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import numpy as np
+import quat
+
+def _gather(starts, counts):
+    '''The concatenated ranges starts[i]:starts[i]+counts[i], without a Python loop.'''
+    total = counts.sum()
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    idx = np.arange(total) - np.repeat(ends - counts, counts)
+    return idx + np.repeat(starts, counts)
+
+class SceneGraph(object):
+    '''
+    A hierarchy of nodes, each a row in a set of contiguous arrays: the
+    parent index (-1 for roots), the depth level, the local translation,
+    rotation (a quaternion, see quat.py) and scale, the world matrix and a
+    dirty flag.
+
+    Changing a node (through the set* methods, or by writing the arrays and
+    calling touch()) only flags it. update() then collects the flagged
+    nodes and their subtrees, and computes their world matrices level by
+    level, one batched matrix product per level: parent world times the
+    local translation * rotation * scale, built for the whole level at once
+    like the batched hommat functions do. So
+    an update costs in proportion to the changed subtrees, not to the size
+    of the graph.
+
+    A parent has to be added before its children. The arrays grow by
+    doubling; the children of every node are kept as one sorted index
+    array, which is only rebuilt on the first update() after adding nodes.
+    '''
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self._parent = np.empty(capacity, dtype=np.int32)
+        self._level = np.empty(capacity, dtype=np.int32)
+        self._translation = np.empty((capacity, 3), dtype=np.float32)
+        self._rotation = np.empty((capacity, 4), dtype=np.float32)
+        self._scale = np.empty((capacity, 3), dtype=np.float32)
+        self._world = np.empty((capacity, 4, 4), dtype=np.float32)
+        self._dirty = np.zeros(capacity, dtype=bool)
+        self.marked = [] # Arrays of touched nodes since the last update.
+        self.children = None
+        self.childstart = None
+        self.childcount = None
+        # Stats
+        self.updated = 0 # World matrices computed by the last update().
+        self.levels = 0  # Levels it went through.
+
+    # The arrays cut to the nodes in use. Writes to them need a touch().
+    parent = property(lambda self: self._parent[:self.count])
+    level = property(lambda self: self._level[:self.count])
+    translation = property(lambda self: self._translation[:self.count])
+    rotation = property(lambda self: self._rotation[:self.count])
+    scale = property(lambda self: self._scale[:self.count])
+    world = property(lambda self: self._world[:self.count])
+    dirty = property(lambda self: self._dirty[:self.count])
+
+    def _grow(self, count):
+        capacity = len(self._parent)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name in ("_parent", "_level", "_translation", "_rotation", "_scale", "_world", "_dirty"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, parent=-1, translation=(0, 0, 0), rotation=(0, 0, 0, 1), scale=(1, 1, 1)):
+        '''Adds a node below parent (-1 for a root) and returns its index.'''
+        return int(self.addMany([parent], [translation], [rotation], [scale])[0])
+
+    def addMany(self, parents, translations=None, rotations=None, scales=None):
+        '''
+        Adds len(parents) nodes and returns their indices. parents may refer
+        to nodes of the same call, as long as they come first. The transforms
+        are (N,3), (N,4) and (N,3) arrays, or None for the identity.
+        '''
+        parents = np.asarray(parents, dtype=np.int32)
+        n = len(parents)
+        first = self.count
+        nodes = np.arange(first, first + n)
+        if np.any(parents >= nodes):
+            raise ValueError("A parent has to be added before its children.")
+        self._grow(first + n)
+        self._parent[nodes] = parents
+        # Parents within the call need their level first, one round per level.
+        levels = self._level[first:first + n]
+        levels[:] = -1
+        levels[parents < 0] = 0
+        outside = (parents >= 0) & (parents < first)
+        levels[outside] = self._level[parents[outside]] + 1
+        pending = np.flatnonzero(levels < 0)
+        while len(pending):
+            known = levels[parents[pending] - first] >= 0
+            levels[pending[known]] = levels[parents[pending[known]] - first] + 1
+            pending = pending[~known]
+        self._translation[nodes] = 0 if translations is None else translations
+        self._rotation[nodes] = quat.identity() if rotations is None else rotations
+        self._scale[nodes] = 1 if scales is None else scales
+        self.count += n
+        self.children = None
+        self.touch(nodes)
+        return nodes
+
+    def touch(self, nodes):
+        '''Flags nodes (an index or an array of them), their subtrees are recomputed by the next update().'''
+        nodes = np.atleast_1d(np.asarray(nodes, dtype=np.int64))
+        self._dirty[nodes] = True
+        self.marked.append(nodes)
+
+    def setTranslation(self, nodes, translations):
+        self._translation[nodes] = translations
+        self.touch(nodes)
+
+    def setRotation(self, nodes, rotations):
+        self._rotation[nodes] = rotations
+        self.touch(nodes)
+
+    def setScale(self, nodes, scales):
+        self._scale[nodes] = scales
+        self.touch(nodes)
+
+    def _link(self):
+        '''Sorts the nodes by parent, so the children of a node are one range of self.children.'''
+        parent = self.parent
+        self.children = np.argsort(parent, kind="mergesort")
+        # Roots (-1) sort first, the counts of the real parents follow them.
+        self.childcount = np.bincount(parent + 1, minlength=self.count + 1)[1:]
+        self.childstart = np.cumsum(self.childcount) - self.childcount + np.count_nonzero(parent < 0)
+
+    def update(self):
+        '''Recomputes the world matrices of the flagged nodes and everything below them.'''
+        if not self.marked:
+            self.updated = self.levels = 0
+            return
+        if self.children is None:
+            self._link()
+        # Flag the subtrees, one level of children per round. Children
+        # flagged already were marked themselves and are expanded anyway.
+        frontier = np.unique(np.concatenate(self.marked))
+        self.marked = []
+        collected = [frontier]
+        while len(frontier):
+            below = self.children[_gather(self.childstart[frontier], self.childcount[frontier])]
+            frontier = below[~self._dirty[below]]
+            self._dirty[frontier] = True
+            collected.append(frontier)
+        nodes = np.concatenate(collected)
+        levels = self._level[nodes]
+        order = np.argsort(levels, kind="mergesort")
+        nodes, levels = nodes[order], levels[order]
+        bounds = np.flatnonzero(np.diff(levels)) + 1
+        groups = np.split(nodes, bounds)
+        for group in groups:
+            local = quat.matrices(self._rotation[group])
+            local[:, :3, :3] *= self._scale[group][:, None, :]
+            local[:, :3, 3] = self._translation[group]
+            parents = self._parent[group]
+            if parents[0] < 0:
+                # Level 0 is the roots only.
+                self._world[group] = local
+            else:
+                self._world[group] = np.matmul(self._world[parents], local)
+        self._dirty[nodes] = False
+        self.updated = len(nodes)
+        self.levels = len(groups)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Scheduler - frame pacing with a fixed simulation timestep.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import time
+
+class Scheduler(object):
+    '''
+    Runs a fixed timestep simulation decoupled from rendering. Every tick()
+    calls update(dt) as often as the elapsed time asks for (at most maxsteps
+    times), then render(alpha) once, where alpha in [0,1) tells how far the
+    real time is between the last two simulation steps, for interpolating.
+
+    With a target fps, tick() then sleeps until the frame is due: sleep()
+    for all but slack seconds, and yield()s for the rest. clock and sleep
+    would be glfwGetTime and glfwSleep in a GLFW application, swapinterval
+    (glfwSwapInterval) is used to set up vsync.
+
+    Metrics: frames, steps, late (frames that took longer than the
+    interval), dropped (intervals missed entirely) and skipped (simulation
+    steps thrown away to catch up after long stalls). The interval is the
+    target one, or with only vsync the refresh period of the display
+    (refresh in Hz), measured from one render() (which swaps) to the next.
+    Without either there's no interval, late and dropped stay 0 and the
+    period in stats() is None.
+    '''
+    def __init__(self, update, render, dt=1.0 / 60, targetfps=None, vsync=True,
+                 clock=time.time, sleep=time.sleep, swapinterval=None,
+                 maxsteps=5, slack=0.002, yield_=lambda: time.sleep(0), refresh=60.0):
+        self.update = update
+        self.render = render
+        self.dt = dt
+        self.interval = 1.0 / targetfps if targetfps else None
+        # With vsync (a swap interval of 1), a frame is due every refresh.
+        self.period = self.interval or (1.0 / refresh if vsync and refresh else None)
+        self.clock = clock
+        self.sleep = sleep
+        self.yield_ = yield_
+        self.maxsteps = maxsteps
+        self.slack = slack
+        self.frames = 0
+        self.steps = 0
+        self.late = 0
+        self.dropped = 0
+        self.skipped = 0
+        if swapinterval is not None:
+            swapinterval(1 if vsync else 0)
+        self.accumulator = 0.0
+        self.last = clock()
+        self.deadline = self.last
+        self.swapped = None
+
+    def tick(self):
+        '''Runs the simulation steps and renders one frame, then waits for the next one.'''
+        now = self.clock()
+        self.accumulator += now - self.last
+        self.last = now
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.maxsteps:
+            self.update(self.dt)
+            self.accumulator -= self.dt
+            steps += 1
+        if self.accumulator >= self.dt:
+            # Too far behind (e.g. after a stall), drop the time instead of spiraling.
+            skipped = int(self.accumulator / self.dt)
+            self.skipped += skipped
+            self.accumulator -= skipped * self.dt
+        self.steps += steps
+        self.render(self.accumulator / self.dt)
+        self.frames += 1
+        if self.interval is not None:
+            self.pace()
+        elif self.period is not None:
+            self.measure()
+
+    def pace(self):
+        '''Waits until the next frame is due, and accounts for late frames.'''
+        self.deadline += self.interval
+        now = self.clock()
+        if now > self.deadline:
+            self.late += 1
+            missed = int((now - self.deadline) / self.interval)
+            self.dropped += missed
+            # Restart the schedule from now, rather than rushing to catch up.
+            self.deadline = now
+            return
+        remaining = self.deadline - now
+        if remaining > self.slack:
+            self.sleep(remaining - self.slack)
+        while self.clock() < self.deadline:
+            self.yield_()
+
+    def measure(self):
+        '''Accounts for late frames against the refresh period, when vsync does the pacing.'''
+        now = self.clock()
+        if self.swapped is not None:
+            # Swaps land on refreshes, so the time between them is a whole number of periods.
+            missed = int(round((now - self.swapped) / self.period)) - 1
+            if missed > 0:
+                self.late += 1
+                self.dropped += missed
+        self.swapped = now
+
+    def stats(self):
+        return {"frames" : self.frames, "steps" : self.steps, "late" : self.late,
+                "dropped" : self.dropped, "skipped" : self.skipped, "period" : self.period}
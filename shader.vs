@@ -1,6 +1,9 @@
 #version 150
 
-uniform mat4 mvp;
+// Per object data, from a uniform buffer (see uniformblock.py), bound to render.OBJECT_BINDING.
+layout(std140, row_major) uniform Object {
+  mat4 mvp;
+};
 
 in vec4 vs_position;
 in vec4 vs_color;
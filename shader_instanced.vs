@@ -0,0 +1,17 @@
+#version 150
+
+// Per frame data, from a uniform buffer (see uniformblock.py), bound to render.FRAME_BINDING.
+layout(std140, row_major) uniform Frame {
+  mat4 viewprojection;
+};
+
+in vec4 vs_position;
+in vec4 vs_color;
+in mat4 vs_model;
+in vec4 vs_instcolor;
+out vec4 fs_color;
+
+void main() {
+  fs_color = vs_color * vs_instcolor;
+  gl_Position = viewprojection * vs_model * vs_position;
+}
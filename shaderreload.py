@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Shaderreload - recompiling programs when their shader files change.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import os
+import sys
+import time
+import numpy as np
+import shaderutil
+from OpenGL.GL import *
+from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR, GL_COMPLETION_STATUS_KHR
+
+class _Watch(object):
+    '''A program built from two shader files, and who to tell about a new one.'''
+    def __init__(self, fnvert, fnfrag, defines, callback, program):
+        self.files = (fnvert, fnfrag)
+        self.defines = defines
+        self.callback = callback
+        self.program = program
+        self.build = None
+
+class _Build(object):
+    '''A program being compiled and linked, with its shaders and its ProgramCache key.'''
+    def __init__(self, prog, shaders, key):
+        self.prog = prog
+        self.shaders = shaders
+        self.key = key
+
+class ShaderWatcher(object):
+    '''
+    Watches the shader files of programs, and rebuilds the programs using a
+    file when it changes. poll() is called once per frame: every interval
+    seconds it compares the modification times of the files, and it checks
+    the programs being rebuilt. With GL_KHR_parallel_shader_compile, the
+    driver compiles and links them on its own threads and poll() only asks
+    for GL_COMPLETION_STATUS_KHR, without ever waiting. Else the build
+    finishes in the poll it was started in.
+
+    The old program stays in use until the new one is linked. Then it's
+    swapped in all at once by calling the callback with the new Program,
+    in between two frames, and the old program is deleted. A program which
+    fails to compile or link is only reported, the old one stays.
+    Attribute locations are bound to those of the old program, so the
+    vertex arrays set up for it keep working.
+    '''
+    def __init__(self, interval=0.5, cache=None, clock=time.time):
+        self.interval = interval
+        self.cache = cache if cache is not None and cache.supported() else None
+        self.clock = clock
+        self.watches = []
+        self.mtimes = {}
+        self.next = 0.0
+        self.reloads = 0
+        self.failures = 0
+        self.parallel = bool(glMaxShaderCompilerThreadsKHR)
+        # PyOpenGL doesn't know the size of GL_COMPLETION_STATUS_KHR, so the result goes into this.
+        self._status = np.zeros(1, dtype=np.int32)
+        if self.parallel:
+            # Let the driver choose how many threads to use.
+            glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+
+    def _mtime(self, filename):
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    def watch(self, fnvert, fnfrag, callback, program, defines=None):
+        '''Rebuilds program from the shader files, with the defines, whenever one changes.'''
+        watch = _Watch(fnvert, fnfrag, defines, callback, program)
+        for filename in watch.files:
+            if filename not in self.mtimes:
+                self.mtimes[filename] = self._mtime(filename)
+        self.watches.append(watch)
+        return watch
+
+    def unwatch(self, watch):
+        if watch.build is not None:
+            self._delete(watch.build)
+            watch.build = None
+        self.watches.remove(watch)
+
+    def poll(self):
+        '''Checks the files (every interval seconds) and the running builds. Returns the number of programs swapped.'''
+        now = self.clock()
+        if now >= self.next:
+            self.next = now + self.interval
+            changed = set()
+            for filename, mtime in self.mtimes.items():
+                current = self._mtime(filename)
+                # A file which is missing for a moment (some editors save that way) is checked again next time.
+                if current is not None and current != mtime:
+                    self.mtimes[filename] = current
+                    changed.add(filename)
+            for watch in self.watches:
+                if changed.intersection(watch.files):
+                    self._start(watch)
+        swapped = 0
+        for watch in self.watches:
+            build = watch.build
+            if build is None:
+                continue
+            if self.parallel:
+                glGetProgramiv(build.prog, GL_COMPLETION_STATUS_KHR, self._status)
+                if not self._status[0]:
+                    continue
+            watch.build = None
+            swapped += self._finish(watch, build)
+        return swapped
+
+    def _start(self, watch):
+        '''Issues the compiles and the link of a new program, without checking their status.'''
+        try:
+            sources = [shaderutil.readSource(filename, watch.defines) for filename in watch.files]
+        except IOError as e:
+            sys.stderr.write("Unable to read shader: %s\n" % e)
+            return
+        if watch.build is not None:
+            # Superseded by the newer sources.
+            self._delete(watch.build)
+        prog = glCreateProgram()
+        shaders = []
+        for source, shadertype in zip(sources, (GL_VERTEX_SHADER, GL_FRAGMENT_SHADER)):
+            shader = glCreateShader(shadertype)
+            glShaderSource(shader, source)
+            glCompileShader(shader)
+            glAttachShader(prog, shader)
+            shaders.append(shader)
+        for name, attribute in watch.program.attributes.items():
+            glBindAttribLocation(prog, attribute.location, name)
+        if self.cache is not None:
+            glProgramParameteri(prog, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(prog)
+        watch.build = _Build(prog, shaders, self.cache.key(*sources) if self.cache is not None else None)
+
+    def _finish(self, watch, build):
+        if glGetProgramiv(build.prog, GL_LINK_STATUS) != GL_TRUE:
+            logs = [glGetShaderInfoLog(shader) for shader in build.shaders]
+            logs.append(glGetProgramInfoLog(build.prog))
+            sys.stderr.write("Unable to rebuild the program of %s:\n%s\n" %
+                             (", ".join(watch.files), "\n".join(log.decode() if isinstance(log, bytes) else log
+                                                                for log in logs if log)))
+            self._delete(build)
+            self.failures += 1
+            return 0
+        for shader in build.shaders:
+            glDetachShader(build.prog, shader)
+            glDeleteShader(shader)
+        if self.cache is not None:
+            self.cache.store(build.key, build.prog)
+        old, watch.program = watch.program, shaderutil.Program(build.prog)
+        watch.callback(watch.program)
+        glDeleteProgram(old)
+        self.reloads += 1
+        return 1
+
+    def _delete(self, build):
+        for shader in build.shaders:
+            glDeleteShader(shader)
+        glDeleteProgram(build.prog)
+
+    def stats(self):
+        return {"reloads" : self.reloads, "failures" : self.failures,
+                "building" : sum(1 for watch in self.watches if watch.build is not None)}
@@ -31,42 +31,284 @@
 #  For more information, please refer to <http://unlicense.org/>
 #
 ##############################################################################
+import os
+import hashlib
+import numpy as np
 from OpenGL.GL import *
+from OpenGL.error import GLError
 
-def loadShader(filename, shadertype):
+def compileShader(source, shadertype):
     '''
-    Creates, loads and compiles a shader by filename.
+    Creates and compiles a shader from source.
     '''
     shader = None
     try:
-        with open(filename) as f:
-            shader = glCreateShader(shadertype)
-            glShaderSource(shader, f.readlines())
-            glCompileShader(shader)
-            if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
-                info = glGetShaderInfoLog(shader)
-                raise Exception, "Unable to compile shader. Infolog:\n%s" % (info,)
-            return shader
+        shader = glCreateShader(shadertype)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+            info = glGetShaderInfoLog(shader)
+            raise Exception, "Unable to compile shader. Infolog:\n%s" % (info,)
+        return shader
     except Exception as e:
         if shader != None:
             glDeleteShader(shader)
         raise
 
-def createProgram(fnvert, fnfrag):
+def loadShader(filename, shadertype):
+    '''
+    Creates, loads and compiles a shader by filename.
+    '''
+    with open(filename) as f:
+        return compileShader(f.read(), shadertype)
+
+def readSource(filename, defines=None):
+    '''
+    Reads a shader source, and inserts "#define name value" lines for the
+    given dict of defines right after the #version line.
+    '''
+    with open(filename) as f:
+        source = f.read()
+    if defines:
+        lines = ["#define %s %s" % (name, defines[name]) for name in sorted(defines)]
+        head, sep, tail = source.partition("\n")
+        if head.startswith("#version"):
+            source = "\n".join([head] + lines) + sep + tail
+        else:
+            source = "\n".join(lines + [source])
+    return source
+
+class ProgramCache(object):
+    '''
+    An on disk cache of linked program binaries (glGetProgramBinary). Entries
+    are keyed by the hash of the shader sources, defines and the GL vendor,
+    renderer and version strings, so a driver update simply misses. The
+    counters tell how well the cache works.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.driver = None
+
+    def supported(self):
+        '''Program binaries need GL 4.1 or ARB_get_program_binary, and at least one format.'''
+        return bool(glProgramBinary) and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+    def key(self, *sources):
+        if self.driver is None:
+            self.driver = "\0".join(str(glGetString(prop)) for prop in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+        h = hashlib.sha1(self.driver.encode("utf-8"))
+        for source in sources:
+            h.update(b"\0")
+            h.update(source.encode("utf-8"))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def load(self, key):
+        '''
+        Creates a program from a cached binary. Returns None on a miss, or if
+        the entry is truncated or the driver rejects the binary (either one is
+        then removed from the cache), so the program gets compiled instead.
+        '''
+        try:
+            with open(self.path(key), "rb") as f:
+                data = np.fromfile(f, dtype=np.uint8)
+        except IOError:
+            self.misses += 1
+            return None
+        if len(data) <= 4:
+            return self._reject(key)
+        fmt = int(data[:4].view(np.uint32)[0])
+        binary = data[4:]
+        prog = glCreateProgram()
+        try:
+            # An unsupported format is a GL_INVALID_ENUM, not a failed link.
+            glProgramBinary(prog, fmt, binary, len(binary))
+            linked = glGetProgramiv(prog, GL_LINK_STATUS) == GL_TRUE
+        except GLError:
+            linked = False
+        if not linked:
+            return self._reject(key, prog)
+        self.hits += 1
+        return prog
+
+    def _reject(self, key, prog=None):
+        '''Drops an unusable entry (and the program created for it), counted as a miss.'''
+        if prog is not None:
+            glDeleteProgram(prog)
+        self.rejected += 1
+        self.misses += 1
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+        return None
+
+    def store(self, key, prog):
+        '''Writes the binary of a linked program to the cache.'''
+        length = glGetProgramiv(prog, GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return
+        binary = np.empty(length, dtype=np.uint8)
+        fmt = np.zeros(1, dtype=np.uint32)
+        written = np.zeros(1, dtype=np.int32)
+        glGetProgramBinary(prog, length, written, fmt, binary)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # Write to a temporary file first, so a crash never leaves a truncated entry.
+        tmp = self.path(key) + ".%d.tmp" % os.getpid()
+        with open(tmp, "wb") as f:
+            f.write(fmt.tobytes())
+            f.write(binary[:written[0]].tobytes())
+        os.rename(tmp, self.path(key))
+
+# Upload function, element type and number of elements per item for the
+# uniform types. Matrices are uploaded transposed, like hommat needs it.
+_uniformsetters = {
+    GL_FLOAT        : (glUniform1fv, np.float32, 1),
+    GL_FLOAT_VEC2   : (glUniform2fv, np.float32, 2),
+    GL_FLOAT_VEC3   : (glUniform3fv, np.float32, 3),
+    GL_FLOAT_VEC4   : (glUniform4fv, np.float32, 4),
+    GL_INT          : (glUniform1iv, np.int32, 1),
+    GL_INT_VEC2     : (glUniform2iv, np.int32, 2),
+    GL_INT_VEC3     : (glUniform3iv, np.int32, 3),
+    GL_INT_VEC4     : (glUniform4iv, np.int32, 4),
+    GL_BOOL         : (glUniform1iv, np.int32, 1),
+    GL_BOOL_VEC2    : (glUniform2iv, np.int32, 2),
+    GL_BOOL_VEC3    : (glUniform3iv, np.int32, 3),
+    GL_BOOL_VEC4    : (glUniform4iv, np.int32, 4),
+    GL_FLOAT_MAT2   : (lambda loc, n, v: glUniformMatrix2fv(loc, n, GL_TRUE, v), np.float32, 4),
+    GL_FLOAT_MAT3   : (lambda loc, n, v: glUniformMatrix3fv(loc, n, GL_TRUE, v), np.float32, 9),
+    GL_FLOAT_MAT4   : (lambda loc, n, v: glUniformMatrix4fv(loc, n, GL_TRUE, v), np.float32, 16),
+    GL_SAMPLER_1D   : (glUniform1iv, np.int32, 1),
+    GL_SAMPLER_2D   : (glUniform1iv, np.int32, 1),
+    GL_SAMPLER_3D   : (glUniform1iv, np.int32, 1),
+    GL_SAMPLER_CUBE : (glUniform1iv, np.int32, 1),
+}
+
+def _str(name):
+    '''Newer PyOpenGL versions return the names of active variables as bytes.'''
+    if not isinstance(name, str):
+        name = name.decode("utf-8")
+    # Arrays are reported as "name[0]".
+    if name.endswith("[0]"):
+        name = name[:-3]
+    return name
+
+class Uniform(object):
+    '''
+    An active uniform of a program, with its location, type and (array) size.
+    set() uploads a value, but skips the upload if the value did not change
+    since the last set(). The program has to be in use when calling set().
+    '''
+    def __init__(self, name, location, type, size):
+        self.name = name
+        self.location = location
+        self.type = type
+        self.size = size
+        self.value = None
+        self._setter, self._dtype, self._items = _uniformsetters.get(type, (None, None, None))
+
+    def set(self, value):
+        '''Sets the uniform. Returns whether anything was uploaded.'''
+        if self._setter is None:
+            raise Exception, "Uniform %s has an unsupported type 0x%x" % (self.name, self.type)
+        value = np.asarray(value, dtype=self._dtype)
+        if self.value is not None and np.array_equal(self.value, value):
+            return False
+        self._setter(self.location, value.size // self._items, value)
+        if self.value is None or self.value.shape != value.shape:
+            self.value = value.copy()
+        else:
+            np.copyto(self.value, value)
+        return True
+
+class Attribute(object):
+    '''An active attribute of a program, with its location, type and size.'''
+    def __init__(self, name, location, type, size):
+        self.name = name
+        self.location = location
+        self.type = type
+        self.size = size
+
+class Program(int):
+    '''
+    A linked program. It is still the plain GL program name, so it can be used
+    with any GL function, but it also enumerates the active uniforms and
+    attributes once, and keeps them in the uniforms/attributes dicts.
+    '''
+    def __init__(self, prog):
+        int.__init__(self)
+        self.uniforms = {}
+        self.attributes = {}
+        for i in range(glGetProgramiv(self, GL_ACTIVE_UNIFORMS)):
+            name, size, type = glGetActiveUniform(self, i)
+            name = _str(name)
+            self.uniforms[name] = Uniform(name, glGetUniformLocation(self, name), type, size)
+        for i in range(glGetProgramiv(self, GL_ACTIVE_ATTRIBUTES)):
+            name, size, type = glGetActiveAttrib(self, i)
+            name = _str(name)
+            self.attributes[name] = Attribute(name, glGetAttribLocation(self, name), type, size)
+
+    def uniform(self, name):
+        '''The location of a uniform, -1 if it is not active.'''
+        u = self.uniforms.get(name)
+        return u.location if u is not None else -1
+
+    def attribute(self, name):
+        '''The location of an attribute, -1 if it is not active.'''
+        a = self.attributes.get(name)
+        return a.location if a is not None else -1
+
+    def set(self, name, value):
+        '''Sets a uniform by name, see Uniform.set.'''
+        return self.uniforms[name].set(value)
+
+    def bindBlock(self, name, binding):
+        '''Assigns a uniform block to a binding point. Returns False if the block is not active.'''
+        index = glGetUniformBlockIndex(self, name)
+        if index == GL_INVALID_INDEX:
+            return False
+        glUniformBlockBinding(self, index, binding)
+        return True
+
+def createProgram(fnvert, fnfrag, defines=None, cache=None):
     '''
     Creates, loads, compiles and links a program using two shaderfiles.
+    If a ProgramCache is given, the linked program is loaded from/stored to it.
+    Returns a Program.
+    '''
+    return linkProgram(readSource(fnvert, defines), readSource(fnfrag, defines), cache)
+
+def linkProgram(vertsrc, fragsrc, cache=None):
     '''
+    Compiles and links a program from the vertex and fragment shader sources,
+    like createProgram, without reading any files (except a cached binary).
+    '''
+    if cache is not None and not cache.supported():
+        cache = None
+    if cache is not None:
+        key = cache.key(vertsrc, fragsrc)
+        prog = cache.load(key)
+        if prog is not None:
+            return Program(prog)
     prog = None
     vertsh = None
     fragsh = None
     try:
         prog = glCreateProgram()
     
-        vertsh = loadShader(fnvert, GL_VERTEX_SHADER)
-        fragsh = loadShader(fnfrag, GL_FRAGMENT_SHADER)
+        vertsh = compileShader(vertsrc, GL_VERTEX_SHADER)
+        fragsh = compileShader(fragsrc, GL_FRAGMENT_SHADER)
 
         glAttachShader(prog, vertsh)
         glAttachShader(prog, fragsh)
+        if cache is not None:
+            glProgramParameteri(prog, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
         glLinkProgram(prog)
         
         if glGetProgramiv(prog, GL_LINK_STATUS) != GL_TRUE:
@@ -78,8 +320,11 @@ def createProgram(fnvert, fnfrag):
         vertsh = None
         glDeleteShader(fragsh)
         fragsh = None
+
+        if cache is not None:
+            cache.store(key, prog)
         
-        return prog
+        return Program(prog)
     except Exception as e:
         if prog != None:
             glDeleteProgram(prog)
@@ -93,11 +338,52 @@ def getUniformLocations(prog, *names):
     '''
     Retrieves the locations for uniforms in a program.
     '''
+    if isinstance(prog, Program):
+        return [prog.uniform(name) for name in names]
     return [glGetUniformLocation(prog, name) for name in names]
         
 def getAttributeLocations(prog, *names):
     '''
     Retrieves the locations for attributes in a program.
     '''
+    if isinstance(prog, Program):
+        return [prog.attribute(name) for name in names]
     return [glGetAttribLocation(prog, name) for name in names]
-    
\ No newline at end of file
+    
+if __name__ == "__main__":
+    # Startup benchmark: time creating the example programs without the
+    # cache, with a cold cache and with a warm one.
+    import sys
+    import time
+    import shutil
+    import tempfile
+    from glfw import *
+    if not glfwInit():
+        print >> sys.stderr, "Unable to initialize GLFW."
+        sys.exit(-1)
+    glfwOpenWindowHint(GLFW_OPENGL_VERSION_MAJOR, 3)
+    glfwOpenWindowHint(GLFW_OPENGL_VERSION_MINOR, 2)
+    glfwOpenWindowHint(GLFW_OPENGL_PROFILE, GLFW_OPENGL_CORE_PROFILE)
+    glfwOpenWindowHint(GLFW_OPENGL_FORWARD_COMPAT, GL_TRUE)
+    if not glfwOpenWindow(64, 64, 0, 0, 0, 0, 32, 0, GLFW_WINDOW):
+        print >> sys.stderr, "Unable to open Window."
+        glfwTerminate()
+        sys.exit(-1)
+    programs = [("shader.vs", "shader.fs"), ("shader_instanced.vs", "shader.fs")]
+    # Different defines give different programs, like a project with dozens of them would have.
+    variants = [{"VARIANT": i} for i in range(16)]
+    directory = tempfile.mkdtemp()
+    cache = ProgramCache(directory)
+    try:
+        if not cache.supported():
+            print "Program binaries are not supported by this driver."
+        for name, c in [("no cache", None), ("cold cache", cache), ("warm cache", cache)]:
+            t = time.time()
+            for fnvert, fnfrag in programs:
+                for defines in variants:
+                    glDeleteProgram(createProgram(fnvert, fnfrag, defines, c))
+            print "%-10s %8.1f ms" % (name, (time.time() - t) * 1000)
+        print "hits: %d, misses: %d, rejected: %d" % (cache.hits, cache.misses, cache.rejected)
+    finally:
+        shutil.rmtree(directory)
+        glfwTerminate()
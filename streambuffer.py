@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Streambuffer - a ring buffer for streaming dynamic vertex data.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+
+PERSISTENT = "persistent"
+MAP = "map"
+ORPHAN = "orphan"
+
+class StreamBuffer(object):
+    '''
+    A large buffer for per frame (dynamic) data, split into one region per
+    frame in flight (triple buffered by default). Data of a frame is
+    sub-allocated from its region with write() or reserve(), and the region is
+    only reused once the fence set at the end of that frame has signaled.
+    The way data gets into the buffer is selected by mode:
+
+    - "persistent": glBufferStorage, mapped once persistently and coherently.
+      Writes go straight into the mapped memory, reserve() hands out numpy
+      views of it to compute data in place (needs GL 4.4/ARB_buffer_storage).
+    - "map": glMapBufferRange with GL_MAP_UNSYNCHRONIZED_BIT per write, the
+      fences do the synchronization.
+    - "orphan": glBufferSubData, orphaning the whole buffer with glBufferData
+      whenever the ring wraps around. No fences needed.
+
+    The default is persistent, if available, else map. Offsets returned are
+    in bytes from the start of the buffer, for glVertexAttribPointer etc.
+    beginFrame() and write() leave the buffer bound to its target.
+    '''
+    def __init__(self, size, target=GL_ARRAY_BUFFER, frames=3, mode=None, alignment=16):
+        if mode is None:
+            mode = PERSISTENT if bool(glBufferStorage) else MAP
+        self.mode = mode
+        self.target = target
+        self.frames = frames
+        self.alignment = alignment
+        self.regionsize = (size // frames) // alignment * alignment
+        self.size = self.regionsize * frames
+        self.buffer = glGenBuffers(1)
+        self.fences = [None] * frames
+        self.mapped = None
+        glBindBuffer(target, self.buffer)
+        if mode == PERSISTENT:
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+            glBufferStorage(target, self.size, None, flags)
+            self.mapped = self._view(glMapBufferRange(target, 0, self.size, flags), self.size)
+        else:
+            glBufferData(target, self.size, None, GL_STREAM_DRAW)
+        glBindBuffer(target, 0)
+        self.frame = -1
+        self.region = 0
+        self.offset = 0
+        # Statistics
+        self.uploaded = 0   # Bytes written in the current frame.
+        self.lastframe = 0  # Bytes written in the last finished frame.
+        self.total = 0
+        self.waits = 0      # Frames that had to wait for the GPU to release their region.
+
+    def _view(self, address, size):
+        return np.frombuffer((ctypes.c_ubyte * size).from_address(address), dtype=np.uint8)
+
+    def beginFrame(self):
+        '''Moves on to the next region, waiting for the GPU to be done with it if necessary.'''
+        self.frame += 1
+        self.region = self.frame % self.frames
+        self.offset = self.region * self.regionsize
+        self.uploaded = 0
+        fence = self.fences[self.region]
+        if fence is not None:
+            if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0) == GL_TIMEOUT_EXPIRED:
+                self.waits += 1
+                while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+                    pass
+            glDeleteSync(fence)
+            self.fences[self.region] = None
+        glBindBuffer(self.target, self.buffer)
+        if self.mode == ORPHAN and self.region == 0:
+            glBufferData(self.target, self.size, None, GL_STREAM_DRAW)
+
+    def endFrame(self):
+        '''Call after the draw calls using this frame's data were issued.'''
+        if self.mode != ORPHAN:
+            self.fences[self.region] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.lastframe = self.uploaded
+
+    def _allocate(self, nbytes):
+        end = (self.region + 1) * self.regionsize
+        if self.offset + nbytes > end:
+            raise ValueError("%d bytes exceed the %d bytes left in the frame's region" % (nbytes, end - self.offset))
+        offset = self.offset
+        self.offset += (nbytes + self.alignment - 1) // self.alignment * self.alignment
+        self.uploaded += nbytes
+        self.total += nbytes
+        return offset
+
+    def write(self, data):
+        '''Writes a numpy array into the current frame's region. Returns its offset.'''
+        data = np.ascontiguousarray(data)
+        offset = self._allocate(data.nbytes)
+        if self.mode == PERSISTENT:
+            self.mapped[offset:offset + data.nbytes] = data.reshape(-1).view(np.uint8)
+        elif self.mode == MAP:
+            glBindBuffer(self.target, self.buffer)
+            flags = GL_MAP_WRITE_BIT | GL_MAP_UNSYNCHRONIZED_BIT | GL_MAP_INVALIDATE_RANGE_BIT
+            address = glMapBufferRange(self.target, offset, data.nbytes, flags)
+            self._view(address, data.nbytes)[:] = data.reshape(-1).view(np.uint8)
+            glUnmapBuffer(self.target)
+        else:
+            glBindBuffer(self.target, self.buffer)
+            glBufferSubData(self.target, offset, data.nbytes, data)
+        return offset
+
+    def reserve(self, shape, dtype=np.float32):
+        '''
+        Allocates an array of the current frame directly in the mapped buffer
+        (persistent mode only). Returns its offset and the array to fill in.
+        '''
+        if self.mode != PERSISTENT:
+            raise ValueError("reserve() needs a persistently mapped buffer")
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        offset = self._allocate(nbytes)
+        return offset, self.mapped[offset:offset + nbytes].view(dtype).reshape(shape)
+
+    def delete(self):
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        self.fences = [None] * self.frames
+        if self.mapped is not None:
+            glBindBuffer(self.target, self.buffer)
+            glUnmapBuffer(self.target)
+            glBindBuffer(self.target, 0)
+            self.mapped = None
+        glDeleteBuffers(1, [self.buffer])
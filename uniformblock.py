@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+# 
+#  Uniformblock - std140 uniform buffers, filled straight from numpy.
+#
+#  This is free and unencumbered software released into the public domain.
+#  
+#  Anyone is free to copy, modify, publish, use, compile, sell, or
+#  distribute this software, either in source code form or as a compiled
+#  binary, for any purpose, commercial or non-commercial, and by any
+#  means.
+#  
+#  In jurisdictions that recognize copyright laws, the author or authors
+#  of this software dedicate any and all copyright interest in the
+#  software to the public domain. We make this dedication for the benefit
+#  of the public at large and to the detriment of our heirs and
+#  successors. We intend this dedication to be an overt act of
+#  relinquishment in perpetuity of all present and future rights to this
+#  software under copyright law.
+#  
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#  EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#  MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#  IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+#  OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+#  ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+#  OTHER DEALINGS IN THE SOFTWARE.
+#   
+#  For more information, please refer to <http://unlicense.org/>
+#
+##############################################################################
+import numpy as np
+from OpenGL.GL import *
+
+# GLSL type -> (numpy type, shape, std140 base alignment) of a single value.
+# Matrices are laid out like in a "layout(std140, row_major)" block: one row
+# after the other, each padded to a vec4. That's exactly how numpy (and
+# hommat) stores them, so they need no transposing.
+_std140 = {
+    "float" : (np.float32, (), 4),
+    "int"   : (np.int32, (), 4),
+    "uint"  : (np.uint32, (), 4),
+    "bool"  : (np.int32, (), 4),
+    "vec2"  : (np.float32, (2,), 8),
+    "vec3"  : (np.float32, (3,), 16),
+    "vec4"  : (np.float32, (4,), 16),
+    "ivec2" : (np.int32, (2,), 8),
+    "ivec3" : (np.int32, (3,), 16),
+    "ivec4" : (np.int32, (4,), 16),
+    "uvec2" : (np.uint32, (2,), 8),
+    "uvec3" : (np.uint32, (3,), 16),
+    "uvec4" : (np.uint32, (4,), 16),
+    "mat2"  : (np.float32, (2, 4), 16),
+    "mat3"  : (np.float32, (3, 4), 16),
+    "mat4"  : (np.float32, (4, 4), 16),
+}
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+def std140(declaration):
+    '''
+    Computes the std140 layout of a uniform block from a declaration, a list
+    of (name, type) or (name, type, arraysize) with GLSL type names, in the
+    order of the block. Returns a structured numpy dtype with the std140
+    offsets and size. Array elements are padded to a vec4 like in GLSL, so an
+    array of n floats, vec2s or vec3s is an (n, 4) field, of which only the
+    first 1, 2 or 3 columns are used. mat2 and mat3 are (2, 4) and (3, 4).
+    '''
+    names, formats, offsets = [], [], []
+    offset = 0
+    for field in declaration:
+        name, type = field[:2]
+        count = field[2] if len(field) > 2 else None
+        dtype, shape, alignment = _std140[type]
+        if count is not None:
+            alignment = 16
+            if len(shape) < 2:
+                shape = (count, 4)
+            else:
+                shape = (count,) + shape
+        offset = _align(offset, alignment)
+        names.append(name)
+        formats.append((dtype, shape) if shape else dtype)
+        offsets.append(offset)
+        offset += np.dtype((dtype, shape)).itemsize if shape else np.dtype(dtype).itemsize
+    return np.dtype({"names" : names, "formats" : formats, "offsets" : offsets, "itemsize" : _align(offset, 16)})
+
+class UniformBuffer(object):
+    '''
+    A uniform buffer holding count instances of a block, e.g. one per object.
+    data is a structured numpy array with one record per instance, written
+    directly (like data["mvp"][i] = m, or with an out= of hommat), and sent
+    with a single upload(). bind() selects one instance for a binding point
+    with glBindBufferRange. The records are spaced by the uniform buffer
+    offset alignment of the implementation, so every one can be bound.
+    '''
+    def __init__(self, declaration, count=1, usage=GL_DYNAMIC_DRAW):
+        block = std140(declaration)
+        self.size = block.itemsize
+        self.stride = _align(self.size, int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT)))
+        self.dtype = np.dtype({"names" : block.names, "formats" : [block.fields[n][0] for n in block.names],
+                               "offsets" : [block.fields[n][1] for n in block.names], "itemsize" : self.stride})
+        self.count = count
+        self.usage = usage
+        self.data = np.zeros(count, self.dtype)
+        self.buffer = int(glGenBuffers(1))
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, usage)
+
+    def upload(self, count=None):
+        '''Uploads the first count (default all) records. The old storage is orphaned, so this never waits for the GPU.'''
+        if count is None:
+            count = self.count
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, self.usage)
+        if count:
+            glBufferSubData(GL_UNIFORM_BUFFER, 0, count * self.stride, self.data[:count].view(np.uint8))
+
+    def range(self, index=0):
+        '''The (buffer, offset, size) of a record, for glBindBufferRange.'''
+        return self.buffer, index * self.stride, self.size
+
+    def bind(self, binding, index=0):
+        glBindBufferRange(GL_UNIFORM_BUFFER, binding, self.buffer, index * self.stride, self.size)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.buffer])